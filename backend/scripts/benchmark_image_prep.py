@@ -0,0 +1,153 @@
+"""Measures what image pre-processing saves on the vision analysis call.
+
+For each floor plan image in a fixture directory (or a synthetic set of
+skewed, noisy scans when none is given) reports the preparation time and
+the estimated image tokens and bytes before and after. With --live, both
+variants are also sent to the analysis model to measure real latency and
+prompt tokens.
+
+    python scripts/benchmark_image_prep.py
+    python scripts/benchmark_image_prep.py --fixtures ./plans --live
+"""
+import io
+import os
+import sys
+import time
+import base64
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.image_prep import prepare_for_analysis  # noqa: E402
+
+logger = logging.getLogger("benchmark_image_prep")
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff", ".bmp"}
+
+
+def synthetic_plan(path: str, seed: int, size=(4960, 3508), skew: float = 2.0):
+    """An A4-at-600dpi style scan: walls on a wide margin, rotated, with sensor noise."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    image = Image.new('L', size, 235)
+    draw = ImageDraw.Draw(image)
+    left, top = int(width * 0.2), int(height * 0.2)
+    right, bottom = int(width * 0.8), int(height * 0.8)
+    wall = max(8, width // 300)
+    draw.rectangle((left, top, right, bottom), outline=20, width=wall)
+    for _ in range(3):
+        x = int(rng.uniform(left + 0.2 * (right - left), right - 0.2 * (right - left)))
+        draw.line((x, top, x, bottom), fill=20, width=wall // 2)
+        y = int(rng.uniform(top + 0.2 * (bottom - top), bottom - 0.2 * (bottom - top)))
+        draw.line((left, y, x, y), fill=20, width=wall // 2)
+    image = image.rotate(skew, resample=Image.BICUBIC, fillcolor=235)
+    noisy = np.asarray(image, dtype=np.int16) + rng.normal(0, 12, (height, width)).astype(np.int16)
+    Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).convert('RGB').save(path, quality=90)
+
+
+def fixture_paths(fixtures: str, work_dir: str, count: int) -> list:
+    if fixtures:
+        return sorted(str(p) for p in Path(fixtures).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    paths = []
+    for index in range(count):
+        path = os.path.join(work_dir, f"synthetic-{index + 1}.jpg")
+        synthetic_plan(path, seed=index, skew=(index % 5) - 2.0 + 0.3)
+        paths.append(path)
+    return paths
+
+
+def data_url(data: bytes, mime: str) -> str:
+    return f"data:{mime};base64," + base64.b64encode(data).decode('ascii')
+
+
+def original_data_url(path: str) -> str:
+    with Image.open(path) as image:
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, format='JPEG', quality=90)
+    return data_url(buffer.getvalue(), 'image/jpeg')
+
+
+async def timed_analysis(image_url: str) -> tuple:
+    """(seconds, prompt tokens) for one analysis call with the server's prompts."""
+    import server
+    started = time.perf_counter()
+    response = await server.llm_gateway.chat_completion(
+        "openai",
+        model=server.ANALYSIS_MODEL,
+        messages=[
+            {"role": "system", "content": server.ANALYSIS_SYSTEM_PROMPT},
+            {"role": "user", "content": [
+                {"type": "text", "text": server.ANALYSIS_USER_PROMPT},
+                {"type": "image_url", "image_url": {"url": image_url}},
+            ]},
+        ],
+        max_tokens=1500,
+        temperature=0.3,
+    )
+    usage = getattr(response, "usage", None)
+    return time.perf_counter() - started, getattr(usage, "prompt_tokens", None)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="directory of floor plan images (default: synthetic scans)")
+    parser.add_argument("--count", type=int, default=5, help="synthetic plans to generate")
+    parser.add_argument("--live", action="store_true", help="also call the analysis model with both variants")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+    if args.live:
+        import server
+        await server.llm_gateway.start()
+
+    totals = {"original_tokens": 0, "tokens": 0, "original_bytes": 0, "bytes": 0, "seconds": 0.0}
+    with tempfile.TemporaryDirectory(prefix="prep_bench_") as work_dir:
+        paths = fixture_paths(args.fixtures, work_dir, args.count)
+        for path in paths:
+            started = time.perf_counter()
+            prepared = prepare_for_analysis(path)
+            seconds = time.perf_counter() - started
+            original_bytes = os.path.getsize(path)
+            totals["original_tokens"] += prepared["original_tokens"]
+            totals["tokens"] += prepared["tokens"]
+            totals["original_bytes"] += original_bytes
+            totals["bytes"] += len(prepared["png"])
+            totals["seconds"] += seconds
+            logger.info(
+                f"{Path(path).name}: {prepared['original_width']}x{prepared['original_height']} -> "
+                f"{prepared['width']}x{prepared['height']}, skew {prepared['skew_degrees']} deg, "
+                f"tokens ~{prepared['original_tokens']} -> ~{prepared['tokens']}, "
+                f"bytes {original_bytes} -> {len(prepared['png'])}, prep {seconds * 1000:.0f} ms"
+            )
+            if args.live:
+                before = await timed_analysis(original_data_url(path))
+                after = await timed_analysis(data_url(prepared["png"], 'image/png'))
+                logger.info(
+                    f"{Path(path).name} live: {before[0]:.2f}s / {before[1]} prompt tokens -> "
+                    f"{after[0]:.2f}s / {after[1]} prompt tokens"
+                )
+
+    if args.live:
+        import server
+        await server.llm_gateway.close()
+    if not paths:
+        logger.info("No images found")
+        return
+    saved = 1 - totals["tokens"] / max(totals["original_tokens"], 1)
+    logger.info(
+        f"{len(paths)} plans: tokens ~{totals['original_tokens']} -> ~{totals['tokens']} ({saved:.0%} saved), "
+        f"bytes {totals['original_bytes']} -> {totals['bytes']}, "
+        f"mean prep {totals['seconds'] / len(paths) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
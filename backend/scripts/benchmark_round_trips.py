@@ -0,0 +1,202 @@
+"""Counts MongoDB round trips and latency per write endpoint, before and after
+the single-round-trip write path.
+
+The handlers in server.py are called directly against a throwaway database
+on MONGO_URL (created and dropped here). "before" replays the query sequence
+the handlers used to run; every command sent to the server is counted with
+pymongo's command monitoring. Writes sent concurrently still count as one
+command each, but overlap in the latency column.
+
+    python scripts/benchmark_round_trips.py
+    python scripts/benchmark_round_trips.py --iterations 200
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import statistics
+from pathlib import Path
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+logger = logging.getLogger("benchmark_round_trips")
+
+# Commands that are not round trips made by a handler
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def scene(walls: int = 40) -> str:
+    return json.dumps({
+        "walls": [{"start": [i, 0], "end": [i, 4], "height": 2.8, "thickness": 0.2} for i in range(walls)],
+        "rooms": [{"id": f"room{i}", "width": 4, "depth": 3} for i in range(walls // 4)],
+    })
+
+
+def request():
+    from starlette.requests import Request
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50, help="calls per endpoint and variant")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+    # Registered before server.py creates its client, so every command is seen
+    counter = CommandCounter()
+    monitoring.register(counter)
+    os.environ['DB_NAME'] = f"benchmark_round_trips_{uuid.uuid4().hex[:8]}"
+    import server
+    from fastapi import Response
+    db = server.db
+
+    # The query sequences the handlers ran before
+    async def externalize_blobs_before(doc):
+        for field in server.BLOB_FIELDS:
+            if doc.get(field) is not None:
+                doc[f"{field}_blob"] = await server.blob_store.put(doc.pop(field))
+
+    async def load_blobs_before(doc):
+        for field in server.BLOB_FIELDS:
+            ref = doc.pop(f"{field}_blob", None)
+            if ref and doc.get(field) is None:
+                doc[field] = await server.blob_store.get(ref)
+        return doc
+
+    async def update_floorplan_before(floorplan_id, fields):
+        fields = dict(fields, updated_at=datetime.now(timezone.utc))
+        await externalize_blobs_before(fields)
+        await db.floorplans.update_one({"id": floorplan_id}, {"$set": fields})
+        return await load_blobs_before(await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0}))
+
+    async def get_floorplan_before(floorplan_id):
+        return await load_blobs_before(await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0}))
+
+    async def get_preferences_before(user_id):
+        prefs = await db.user_preferences.find_one({"user_id": user_id}, {"_id": 0})
+        if not prefs:
+            prefs = server.UserPreference(user_id=user_id).model_dump()
+            await db.user_preferences.insert_one(dict(prefs))
+        return prefs
+
+    async def update_preferences_before(user_id, fields):
+        await db.user_preferences.update_one(
+            {"user_id": user_id}, {"$set": dict(fields, updated_at=datetime.now(timezone.utc))}, upsert=True
+        )
+        return await db.user_preferences.find_one({"user_id": user_id}, {"_id": 0})
+
+    async def create_feedback_before(input):
+        feedback = server.Feedback(**input.model_dump())
+        await db.feedback.insert_one(feedback.model_dump())
+        await db.learning_data.insert_one({
+            "user_id": feedback.user_id, "type": "suggestion", "content": feedback.content,
+            "timestamp": datetime.now(timezone.utc)
+        })
+        return feedback
+
+    async def cold(call):
+        server.blob_store._cache.clear()
+        return await call()
+
+    def plan(n):
+        return server.FloorPlanCreate(user_id="bench", name=f"plan {n}", file_type="canvas", canvas_data=scene(8))
+
+    await server.ensure_indexes(db)
+    floorplan_ids = []
+    for n in range(2):
+        created = await server.create_floorplan(plan(n))
+        await server.update_floorplan(created.id, server.FloorPlanUpdate(three_d_data=scene()))
+        floorplan_ids.append(created.id)
+    before_id, after_id = floorplan_ids
+    feedback = server.FeedbackCreate(user_id="bench", feedback_type="suggestion", content="Più luce in cucina")
+
+    # endpoint -> (before, after); each a function of the iteration number
+    cases = {
+        "PATCH /floorplans/{id}": (
+            lambda i: update_floorplan_before(before_id, {"name": f"v{i}", "three_d_data": scene(40 + i)}),
+            lambda i: server.update_floorplan(after_id, server.FloorPlanUpdate(name=f"v{i}", three_d_data=scene(40 + i))),
+        ),
+        "GET /floorplans/{id} (cold blob cache)": (
+            lambda i: cold(lambda: get_floorplan_before(before_id)),
+            lambda i: cold(lambda: server.get_floorplan(request(), Response(), after_id)),
+        ),
+        "GET /preferences/{user_id} (new user)": (
+            lambda i: get_preferences_before(f"before-{uuid.uuid4().hex}"),
+            lambda i: server.get_user_preferences(request(), Response(), f"after-{uuid.uuid4().hex}"),
+        ),
+        "GET /preferences/{user_id}": (
+            lambda i: get_preferences_before("before-user"),
+            lambda i: server.get_user_preferences(request(), Response(), "after-user"),
+        ),
+        "PATCH /preferences/{user_id}": (
+            lambda i: update_preferences_before("before-user", {"render_quality": f"q{i}"}),
+            lambda i: server.update_user_preferences("after-user", server.UserPreferenceUpdate(render_quality=f"q{i}")),
+        ),
+        "POST /feedback (suggestion)": (
+            lambda i: create_feedback_before(feedback),
+            lambda i: server.create_feedback(feedback),
+        ),
+    }
+
+    async def measure(call):
+        commands, seconds = [], []
+        for i in range(args.iterations):
+            counter.commands.clear()
+            started = time.perf_counter()
+            await call(i)
+            seconds.append(time.perf_counter() - started)
+            commands.append(len(counter.commands))
+        return statistics.mean(commands), statistics.median(seconds) * 1000, list(counter.commands)
+
+    try:
+        logger.info(f"{args.iterations} calls per variant on {server.mongo_url.split('@')[-1]}")
+        for name, (before, after) in cases.items():
+            trips_after, ms_after, commands = await measure(after)
+            trips_before, ms_before, _ = await measure(before)
+            logger.info(
+                f"{name}: round trips {trips_before:.1f} -> {trips_after:.1f} ({', '.join(commands)}), "
+                f"median {ms_before:.2f} -> {ms_after:.2f} ms"
+            )
+
+        # A new user's first page load fires several preference reads at once
+        for variant, call in (
+            ("before", get_preferences_before),
+            ("after", lambda user_id: server.get_user_preferences(request(), Response(), user_id)),
+        ):
+            user_id = f"race-{variant}-{uuid.uuid4().hex}"
+            results = await asyncio.gather(*[call(user_id) for _ in range(10)], return_exceptions=True)
+            failed = sum(isinstance(result, Exception) for result in results)
+            documents = await db.user_preferences.count_documents({"user_id": user_id})
+            logger.info(f"10 concurrent first GET /preferences ({variant}): {failed} failed, {documents} documents")
+    finally:
+        await server.client.drop_database(os.environ['DB_NAME'])
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
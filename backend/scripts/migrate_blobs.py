@@ -0,0 +1,97 @@
+"""Moves inline canvas_data/three_d_data payloads into the blob store.
+
+Floor plans written before the blob store carry their payloads inline; the
+API still reads those, so this can run at any time. Each update is
+conditional on the inline value being unchanged since it was read. With
+--prune, blobs no longer referenced by any floor plan are deleted.
+
+    python scripts/migrate_blobs.py --dry-run
+    python scripts/migrate_blobs.py --batch-size 200 --prune
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.blob_store import BlobStore  # noqa: E402
+
+logger = logging.getLogger("migrate_blobs")
+
+BLOB_FIELDS = ("canvas_data", "three_d_data")
+# Blobs stored more recently than this may belong to a write still in flight
+PRUNE_GRACE = timedelta(hours=1)
+
+
+async def migrate_field(floorplans, blob_store: BlobStore, field: str, batch_size: int, dry_run: bool) -> dict:
+    counts = {"moved": 0, "bytes": 0, "stored_bytes": 0}
+    last_id = None
+    # Walks _id order once, so documents left inline (dry run, or changed
+    # underneath us) are never read again
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await floorplans.find(query, {"_id": 1, field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        for doc in batch:
+            if dry_run:
+                counts["moved"] += 1
+                counts["bytes"] += len(doc[field].encode('utf-8'))
+                continue
+            ref = await blob_store.put(doc[field])
+            result = await floorplans.update_one(
+                {"_id": doc["_id"], field: doc[field]},
+                {"$set": {f"{field}_blob": ref}, "$unset": {field: ""}},
+            )
+            # Not modified: changed underneath us, and the API wrote it through the blob store
+            if result.modified_count:
+                counts["moved"] += 1
+                counts["bytes"] += ref["size"]
+                counts["stored_bytes"] += ref["stored_size"]
+    return counts
+
+
+async def prune(db, blob_store: BlobStore, batch_size: int, dry_run: bool) -> int:
+    async def referenced_in(hashes: list) -> set:
+        referenced = set()
+        for field in BLOB_FIELDS:
+            referenced.update(await db.floorplans.distinct(f"{field}_blob.hash", {f"{field}_blob.hash": {"$in": hashes}}))
+        return referenced
+
+    cutoff = datetime.now(timezone.utc) - PRUNE_GRACE
+    return await blob_store.prune(referenced_in, cutoff, batch_size=batch_size, dry_run=dry_run)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--prune", action="store_true", help="delete blobs no floor plan references")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    blob_store = BlobStore(db.blobs)
+    try:
+        for field in BLOB_FIELDS:
+            counts = await migrate_field(db.floorplans, blob_store, field, args.batch_size, args.dry_run)
+            logger.info(f"floorplans.{field}: {counts['moved']} moved, {counts['bytes']} bytes -> {counts['stored_bytes']} stored")
+        if args.prune:
+            logger.info(f"Pruned {await prune(db, blob_store, args.batch_size, args.dry_run)} unreferenced blobs")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Converts ISO-string timestamps to native BSON dates.
+
+Older documents were written with datetime.isoformat(); the API now stores
+and queries real dates. The migration is idempotent and safe to run while
+the API is serving: each update is conditional on the field still holding
+the string that was read, so a concurrent write is never overwritten.
+
+    python scripts/migrate_datetimes.py --dry-run
+    python scripts/migrate_datetimes.py --batch-size 1000
+"""
+import os
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+logger = logging.getLogger("migrate_datetimes")
+
+# Collection -> fields that used to be stored as ISO strings
+DATETIME_FIELDS = {
+    "floorplans": ["created_at", "updated_at"],
+    "conversations": ["created_at"],
+    "messages": ["timestamp"],
+    "user_preferences": ["updated_at"],
+    "feedback": ["created_at"],
+    "learning_data": ["timestamp"],
+}
+
+
+def parse_iso(value: str) -> datetime:
+    """ISO-8601 string -> UTC-aware datetime; naive values are taken as UTC."""
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+async def migrate_field(collection, field: str, batch_size: int, dry_run: bool) -> dict:
+    counts = {"converted": 0, "invalid": 0}
+    last_id = None
+    # Walks _id order once, so invalid values (and everything, in a dry run)
+    # are passed over without remembering them
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await collection.find(query, {"_id": 1, field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        requests = []
+        for doc in batch:
+            try:
+                value = parse_iso(doc[field])
+            except ValueError:
+                counts["invalid"] += 1
+                logger.warning(f"{collection.name}.{field}: unparseable value {doc[field]!r} on {doc['_id']}")
+                continue
+            requests.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+
+        if dry_run:
+            counts["converted"] += len(requests)
+            continue
+        if requests:
+            result = await collection.bulk_write(requests, ordered=False)
+            counts["converted"] += result.modified_count
+    return counts
+
+
+async def migrate(db, batch_size: int = 500, dry_run: bool = False) -> dict:
+    report = {}
+    for collection_name, fields in DATETIME_FIELDS.items():
+        for field in fields:
+            counts = await migrate_field(db[collection_name], field, batch_size, dry_run)
+            report[f"{collection_name}.{field}"] = counts
+            logger.info(f"{collection_name}.{field}: {counts['converted']} converted, {counts['invalid']} invalid")
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="count documents to convert without writing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        await migrate(client[os.environ['DB_NAME']], args.batch_size, args.dry_run)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
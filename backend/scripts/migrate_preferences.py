@@ -0,0 +1,67 @@
+"""Removes duplicate user_preferences documents, then builds the unique user_id index.
+
+Before the index existed, concurrent first requests for a user could each
+insert a preferences document. The unique index cannot be built while those
+duplicates remain, and ensure_indexes() only logs the failure at startup. For
+every user_id with more than one document this keeps the most recently
+updated one and deletes the rest, then creates the collection's indexes.
+
+    python scripts/migrate_preferences.py --dry-run
+    python scripts/migrate_preferences.py
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.indexes import INDEXES, ensure_indexes  # noqa: E402
+
+logger = logging.getLogger("migrate_preferences")
+
+
+async def dedupe(collection, dry_run: bool) -> dict:
+    counts = {"users": 0, "deleted": 0}
+    pipeline = [
+        # Newest first within each user; _id breaks ties between equal timestamps
+        {"$sort": {"user_id": 1, "updated_at": -1, "_id": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        stale = group["ids"][1:]
+        counts["users"] += 1
+        if dry_run:
+            counts["deleted"] += len(stale)
+            continue
+        result = await collection.delete_many({"_id": {"$in": stale}})
+        counts["deleted"] += result.deleted_count
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="count duplicates without deleting or indexing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        counts = await dedupe(db.user_preferences, args.dry_run)
+        logger.info(f"user_preferences: {counts['users']} users with duplicates, {counts['deleted']} documents deleted")
+        if not args.dry_run:
+            created = await ensure_indexes(db, {"user_preferences": INDEXES["user_preferences"]})
+            logger.info(f"user_preferences indexes: {created.get('user_preferences')}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
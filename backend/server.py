@@ -1,32 +1,67 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, Response
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse, FileResponse, RedirectResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 import uuid
 from datetime import datetime, timezone
 import cloudinary
 import cloudinary.uploader
 import json
 import asyncio
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from openai import AsyncOpenAI
-from fastapi import BackgroundTasks
-import tempfile
+import base64
+import hashlib
 import shutil
+import tempfile
+import time
+from contextlib import aclosing, asynccontextmanager
 from services.drive_service import DriveService
+from services.upload_spool import (
+    spool_upload, spool_download, spool_dir, expand_zip, SpooledUpload, UploadTooLarge, ArchiveError,
+    close_http as close_download_http,
+)
+from services.drive_queue import DriveUploadQueue
+from services.job_runner import JobRunner
+from services.batch_ingest import (
+    BatchIngest, ItemContext, batch_item, public_batch, BATCH_MAX_FILES, BATCH_MAX_CONCURRENCY
+)
+from services.analysis_cache import AnalysisCache, analysis_cache_key
+from services.style_engine import StyleEngine
+from services.blob_store import BlobStore
+from services.http_cache import conditional_response, CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL
+from services.compression import CompressionMiddleware
+from services.image_proxy import ImageProxy, ProxyError
+from services.process_pool import run_in_process, shutdown_pool
+from services.derivatives import build_derivatives
+from services.pdf_raster import PdfRasterizer, page_data_url, merge_page_results
+from services.image_prep import prepare_for_analysis
+from services.mesh_baker import MeshBaker, mesh_hash
+from services.renderer import RenderCache, RENDER_VIEWS
+from services.geometry import (
+    detect_rooms, rooms_to_scene, walls_to_scene, normalize_scene, SNAP_TOLERANCE, MIN_ROOM_AREA
+)
+from services.llm_gateway import LLMGateway, estimate_tokens
+from services.indexes import ensure_indexes
+from services.json_patch import apply_patch, JsonPatchError
+from services.pagination import (
+    MAX_PAGE_SIZE, DEFAULT_PAGE_SIZE, NDJSON_MEDIA_TYPE, InvalidCursor,
+    fetch_page, find_page, ndjson_lines, wants_ndjson
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware: dates come back as UTC-aware datetimes, matching the models
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Cloudinary config
@@ -34,17 +69,62 @@ cloudinary.config(
     cloud_name=os.environ['CLOUDINARY_CLOUD_NAME'],
     api_key=os.environ['CLOUDINARY_API_KEY'],
     api_secret=os.environ['CLOUDINARY_API_SECRET']
-    api_secret=os.environ['CLOUDINARY_API_SECRET']
 )
 
+# Shared LLM clients and limits (started in the app lifespan)
+llm_gateway = LLMGateway()
+
 # Initialize Drive Service
 drive_service = DriveService()
+DRIVE_ROOT_FOLDER = "Tempocasa Projects"
+drive_queue = DriveUploadQueue(db.drive_upload_jobs, drive_service, DRIVE_ROOT_FOLDER)
+
+# Long-running AI/render work runs as jobs (see register_jobs below)
+job_runner = JobRunner(db.jobs)
+batch_ingest = BatchIngest(db.batches)
+
+# Content-addressed cache of vision-model analyses
+analysis_cache = AnalysisCache(db.analysis_cache)
+
+# Named style palettes applied locally; AI only for unknown style names
+style_engine = StyleEngine(db.style_palettes)
+blob_store = BlobStore(db.blobs)
+image_proxy = ImageProxy()
+pdf_rasterizer = PdfRasterizer()
+mesh_baker = MeshBaker()
+render_cache = RenderCache()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes(db)
+    await llm_gateway.start()
+    await image_proxy.start()
+    await drive_queue.start()
+    await job_runner.start()
+    try:
+        yield
+    finally:
+        await drive_queue.stop()
+        await job_runner.stop()
+        await llm_gateway.close()
+        await image_proxy.close()
+        await close_download_http()
+        shutdown_pool()
+        client.close()
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # Define Models
+class ImageDerivative(BaseModel):
+    name: str  # thumb, preview, editor
+    format: str  # webp, avif
+    width: int
+    height: int
+    size: int
+    url: str
+
 class FloorPlan(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -54,11 +134,49 @@ class FloorPlan(BaseModel):
     file_url: Optional[str] = None
     canvas_data: Optional[str] = None
     thumbnail_url: Optional[str] = None
+    file_hash: Optional[str] = None  # sha256 of the uploaded original
+    file_size: Optional[int] = None
+    derivatives: List[ImageDerivative] = Field(default_factory=list)
     status: str = "uploaded"  # uploaded, processing, ready, error
+    error: Optional[str] = None  # why processing failed, while status is "error"
     three_d_data: Optional[str] = None
+    version: int = 0  # bumped on every canvas/3D data change
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class FloorPlanSummary(BaseModel):
+    """List-view floor plan: everything but the canvas/3D payloads, plus their sizes."""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    user_id: str
+    name: str
+    file_type: str
+    file_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    file_hash: Optional[str] = None
+    file_size: Optional[int] = None
+    derivatives: List[ImageDerivative] = Field(default_factory=list)
+    status: str = "uploaded"
+    error: Optional[str] = None
+    version: int = 0
+    has_canvas: bool
+    has_3d: bool
+    canvas_data_size: int = 0  # bytes
+    three_d_data_size: int = 0  # bytes
+    created_at: datetime
+    updated_at: datetime
+
+# Computed by Mongo, so the blobs never leave the server
+FLOORPLAN_SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "user_id": 1, "name": 1, "file_type": 1, "file_url": 1,
+    "thumbnail_url": 1, "file_hash": 1, "file_size": 1, "derivatives": 1, "status": 1, "error": 1, "version": 1,
+    "created_at": 1, "updated_at": 1,
+    "has_canvas": {"$or": [{"$gt": ["$canvas_data_blob", None]}, {"$gt": ["$canvas_data", None]}]},
+    "has_3d": {"$or": [{"$gt": ["$three_d_data_blob", None]}, {"$gt": ["$three_d_data", None]}]},
+    "canvas_data_size": {"$ifNull": ["$canvas_data_blob.size", {"$strLenBytes": {"$ifNull": ["$canvas_data", ""]}}]},
+    "three_d_data_size": {"$ifNull": ["$three_d_data_blob.size", {"$strLenBytes": {"$ifNull": ["$three_d_data", ""]}}]},
+}
+
 class FloorPlanCreate(BaseModel):
     user_id: str
     name: str
@@ -70,6 +188,11 @@ class FloorPlanUpdate(BaseModel):
     status: Optional[str] = None
     three_d_data: Optional[str] = None
 
+class ScenePatch(BaseModel):
+    version: int  # the version the operations were computed against
+    three_d_data: Optional[List[Dict[str, Any]]] = None  # RFC 6902 operations
+    canvas_data: Optional[List[Dict[str, Any]]] = None
+
 class Message(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -134,6 +257,68 @@ class RenderRequest(BaseModel):
     quality: str = "high"  # low, medium, high
     style: str = "realistic"  # realistic, wireframe, stylized
 
+class DriveUploadJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    floorplan_id: Optional[str] = None
+    file_name: str
+    folder_name: str
+    status: str  # queued, running, done, failed, skipped
+    attempts: int = 0
+    max_attempts: int
+    bytes_sent: Optional[int] = 0
+    total_bytes: Optional[int] = None
+    drive_file_id: Optional[str] = None
+    error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+
+class Job(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    kind: str  # convert-3d, restyle, render
+    floorplan_id: Optional[str] = None
+    status: str  # queued, running, completed, failed
+    progress: int = 0
+    message: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: datetime
+
+class BatchItem(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    index: int
+    filename: str
+    floorplan_id: Optional[str] = None  # None when the file was rejected
+    file_type: Optional[str] = None
+    size: Optional[int] = None
+    status: str  # queued, running, done, failed
+    progress: int = 0
+    message: Optional[str] = None
+    error: Optional[str] = None
+    file_url: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class Batch(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    user_id: str
+    status: str  # queued, running, completed
+    convert: bool
+    concurrency: int
+    job_id: Optional[str] = None
+    items: List[BatchItem]
+    summary: Dict[str, Any]
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: datetime
+
 class ChatRequest(BaseModel):
     conversation_id: str
     message: str
@@ -142,11 +327,133 @@ class ChatRequest(BaseModel):
 class RestyleRequest(BaseModel):
     style: str
 
+class RoomDetectionRequest(BaseModel):
+    walls: List[Dict[str, Any]]  # canvas walls, {"points": [x1, y1, x2, y2]}
+    snap_tolerance: float = SNAP_TOLERANCE
+    min_area: float = MIN_ROOM_AREA
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "3D Floor Plan API", "version": "1.0.0"}
 
+async def hydrated(cursor, hydrate, batch_size: int = 100):
+    """Applies `hydrate` to a streaming cursor a batch at a time."""
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            for item in await hydrate(batch):
+                yield item
+            batch = []
+    if batch:
+        for item in await hydrate(batch):
+            yield item
+
+async def list_documents(request: Request, response: Response, collection, model, query: dict,
+                         sort_field: str, direction: int, limit: Optional[int], after: Optional[str],
+                         format: Optional[str], projection: Optional[dict] = None, hydrate=None):
+    """Keyset-paginated list; streams NDJSON straight from the cursor when asked to.
+
+    JSON responses stay a plain array, with the next page in the X-Next-Cursor
+    and Link headers, and carry an ETag for conditional re-fetches. NDJSON streams until the cursor is exhausted unless an
+    explicit limit is given. `hydrate` is an optional async step applied to
+    each batch of documents before serialization (e.g. loading blobs).
+    """
+    try:
+        if wants_ndjson(request.headers.get('accept'), format):
+            cursor = find_page(collection, query, sort_field, direction, after, limit, projection)
+            if hydrate:
+                cursor = hydrated(cursor, hydrate)
+            return StreamingResponse(ndjson_lines(cursor, model), media_type=NDJSON_MEDIA_TYPE)
+        docs, next_cursor = await fetch_page(
+            collection, query, sort_field, direction, after, limit or DEFAULT_PAGE_SIZE, projection
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    not_modified = conditional_response(request, response, [docs, next_cursor])
+    if not_modified:
+        return not_modified
+    if hydrate:
+        docs = await hydrate(docs)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.url.include_query_params(after=next_cursor)}>; rel="next"'
+    return docs
+
+def date_range(field: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """Filter for start <= field < end; naive datetimes are taken as UTC."""
+    bounds = {}
+    if start:
+        bounds["$gte"] = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    if end:
+        bounds["$lt"] = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    return {field: bounds} if bounds else {}
+
+# Large payloads live in the blob store; the floor plan keeps a "<field>_blob" reference
+BLOB_FIELDS = ("canvas_data", "three_d_data")
+
+def blob_projection(*fields) -> dict:
+    """Projection for payload fields: the reference, plus the inline value on older documents."""
+    projection = {}
+    for field in fields:
+        projection[field] = 1
+        projection[f"{field}_blob"] = 1
+    return projection
+
+async def externalize_blobs(doc: dict) -> list:
+    """Moves payloads in `doc` to the blob store, in place; returns the inline fields replaced."""
+    moved = [field for field in BLOB_FIELDS if doc.get(field) is not None]
+    if moved:
+        refs = await blob_store.put_many([doc.pop(field) for field in moved])
+        for field, ref in zip(moved, refs):
+            doc[f"{field}_blob"] = ref
+    return moved
+
+async def floorplan_update(fields: dict) -> dict:
+    """$set update for `fields` with payloads stored as blobs and their inline copies unset.
+
+    A payload change also bumps the plan's version.
+    """
+    moved = await externalize_blobs(fields)
+    update = {"$set": fields}
+    if moved:
+        update["$unset"] = {field: "" for field in moved}
+        update["$inc"] = {"version": 1}
+    return update
+
+def fill_blob(doc: dict, field: str, ref: dict, texts: dict):
+    text = texts.get(ref["hash"])
+    if text is None:
+        # Deleted or never written; the document stays readable without the payload
+        logging.error(f"Blob {ref['hash']} for {field} of floor plan {doc.get('id')} is missing")
+    doc[field] = text
+
+async def load_blobs(doc: dict, fields=BLOB_FIELDS) -> dict:
+    """Fills payload fields from their blob references, in place, with one query for all of them.
+
+    A field whose blob is missing is left None.
+    """
+    refs = {field: doc.pop(f"{field}_blob", None) for field in fields}
+    refs = {field: ref for field, ref in refs.items() if ref and doc.get(field) is None}
+    if refs:
+        texts = await blob_store.get_many(refs.values())
+        for field, ref in refs.items():
+            fill_blob(doc, field, ref, texts)
+    return doc
+
+async def load_blobs_many(docs: list) -> list:
+    """load_blobs for a page of documents, with one blob query for the whole page."""
+    refs = [doc[f"{field}_blob"] for doc in docs for field in BLOB_FIELDS if doc.get(f"{field}_blob")]
+    texts = await blob_store.get_many(refs) if refs else {}
+    for doc in docs:
+        for field in BLOB_FIELDS:
+            ref = doc.pop(f"{field}_blob", None)
+            if ref and doc.get(field) is None:
+                fill_blob(doc, field, ref, texts)
+    return docs
+
 # FloorPlans endpoints
 @api_router.post("/floorplans", response_model=FloorPlan)
 async def create_floorplan(input: FloorPlanCreate):
@@ -154,52 +461,118 @@ async def create_floorplan(input: FloorPlanCreate):
     floorplan_obj = FloorPlan(**floorplan_dict)
     
     doc = floorplan_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
-    
+    await externalize_blobs(doc)
     await db.floorplans.insert_one(doc)
     return floorplan_obj
 
-@api_router.get("/floorplans", response_model=List[FloorPlan])
-async def get_floorplans(user_id: Optional[str] = None):
+@api_router.get("/floorplans", response_model=Union[List[FloorPlanSummary], List[FloorPlan]])
+async def get_floorplans(
+    request: Request,
+    response: Response,
+    user_id: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Optional[str] = None
+):
     query = {"user_id": user_id} if user_id else {}
-    floorplans = await db.floorplans.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    for fp in floorplans:
-        if isinstance(fp.get('created_at'), str):
-            fp['created_at'] = datetime.fromisoformat(fp['created_at'])
-        if isinstance(fp.get('updated_at'), str):
-            fp['updated_at'] = datetime.fromisoformat(fp['updated_at'])
-    
-    return floorplans
+    query.update(date_range("created_at", created_after, created_before))
+    if view == "summary":
+        return await list_documents(
+            request, response, db.floorplans, FloorPlanSummary, query, "created_at", -1, limit, after, format,
+            projection=FLOORPLAN_SUMMARY_PROJECTION
+        )
+    return await list_documents(
+        request, response, db.floorplans, FloorPlan, query, "created_at", -1, limit, after, format,
+        hydrate=load_blobs_many
+    )
 
-@api_router.get("/floorplans/{floorplan_id}", response_model=FloorPlan)
-async def get_floorplan(floorplan_id: str):
+async def find_floorplan(floorplan_id: str) -> dict:
+    """The stored floor plan, with blob references not yet loaded."""
     floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0})
     if not floorplan:
         raise HTTPException(status_code=404, detail="Floor plan not found")
-    
-    if isinstance(floorplan.get('created_at'), str):
-        floorplan['created_at'] = datetime.fromisoformat(floorplan['created_at'])
-    if isinstance(floorplan.get('updated_at'), str):
-        floorplan['updated_at'] = datetime.fromisoformat(floorplan['updated_at'])
-    
     return floorplan
 
+@api_router.get("/floorplans/{floorplan_id}", response_model=FloorPlan)
+async def get_floorplan(request: Request, response: Response, floorplan_id: str):
+    floorplan = await find_floorplan(floorplan_id)
+    # The ETag covers the blob hashes, so an unchanged plan is answered without loading them
+    not_modified = conditional_response(request, response, floorplan)
+    if not_modified:
+        return not_modified
+    
+    return await load_blobs(floorplan)
+
 @api_router.patch("/floorplans/{floorplan_id}", response_model=FloorPlan)
 async def update_floorplan(floorplan_id: str, update: FloorPlanUpdate):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
-    result = await db.floorplans.update_one(
-        {"id": floorplan_id},
-        {"$set": update_data}
+    floorplan = await db.floorplans.find_one_and_update(
+        {"id": floorplan_id}, await floorplan_update(update_data),
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
     )
+    if not floorplan:
+        raise HTTPException(status_code=404, detail="Floor plan not found")
     
-    if result.matched_count == 0:
+    # Blobs just written are served from the blob store's cache
+    return await load_blobs(floorplan)
+
+def parse_payload(text: Optional[str], field: str):
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        raise HTTPException(status_code=409, detail=f"Stored {field} is not JSON and cannot be patched")
+
+@api_router.patch("/floorplans/{floorplan_id}/scene")
+async def patch_floorplan_scene(floorplan_id: str, patch: ScenePatch):
+    """Applies RFC 6902 operations to the stored 3D data and/or canvas.
+
+    Both payloads change together or not at all, and only if the plan is still at
+    `version`; otherwise 409 with the current version. Returns the new version.
+    """
+    fields = {field: getattr(patch, field) for field in BLOB_FIELDS if getattr(patch, field) is not None}
+    if not fields:
+        raise HTTPException(status_code=400, detail="No patch operations given")
+    floorplan = await db.floorplans.find_one(
+        {"id": floorplan_id}, {"_id": 0, "version": 1, **blob_projection(*fields)}
+    )
+    if not floorplan:
         raise HTTPException(status_code=404, detail="Floor plan not found")
+    current = floorplan.get("version", 0)
+    if current != patch.version:
+        raise HTTPException(status_code=409, detail={"message": "Floor plan has changed", "version": current})
     
-    return await get_floorplan(floorplan_id)
+    await load_blobs(floorplan, list(fields))
+    updates = {}
+    for field, operations in fields.items():
+        try:
+            patched = apply_patch(parse_payload(floorplan.get(field), field), operations)
+        except JsonPatchError as e:
+            raise HTTPException(status_code=422, detail=f"{field}: {e}")
+        updates[field] = json.dumps(patched)
+    updates["updated_at"] = datetime.now(timezone.utc)
+    
+    # Missing version (older documents) counts as 0
+    result = await db.floorplans.find_one_and_update(
+        {"id": floorplan_id, "version": patch.version or {"$in": [0, None]}},
+        await floorplan_update(updates),
+        projection={"_id": 0, "version": 1, "updated_at": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not result:
+        floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0, "version": 1})
+        if not floorplan:
+            raise HTTPException(status_code=404, detail="Floor plan not found")
+        raise HTTPException(
+            status_code=409, detail={"message": "Floor plan has changed", "version": floorplan.get("version", 0)}
+        )
+    return {"id": floorplan_id, "version": result["version"], "updated_at": result["updated_at"]}
 
 @api_router.delete("/floorplans/{floorplan_id}")
 async def delete_floorplan(floorplan_id: str):
@@ -208,106 +581,178 @@ async def delete_floorplan(floorplan_id: str):
         raise HTTPException(status_code=404, detail="Floor plan not found")
     return {"message": "Floor plan deleted successfully"}
 
-def upload_to_drive_background(file_path: str, folder_name: str, file_name: str):
-    """Background task to upload file to Google Drive"""
-    try:
-        logging.info(f"Starting background Drive upload for {file_name} in folder {folder_name}")
-        
-        # 1. Create or Find Project Folder
-        # Root folder "Tempocasa Projects"
-        root_folder_id = drive_service.find_folder("Tempocasa Projects")
-        if not root_folder_id:
-            root_folder_id = drive_service.create_folder("Tempocasa Projects")
-        
-        # Project Folder
-        project_folder_id = drive_service.find_folder(folder_name, parent_id=root_folder_id)
-        if not project_folder_id:
-            project_folder_id = drive_service.create_folder(folder_name, parent_id=root_folder_id)
-        
-        # 2. Upload File
-        drive_service.upload_file(file_path, folder_id=project_folder_id)
-        
-        # 3. Cleanup temp file
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logging.info(f"Cleaned up temp file {file_path}")
-            
-    except Exception as e:
-        logging.error(f"Background Drive upload failed: {str(e)}")
-        # Try to cleanup even if failed
-        if os.path.exists(file_path):
-            os.remove(file_path)
+# Files above this size go through Cloudinary's chunked upload API
+CLOUDINARY_LARGE_UPLOAD_BYTES = 20 * 1024 * 1024
+CLOUDINARY_CHUNK_SIZE = 6 * 1024 * 1024
+
+def upload_to_cloudinary(file_path: str, size: int) -> dict:
+    """Uploads a file from disk to Cloudinary, chunked for large files."""
+    options = dict(
+        folder="floorplans",
+        resource_type="auto",
+        type="upload",  # Ensure it's uploaded as public
+        access_mode="public",  # Make publicly accessible
+        invalidate=True  # Invalidate CDN cache
+    )
+    if size > CLOUDINARY_LARGE_UPLOAD_BYTES:
+        return cloudinary.uploader.upload_large(file_path, chunk_size=CLOUDINARY_CHUNK_SIZE, **options)
+    return cloudinary.uploader.upload(file_path, **options)
+
+async def store_upload(floorplan_id: str, spooled, folder_name: str) -> dict:
+    """Uploads a spooled file to Cloudinary, records it on the plan and queues its derivatives and Drive copy.
+
+    On return the Drive queue owns the spool file and removes it when done.
+    """
+    upload_result = await asyncio.to_thread(upload_to_cloudinary, spooled.path, spooled.size)
+    
+    logging.info(f"Cloudinary upload successful: {upload_result.get('secure_url')}")
+    
+    # Update floor plan with file URL
+    await db.floorplans.update_one(
+        {"id": floorplan_id},
+        {"$set": {
+            "file_url": upload_result['secure_url'],
+            "thumbnail_url": upload_result.get('thumbnail_url', upload_result['secure_url']),
+            "file_hash": spooled.sha256,
+            "file_size": spooled.size,
+            "derivatives": [],
+            "updated_at": datetime.now(timezone.utc)
+        }}
+    )
+
+    derivatives_job = None
+    if spooled.file_type == 'image':
+        derivatives_job = await submit_derivatives(floorplan_id, spooled)
+
+    drive_job = await drive_queue.enqueue(
+        spooled.path, folder_name, spooled.filename,
+        mime_type=spooled.content_type, floorplan_id=floorplan_id
+    )
+    logging.info(f"Queued Drive upload job {drive_job['id']} for {spooled.path}")
+    
+    return {
+        "file_url": upload_result['secure_url'],
+        "thumbnail_url": upload_result.get('thumbnail_url', upload_result['secure_url']),
+        "drive_job_id": drive_job['id'],
+        "derivatives_job_id": derivatives_job['id'] if derivatives_job else None
+    }
 
 @api_router.post("/floorplans/{floorplan_id}/upload")
-async def upload_floorplan_file(floorplan_id: str, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_floorplan_file(floorplan_id: str, file: UploadFile = File(...)):
+    spooled = None
     try:
         logging.info(f"Starting upload for floor plan {floorplan_id}, file: {file.filename}")
         
         # Fetch floor plan to get name for Drive folder
-        floorplan = await db.floorplans.find_one({"id": floorplan_id})
+        floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0, "name": 1})
         folder_name = floorplan.get("name", f"Project_{floorplan_id}") if floorplan else f"Project_{floorplan_id}"
 
-        # Read file content
-        contents = await file.read()
-        logging.info(f"File read successfully, size: {len(contents)} bytes")
+        # Stream the body to a single spool file; both uploaders read from it
+        spooled = await spool_upload(file)
+        logging.info(f"File spooled to {spooled.path}, size: {spooled.size} bytes, sha256: {spooled.sha256}")
+
+        stored = await store_upload(floorplan_id, spooled, folder_name)
+        spooled = None
         
-        # Save to temp file for Drive Upload
-        try:
-            # Create a temp file that persists until background task deletes it
-            fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1])
-            with os.fdopen(fd, 'wb') as tmp:
-                tmp.write(contents)
-            
-            # Add background task
-            background_tasks.add_task(upload_to_drive_background, temp_path, folder_name, file.filename)
-            logging.info(f"Added background Drive upload task for {temp_path}")
-        except Exception as e:
-            logging.error(f"Failed to prepare temp file for Drive: {e}")
-
-        # Upload to Cloudinary
-        upload_result = await asyncio.to_thread(
-            cloudinary.uploader.upload,
-            contents,
-            folder="floorplans",
-            resource_type="auto",
-            type="upload",  # Ensure it's uploaded as public
-            access_mode="public",  # Make publicly accessible
-            invalidate=True  # Invalidate CDN cache
-        )
+        return {"message": "File uploaded successfully", **stored}
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logging.error(f"Upload error for {floorplan_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        # Only set when the Drive job was never queued
+        if spooled:
+            spooled.discard()
+
+# Derivatives are named by content hash, so their URLs never change meaning
+DERIVATIVE_FOLDER = "floorplans/derivatives"
+
+def upload_derivative_to_cloudinary(file_path: str, public_id: str) -> dict:
+    return cloudinary.uploader.upload(
+        file_path,
+        folder=DERIVATIVE_FOLDER,
+        public_id=public_id,
+        resource_type="image",
+        type="upload",
+        access_mode="public",
+        overwrite=False,
+        unique_filename=False
+    )
+
+async def submit_derivatives(floorplan_id: str, spooled) -> dict:
+    """Queues the derivatives job with its own link to the spooled upload.
+
+    One job per upload: a job for a file that has since been replaced skips itself.
+    """
+    return await job_runner.submit(
+        "derivatives",
+        {"source_path": spooled.link_copy(), "file_hash": spooled.sha256},
+        floorplan_id=floorplan_id,
+        dedupe=False
+    )
+
+async def run_derivatives(ctx) -> dict:
+    floorplan = await db.floorplans.find_one(
+        {"id": ctx.floorplan_id}, {"_id": 0, "file_url": 1, "file_hash": 1, "file_type": 1}
+    )
+    if not floorplan or not floorplan.get("file_url"):
+        raise ValueError("Floor plan has no uploaded file")
+    
+    source_path = ctx.params.get("source_path")
+    if ctx.params.get("file_hash") != floorplan.get("file_hash"):
+        if source_path and os.path.exists(source_path):
+            os.remove(source_path)
+        return {"skipped": "file replaced by a newer upload"}
+    if not (source_path and os.path.exists(source_path)):
+        # Local copy gone (restart or another host): fetch the original
+        source_path = await spool_download(floorplan["file_url"])
+    out_dir = tempfile.mkdtemp(prefix="derivatives_", dir=spool_dir())
+    try:
+        await ctx.progress(10, "Generazione anteprime")
+        stem = floorplan["file_hash"][:16]
+        files = await run_in_process(build_derivatives, source_path, out_dir, stem)
         
-        logging.info(f"Cloudinary upload successful: {upload_result.get('secure_url')}")
+        await ctx.progress(60, "Caricamento anteprime")
+        uploads = await asyncio.gather(*[
+            asyncio.to_thread(upload_derivative_to_cloudinary, f["path"], f"{stem}_{f['name']}_{f['format']}")
+            for f in files
+        ])
+        derivatives = [
+            ImageDerivative(
+                name=f["name"], format=f["format"], width=f["width"], height=f["height"],
+                size=f["size"], url=uploaded["secure_url"]
+            ).model_dump()
+            for f, uploaded in zip(files, uploads)
+        ]
+        thumb = next(d for d in derivatives if d["name"] == "thumb" and d["format"] == "webp")
         
-        # Update floor plan with file URL
+        # Only if the file was not replaced while the job ran
         await db.floorplans.update_one(
-            {"id": floorplan_id},
+            {"id": ctx.floorplan_id, "file_hash": floorplan["file_hash"]},
             {"$set": {
-                "file_url": upload_result['secure_url'],
-                "thumbnail_url": upload_result.get('thumbnail_url', upload_result['secure_url']),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "derivatives": derivatives,
+                "thumbnail_url": thumb["url"],
+                "updated_at": datetime.now(timezone.utc)
             }}
         )
-        
-        return {
-            "message": "File uploaded successfully",
-            "file_url": upload_result['secure_url'],
-            "thumbnail_url": upload_result.get('thumbnail_url', upload_result['secure_url'])
-        }
-    except Exception as e:
-        logging.error(f"Upload error for {floorplan_id}: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+        return {"derivatives": derivatives}
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        try:
+            os.remove(source_path)
+        except OSError:
+            pass
 
-async def analyze_floorplan_with_ai(file_url: str) -> dict:
-    """Use AI to analyze floor plan image and extract structure"""
-    try:
-        # Use OpenAI Vision API to analyze the floor plan
-        client = AsyncOpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
-        
-        response = await client.chat.completions.create(
-            model="gpt-4o",  # Vision-capable model
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Sei un esperto di architettura. Analizza questa piantina e estrai:
+@api_router.get("/drive-uploads/{job_id}", response_model=DriveUploadJob)
+async def get_drive_upload_job(job_id: str):
+    job = await drive_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Drive upload job not found")
+    return job
+
+ANALYSIS_MODEL = "gpt-4o"  # Vision-capable model
+ANALYSIS_SYSTEM_PROMPT = """Sei un esperto di architettura. Analizza questa piantina e estrai:
                     1. Numero e dimensioni approssimative delle stanze (in metri)
                     2. Posizione e dimensioni di porte e finestre
                     3. Layout generale
@@ -318,31 +763,131 @@ async def analyze_floorplan_with_ai(file_url: str) -> dict:
                       \"doors\": [{\"position\": [2.5, 0], \"width\": 0.9, \"height\": 2.1}],
                       \"windows\": [{\"position\": [1, 2.8], \"width\": 1.2, \"height\": 1.5}]
                     }"""
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Analizza questa piantina e genera il modello 3D"},
-                        {"type": "image_url", "image_url": {"url": file_url}}
-                    ]
-                }
-            ],
-            max_tokens=1500,
-            temperature=0.3
-        )
-        
-        # Parse AI response
-        content = response.choices[0].message.content
-        # Extract JSON from response (might be wrapped in markdown)
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-        
-        return json.loads(content)
+ANALYSIS_USER_PROMPT = "Analizza questa piantina e genera il modello 3D"
+
+async def request_floorplan_analysis(file_url: str) -> dict:
+    """Sends the floor plan to the vision model; raises if the response is unusable."""
+    # Use OpenAI Vision API to analyze the floor plan
+    response = await llm_gateway.chat_completion(
+        "openai",
+        model=ANALYSIS_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": ANALYSIS_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": ANALYSIS_USER_PROMPT},
+                    {"type": "image_url", "image_url": {"url": file_url}}
+                ]
+            }
+        ],
+        max_tokens=1500,
+        temperature=0.3
+    )
+    
+    # Parse AI response
+    content = response.choices[0].message.content
+    # Extract JSON from response (might be wrapped in markdown)
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+    
+    return json.loads(content)
+
+# Crop/deskew/binarize/downsample images before they reach the vision model
+IMAGE_PREP_ENABLED = os.environ.get('IMAGE_PREP_ENABLED', 'true').lower() == 'true'
+
+async def prepared_image_url(path: str) -> str:
+    """The image at `path`, pre-processed in the process pool, as an inline PNG."""
+    prepared = await run_in_process(prepare_for_analysis, path)
+    logging.info(
+        f"Prepared analysis image {prepared['width']}x{prepared['height']} "
+        f"(~{prepared['tokens']} vision tokens, was ~{prepared['original_tokens']}), "
+        f"skew {prepared['skew_degrees']} deg"
+    )
+    return "data:image/png;base64," + base64.b64encode(prepared["png"]).decode('ascii')
+
+async def analysis_image_url(file_url: str) -> str:
+    """What to send for an uploaded image: the pre-processed copy, or the URL if that fails."""
+    if not IMAGE_PREP_ENABLED:
+        return file_url
+    try:
+        path = await spool_download(file_url)
+        try:
+            return await prepared_image_url(path)
+        finally:
+            os.remove(path)
+    except Exception as e:
+        logging.error(f"Image pre-processing failed, sending original: {str(e)}")
+        return file_url
+
+async def cached_analysis(content_hash: str, load_image) -> dict:
+    """Analysis of one image, through the analysis cache; raises if the model's answer is unusable.
+
+    `load_image` returns the URL (or data URL) to send and is only awaited on a miss.
+    """
+    cache_key = analysis_cache_key(
+        content_hash, ANALYSIS_MODEL, ANALYSIS_SYSTEM_PROMPT + ANALYSIS_USER_PROMPT
+    )
+    try:
+        cached = await analysis_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Analysis cache hit for {content_hash}")
+            return cached
+    except Exception as e:
+        logging.error(f"Analysis cache lookup failed: {str(e)}")
+
+    result = await request_floorplan_analysis(await load_image())
+
+    try:
+        await analysis_cache.put(cache_key, result, ANALYSIS_MODEL, content_hash)
+    except Exception as e:
+        logging.error(f"Failed to store analysis in cache: {str(e)}")
+    return result
+
+async def analyze_pdf_pages(file_url: str, content_hash: str) -> dict:
+    """Rasterizes the PDF and analyzes its pages concurrently, merging what succeeds."""
+    async def analyze_page(page):
+        async def load_image():
+            if IMAGE_PREP_ENABLED:
+                return await prepared_image_url(page["path"])
+            return await asyncio.to_thread(page_data_url, page["path"])
+        return await cached_analysis(f"{content_hash}:page{page['page']}:{pdf_rasterizer.dpi}", load_image)
+    
+    # Pinned until every page has been read
+    async with pdf_rasterizer.open_pages(file_url, content_hash) as pages:
+        results = await asyncio.gather(*[analyze_page(page) for page in pages], return_exceptions=True)
+    analyzed = []
+    for page, result in zip(pages, results):
+        if isinstance(result, Exception):
+            logging.error(f"AI analysis failed for page {page['page']}: {str(result)}")
+        else:
+            analyzed.append((page["page"], result))
+    if not analyzed:
+        raise ValueError("No PDF page could be analyzed")
+    if len(analyzed) == 1:
+        return analyzed[0][1]
+    return merge_page_results(analyzed)
+
+def is_pdf(file_url: str, file_type: Optional[str] = None) -> bool:
+    return file_type == "pdf" or file_url.split('?')[0].lower().endswith(".pdf")
+
+async def analyze_floorplan_with_ai(file_url: str, content_hash: Optional[str] = None,
+                                    file_type: Optional[str] = None) -> dict:
+    """Use AI to analyze floor plan image and extract structure"""
+    # Cloudinary URLs are versioned, so the URL stands in for plans uploaded before hashing
+    content_hash = content_hash or hashlib.sha256(file_url.encode('utf-8')).hexdigest()
+    try:
+        if is_pdf(file_url, file_type) and pdf_rasterizer.available:
+            return await analyze_pdf_pages(file_url, content_hash)
+        return await cached_analysis(content_hash, lambda: analysis_image_url(file_url))
     except Exception as e:
         logging.error(f"AI analysis failed: {str(e)}")
-        # Fallback to mock data if AI fails
+        # Fallback to mock data if AI fails (never cached)
         return {
             "rooms": [
                 {"id": "room1", "type": "living", "width": 5, "depth": 4, "height": 2.8},
@@ -356,20 +901,53 @@ async def analyze_floorplan_with_ai(file_url: str) -> dict:
             "windows": [{"position": [1, 2.8], "width": 1.2, "height": 1.5}]
         }
 
-@api_router.post("/floorplans/{floorplan_id}/convert-3d")
-async def convert_to_3d(floorplan_id: str):
-    floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0})
+@api_router.get("/analysis-cache/stats")
+async def get_analysis_cache_stats():
+    return await analysis_cache.stats()
+
+def job_accepted(job: dict) -> JSONResponse:
+    """202 response pointing the client at the job status and event stream."""
+    return JSONResponse(status_code=202, content={
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['id']}",
+        "events_url": f"/api/jobs/{job['id']}/events"
+    })
+
+async def set_floorplan_status(floorplan_id: str, status: str, extra: dict = None):
+    fields = {"status": status, "error": None, "updated_at": datetime.now(timezone.utc)}
+    if extra:
+        fields.update(extra)
+    await db.floorplans.update_one({"id": floorplan_id}, await floorplan_update(fields))
+
+async def run_convert_3d(ctx) -> dict:
+    floorplan = await db.floorplans.find_one(
+        {"id": ctx.floorplan_id},
+        {"_id": 0, "file_url": 1, "file_hash": 1, "file_type": 1, **blob_projection("canvas_data")}
+    )
     if not floorplan:
-        raise HTTPException(status_code=404, detail="Floor plan not found")
+        raise ValueError("Floor plan not found")
+    await set_floorplan_status(ctx.floorplan_id, "processing")
     
     # Check if file_url exists for AI analysis
     three_d_data = None
+    canvas = {}
+    if not floorplan.get('file_url'):
+        canvas = parse_canvas((await load_blobs(floorplan, ["canvas_data"])).get('canvas_data'))
     if floorplan.get('file_url'):
-        logging.info(f"Using AI analysis for floor plan {floorplan_id}")
-        three_d_data = await analyze_floorplan_with_ai(floorplan['file_url'])
+        logging.info(f"Using AI analysis for floor plan {ctx.floorplan_id}")
+        await ctx.progress(10, "Analisi AI della piantina in corso")
+        three_d_data = await analyze_floorplan_with_ai(
+            floorplan['file_url'], floorplan.get('file_hash'), floorplan.get('file_type')
+        )
+    elif canvas.get('walls'):
+        logging.info(f"Detecting rooms in canvas drawing for floor plan {ctx.floorplan_id}")
+        await ctx.progress(10, "Rilevamento stanze dal disegno")
+        three_d_data = await canvas_scene(canvas)
     else:
         # Fallback to mock data for canvas drawings
-        logging.info(f"Using mock data for floor plan {floorplan_id} (no file URL)")
+        logging.info(f"Using mock data for floor plan {ctx.floorplan_id} (no file URL)")
         three_d_data = {
             "rooms": [
                 {"id": "room1", "type": "living", "width": 5, "depth": 4, "height": 2.8},
@@ -383,56 +961,309 @@ async def convert_to_3d(floorplan_id: str):
             "windows": [{"position": [1, 2.8], "width": 1.2, "height": 1.5}]
         }
     
-    await db.floorplans.update_one(
-        {"id": floorplan_id},
-        {"$set": {
-            "three_d_data": json.dumps(three_d_data),
-            "status": "ready",
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+    await ctx.progress(80, "Normalizzazione della geometria")
+    three_d_data, normalization = await normalized_scene(ctx.floorplan_id, three_d_data)
+    
+    await ctx.progress(90, "Salvataggio del modello 3D")
+    await set_floorplan_status(ctx.floorplan_id, "ready", {"three_d_data": json.dumps(three_d_data)})
+    
+    return {"three_d_data": three_d_data, "normalization": normalization}
+
+# Editor default: 0.1 canvas pixels per cm
+DEFAULT_CANVAS_SCALE = 0.1
+
+def parse_canvas(canvas_data: Optional[str]) -> dict:
+    if not canvas_data:
+        return {}
+    try:
+        canvas = json.loads(canvas_data)
+    except (TypeError, ValueError):
+        return {}
+    return canvas if isinstance(canvas, dict) else {}
+
+async def detect_canvas_rooms(walls: list, snap_tolerance: float = SNAP_TOLERANCE,
+                              min_area: float = MIN_ROOM_AREA) -> list:
+    return await run_in_process(detect_rooms, walls, snap_tolerance, min_area)
+
+async def canvas_scene(canvas: dict) -> dict:
+    """3D data for a plan drawn in the editor: its walls, plus the rooms they enclose."""
+    walls = canvas.get("walls") or []
+    pixels_per_meter = float(canvas.get("scale") or DEFAULT_CANVAS_SCALE) * 100
+    rooms = await detect_canvas_rooms(walls)
+    return {
+        "rooms": rooms_to_scene(rooms, pixels_per_meter),
+        "walls": walls_to_scene(walls, pixels_per_meter),
+        "doors": [],
+        "windows": []
+    }
+
+async def normalized_scene(floorplan_id: str, three_d_data: dict) -> tuple:
+    """three_d_data after the geometry normalization pass, with its report (None if it failed)."""
+    try:
+        normalized, report = await run_in_process(normalize_scene, three_d_data)
+    except Exception as e:
+        logging.error(f"Geometry normalization failed for floor plan {floorplan_id}: {str(e)}")
+        return three_d_data, None
+    logging.info(
+        f"Normalized floor plan {floorplan_id}: {report['elements_before']} -> {report['elements_after']} elements "
+        f"({report['before']} -> {report['after']})"
     )
+    return normalized, report
+
+async def mark_floorplan_error(ctx, error: Exception):
+    await set_floorplan_status(ctx.floorplan_id, "error", {"error": str(error)})
+
+@api_router.post("/geometry/detect-rooms")
+async def detect_rooms_endpoint(request: RoomDetectionRequest):
+    rooms = await detect_canvas_rooms(request.walls, request.snap_tolerance, request.min_area)
+    return {"rooms": rooms}
+
+@api_router.get("/floorplans/{floorplan_id}/rooms")
+async def get_floorplan_rooms(floorplan_id: str):
+    floorplan = await db.floorplans.find_one(
+        {"id": floorplan_id}, {"_id": 0, "id": 1, **blob_projection("canvas_data")}
+    )
+    if not floorplan:
+        raise HTTPException(status_code=404, detail="Floor plan not found")
+    canvas = parse_canvas((await load_blobs(floorplan, ["canvas_data"])).get('canvas_data'))
+    return {"rooms": await detect_canvas_rooms(canvas.get("walls") or [])}
+
+@api_router.post("/floorplans/{floorplan_id}/normalize")
+async def normalize_floorplan(floorplan_id: str):
+    """Re-runs the normalization pass on the stored 3D data (e.g. after editing it)."""
+    floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0, **blob_projection("three_d_data")})
+    if not floorplan:
+        raise HTTPException(status_code=404, detail="Floor plan not found")
+    current_data = (await load_blobs(floorplan, ["three_d_data"])).get('three_d_data')
+    if not current_data:
+        raise HTTPException(status_code=400, detail="Floor plan has no 3D data")
     
-    return {"message": "Conversion completed", "three_d_data": three_d_data}
+    three_d_data, normalization = await normalized_scene(floorplan_id, json.loads(current_data))
+    if normalization is None:
+        raise HTTPException(status_code=500, detail="Geometry normalization failed")
+    await db.floorplans.update_one({"id": floorplan_id}, await floorplan_update({
+        "three_d_data": json.dumps(three_d_data),
+        "updated_at": datetime.now(timezone.utc)
+    }))
+    return {"three_d_data": three_d_data, "normalization": normalization}
 
-async def restyle_floorplan_with_ai(three_d_data: dict, style: str) -> dict:
-    """Use AI to apply a style to the floor plan 3D data"""
+@api_router.get("/floorplans/{floorplan_id}/mesh.glb")
+async def get_floorplan_mesh(floorplan_id: str, v: Optional[str] = None):
+    """The 3D data baked into a binary glTF.
+
+    Redirects to `mesh.glb?v=<mesh hash>`, which is served as immutable:
+    clients revalidate the short redirect and reuse the mesh until the
+    geometry or style changes.
+    """
+    floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0, **blob_projection("three_d_data")})
+    if not floorplan:
+        raise HTTPException(status_code=404, detail="Floor plan not found")
+    current_data = (await load_blobs(floorplan, ["three_d_data"])).get('three_d_data')
+    if not current_data:
+        raise HTTPException(status_code=404, detail="Floor plan has no 3D data")
+    
+    three_d_data = json.loads(current_data)
+    key = mesh_hash(three_d_data)
+    if v != key:
+        return RedirectResponse(f"mesh.glb?v={key}", status_code=307, headers={"Cache-Control": CACHE_CONTROL})
+    # Streamed from an open handle, so cache eviction cannot remove it mid-response
+    handle = await mesh_baker.open_glb(key, three_d_data)
+    return StreamingResponse(read_chunks(handle), media_type="model/gltf-binary", headers={
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "ETag": f'"{key}"',
+        "Content-Length": str(os.fstat(handle.fileno()).st_size),
+    })
+
+async def read_chunks(handle, chunk_size: int = 256 * 1024):
+    """Yields an open binary file in chunks, read off the event loop, and closes it."""
     try:
-        client = AsyncOpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
-        
-        system_prompt = """Sei un interior designer. Il tuo compito è modificare il JSON di una piantina 3D per applicare uno stile specifico.
-        Riceverai in input: { "style": "...", "data": ... }
-        Devi restituire SOLO il JSON modificato, aggiungendo o aggiornando le proprietà 'color' (hex) agli oggetti 'walls' e 'rooms'.
-        
-        Esempio modifiche:
-        - "Industrial": walls color #7d7d7d (cemento), floor color #4a4a4a (resina scura)
-        - "Scandinavian": walls color #f0f0f0 (bianco sporco), floor color #d2b48c (legno chiaro)
-        
-        Mantieni intatta la struttura geometria, cambia solo i colori.
-        Restituisci JSON puro."""
-
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": json.dumps({"style": style, "data": three_d_data})}
-            ],
-            response_format={"type": "json_object"}
+        while chunk := await asyncio.to_thread(handle.read, chunk_size):
+            yield chunk
+    finally:
+        handle.close()
+
+@api_router.post("/floorplans/{floorplan_id}/convert-3d", status_code=202)
+async def convert_to_3d(floorplan_id: str):
+    floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0, "id": 1})
+    if not floorplan:
+        raise HTTPException(status_code=404, detail="Floor plan not found")
+    
+    job = await job_runner.submit("convert-3d", floorplan_id=floorplan_id)
+    if job["status"] == "queued":
+        await set_floorplan_status(floorplan_id, "processing")
+    return job_accepted(job)
+
+BATCH_FILE_TYPES = ("pdf", "image")
+
+def plan_name(filename: str) -> str:
+    return os.path.splitext(filename)[0] or filename
+
+async def spool_batch_files(files: List[UploadFile]) -> tuple:
+    """Spools every file of a batch request, expanding ZIPs, and returns (uploads, rejected).
+
+    Rejected files are (filename, reason) pairs: too large, or not a PDF or image.
+    """
+    uploads, rejected = [], []
+    try:
+        for file in files:
+            try:
+                spooled = await spool_upload(file)
+            except UploadTooLarge as e:
+                rejected.append((file.filename, str(e)))
+                continue
+            if spooled.file_type != 'zip':
+                uploads.append(spooled)
+                continue
+            try:
+                members, too_large = await asyncio.to_thread(
+                    expand_zip, spooled.path, BATCH_MAX_FILES - len(uploads) - len(rejected)
+                )
+            finally:
+                spooled.discard()
+            uploads += members
+            rejected += too_large
+        if len(uploads) + len(rejected) > BATCH_MAX_FILES:
+            raise ArchiveError(f"A batch holds at most {BATCH_MAX_FILES} files")
+    except BaseException:
+        for spooled in uploads:
+            spooled.discard()
+        raise
+    
+    accepted = []
+    for spooled in uploads:
+        if spooled.file_type in BATCH_FILE_TYPES:
+            accepted.append(spooled)
+        else:
+            rejected.append((spooled.filename, "Unsupported file type, expected a PDF or an image"))
+            spooled.discard()
+    return accepted, rejected
+
+@api_router.post("/floorplans/batch", response_model=Batch, status_code=202)
+async def create_floorplan_batch(
+    files: List[UploadFile] = File(...),
+    user_id: str = Form(...),
+    convert: bool = Form(True),
+    concurrency: Optional[int] = Form(None, ge=1, le=BATCH_MAX_CONCURRENCY)
+):
+    """Creates a plan per file (ZIPs are expanded) and uploads and converts them in the background.
+
+    Poll /api/batches/{id} for per-file progress.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {BATCH_MAX_FILES} files")
+    try:
+        uploads, rejected = await spool_batch_files(files)
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        plans = [
+            FloorPlan(user_id=user_id, name=plan_name(spooled.filename), file_type=spooled.file_type)
+            for spooled in uploads
+        ]
+        if plans:
+            await db.floorplans.insert_many([plan.model_dump() for plan in plans])
+        items = [
+            batch_item(index, spooled.filename, plan.id, spooled)
+            for index, (spooled, plan) in enumerate(zip(uploads, plans))
+        ]
+        items += [
+            batch_item(len(plans) + index, filename, error=reason)
+            for index, (filename, reason) in enumerate(rejected)
+        ]
+        batch = await batch_ingest.create(user_id, items, convert, concurrency)
+        job = await job_runner.submit("batch-ingest", {"batch_id": batch["id"]})
+    except BaseException:
+        for spooled in uploads:
+            spooled.discard()
+        raise
+    
+    batch["job_id"] = job["id"]
+    await batch_ingest.update(batch["id"], {"job_id": job["id"]})
+    logging.info(f"Batch {batch['id']}: {len(plans)} floor plans queued, {len(rejected)} files rejected")
+    return public_batch(batch)
+
+@api_router.get("/batches/{batch_id}", response_model=Batch)
+async def get_batch(batch_id: str):
+    batch = await batch_ingest.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return public_batch(batch)
+
+async def ingest_batch_item(batch: dict, item: dict) -> dict:
+    """Uploads one file of a batch and, if asked, converts it to 3D in place of a convert-3d job."""
+    index, floorplan_id = item["index"], item["floorplan_id"]
+    convert = batch["convert"]
+    file_url = item.get("file_url")
+    # Already uploaded when the batch is resumed after a restart
+    if not file_url:
+        if not os.path.exists(item["source_path"]):
+            raise FileNotFoundError("The staged file is no longer available")
+        spooled = SpooledUpload(
+            path=item["source_path"], filename=item["filename"], size=item["size"], sha256=item["sha256"],
+            file_type=item["file_type"], content_type=item["content_type"]
         )
-        
-        content = response.choices[0].message.content
-        return json.loads(content)
+        await batch_ingest.update_item(batch["id"], index, {"progress": 5, "message": "Caricamento del file"})
+        try:
+            stored = await store_upload(floorplan_id, spooled, plan_name(item["filename"]))
+            spooled = None
+        finally:
+            if spooled:
+                spooled.discard()
+        file_url = stored["file_url"]
+        await batch_ingest.update_item(batch["id"], index, {"progress": 30 if convert else 100, "file_url": file_url})
+    
+    if convert:
+        ctx = ItemContext(batch_ingest, batch["id"], index, floorplan_id, start=30)
+        try:
+            await run_convert_3d(ctx)
+        except Exception as e:
+            await mark_floorplan_error(ctx, e)
+            raise
+    return {"file_url": file_url}
+
+async def run_batch_ingest(ctx) -> dict:
+    return await batch_ingest.run(ctx.params["batch_id"], ingest_batch_item, progress=ctx.progress)
+
+async def generate_style_palette_with_ai(style: str) -> dict:
+    """Use AI to turn a free-form style name into a wall/floor color palette"""
+    system_prompt = """Sei un interior designer. Riceverai il nome di uno stile di arredamento.
+    Restituisci SOLO un JSON con i colori (hex) da applicare a una piantina 3D:
+    { "walls": "#rrggbb", "floor": "#rrggbb", "rooms": { "<tipo stanza>": "#rrggbb" } }
+    "rooms" è opzionale e serve solo per stanze con un pavimento diverso (es. "bathroom", "kitchen").
+
+    Esempi:
+    - "Industrial": { "walls": "#7d7d7d", "floor": "#4a4a4a" }
+    - "Scandinavian": { "walls": "#f0f0f0", "floor": "#d2b48c" }"""
+
+    response = await llm_gateway.chat_completion(
+        "openai",
+        model="gpt-4o",
+        max_tokens=200,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": style}
+        ],
+        response_format={"type": "json_object"}
+    )
+    
+    return json.loads(response.choices[0].message.content)
+
+async def restyle_floorplan_with_ai(three_d_data: dict, style: str) -> dict:
+    """Apply a style to the floor plan 3D data; only unknown styles reach the AI"""
+    try:
+        return await style_engine.restyle(three_d_data, style, generate_palette=generate_style_palette_with_ai)
     except Exception as e:
         logging.error(f"AI restyle failed: {str(e)}")
-        # Fallback: simple deterministic color change
+        # Fallback: leave the scene unchanged
         return three_d_data
 
-@api_router.post("/floorplans/{floorplan_id}/restyle")
-async def restyle_floorplan(floorplan_id: str, request: RestyleRequest):
-    floorplan = await db.floorplans.find_one({"id": floorplan_id})
+async def apply_restyle(floorplan_id: str, style: str) -> dict:
+    floorplan = await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0, **blob_projection("three_d_data")})
     if not floorplan:
         raise HTTPException(status_code=404, detail="Floor plan not found")
     
-    current_data = floorplan.get('three_d_data')
+    current_data = (await load_blobs(floorplan, ["three_d_data"])).get('three_d_data')
     if isinstance(current_data, str):
         current_data = json.loads(current_data)
         
@@ -440,16 +1271,31 @@ async def restyle_floorplan(floorplan_id: str, request: RestyleRequest):
          raise HTTPException(status_code=400, detail="No 3D data to restyle")
     
     # Apply AI styling
-    new_data = await restyle_floorplan_with_ai(current_data, request.style)
+    new_data = await restyle_floorplan_with_ai(current_data, style)
     
     await db.floorplans.update_one(
         {"id": floorplan_id},
-        {"$set": {
+        await floorplan_update({
             "three_d_data": json.dumps(new_data),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+            "updated_at": datetime.now(timezone.utc)
+        })
     )
+    return new_data
+
+async def run_restyle(ctx) -> dict:
+    await ctx.progress(10, f"Applicazione stile {ctx.params['style']}")
+    new_data = await apply_restyle(ctx.floorplan_id, ctx.params["style"])
+    return {"three_d_data": new_data}
+
+@api_router.post("/floorplans/{floorplan_id}/restyle")
+async def restyle_floorplan(floorplan_id: str, request: RestyleRequest, background: bool = False):
+    if background:
+        if not await db.floorplans.find_one({"id": floorplan_id}, {"_id": 0, "id": 1}):
+            raise HTTPException(status_code=404, detail="Floor plan not found")
+        job = await job_runner.submit("restyle", {"style": request.style}, floorplan_id=floorplan_id)
+        return job_accepted(job)
     
+    new_data = await apply_restyle(floorplan_id, request.style)
     return {"message": "Restyle applied", "three_d_data": new_data}
 
 # Chat endpoints
@@ -459,87 +1305,85 @@ async def create_conversation(input: ConversationCreate):
     conv_obj = Conversation(**conv_dict)
     
     doc = conv_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    
     await db.conversations.insert_one(doc)
     return conv_obj
 
 @api_router.get("/conversations", response_model=List[Conversation])
-async def get_conversations(user_id: str):
-    conversations = await db.conversations.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    for conv in conversations:
-        if isinstance(conv.get('created_at'), str):
-            conv['created_at'] = datetime.fromisoformat(conv['created_at'])
-    
-    return conversations
+async def get_conversations(
+    request: Request,
+    response: Response,
+    user_id: str,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Optional[str] = None
+):
+    query = {"user_id": user_id}
+    query.update(date_range("created_at", created_after, created_before))
+    return await list_documents(
+        request, response, db.conversations, Conversation, query, "created_at", -1, limit, after, format
+    )
 
 @api_router.get("/conversations/{conversation_id}/messages", response_model=List[Message])
-async def get_messages(conversation_id: str):
-    messages = await db.messages.find({"conversation_id": conversation_id}, {"_id": 0}).sort("timestamp", 1).to_list(1000)
+async def get_messages(
+    request: Request,
+    response: Response,
+    conversation_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Optional[str] = None
+):
+    query = {"conversation_id": conversation_id}
+    query.update(date_range("timestamp", since, until))
+    return await list_documents(
+        request, response, db.messages, Message, query, "timestamp", 1, limit, after, format
+    )
+
+CHAT_SYSTEM_MESSAGE = """Sei un assistente AI esperto in architettura e design 3D. 
+        Aiuti gli utenti a convertire piantine 2D in modelli 3D, suggerisci miglioramenti 
+        e rispondi a domande su design, rendering e layout degli spazi. Impari dalle 
+        preferenze degli utenti e dai loro feedback per offrire suggerimenti sempre più personalizzati."""
+
+def resolve_chat_model(requested: Optional[str]):
+    """Determine provider and model from the requested model name"""
+    provider = "openai"
+    model = requested or "gpt-5.1"
     
-    for msg in messages:
-        if isinstance(msg.get('timestamp'), str):
-            msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
+    if requested and requested.startswith("gpt"):
+        provider = "openai"
+    elif requested and requested.startswith("claude"):
+        provider = "anthropic"
+    elif requested and requested.startswith("gemini"):
+        provider = "gemini"
     
-    return messages
+    return provider, model
+
+async def store_message(conversation_id: str, role: str, content: str, model: Optional[str] = None) -> Message:
+    message = Message(conversation_id=conversation_id, role=role, content=content, model=model)
+    await db.messages.insert_one(message.model_dump())
+    return message
 
 @api_router.post("/chat")
 async def chat_with_ai(request: ChatRequest):
+    provider, model = resolve_chat_model(request.model)
+    try:
+        llm_gateway.client(provider)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
     try:
         # Store user message
-        user_msg = Message(
-            conversation_id=request.conversation_id,
-            role="user",
-            content=request.message
-        )
-        user_doc = user_msg.model_dump()
-        user_doc['timestamp'] = user_doc['timestamp'].isoformat()
-        await db.messages.insert_one(user_doc)
-        
-        system_message = """Sei un assistente AI esperto in architettura e design 3D. 
-        Aiuti gli utenti a convertire piantine 2D in modelli 3D, suggerisci miglioramenti 
-        e rispondi a domande su design, rendering e layout degli spazi. Impari dalle 
-        preferenze degli utenti e dai loro feedback per offrire suggerimenti sempre più personalizzati."""
+        await store_message(request.conversation_id, "user", request.message)
         
-        # Initialize LlmChat with emergentintegrations
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=request.conversation_id,
-            system_message=system_message
+        response_text = await llm_gateway.complete_chat(
+            provider, model, CHAT_SYSTEM_MESSAGE, [{"role": "user", "content": request.message}]
         )
         
-        # Determine provider and model
-        provider = "openai"
-        model = request.model or "gpt-5.1"
-        
-        if request.model and request.model.startswith("gpt"):
-            provider = "openai"
-            model = request.model
-        elif request.model and request.model.startswith("claude"):
-            provider = "anthropic"
-            model = request.model
-        elif request.model and request.model.startswith("gemini"):
-            provider = "gemini"
-            model = request.model
-        
-        # Set model
-        chat.with_model(provider, model)
-        
-        # Create user message and send
-        user_message = UserMessage(text=request.message)
-        response_text = await chat.send_message(user_message)
-        
         # Store assistant message
-        assistant_msg = Message(
-            conversation_id=request.conversation_id,
-            role="assistant",
-            content=response_text,
-            model=f"{provider}/{model}"
-        )
-        assistant_doc = assistant_msg.model_dump()
-        assistant_doc['timestamp'] = assistant_doc['timestamp'].isoformat()
-        await db.messages.insert_one(assistant_doc)
+        await store_message(request.conversation_id, "assistant", response_text, f"{provider}/{model}")
         
         return {
             "message": response_text,
@@ -549,35 +1393,97 @@ async def chat_with_ai(request: ChatRequest):
         logging.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.post("/chat/stream")
+async def stream_chat_with_ai(request: ChatRequest):
+    """Server-Sent Events variant of /chat that forwards tokens as they arrive.
+
+    Events: `token` ({"delta"}), then `done` ({"message_id", "model"}) or `error`.
+    If the client disconnects the upstream generation is cancelled and no
+    assistant message is stored.
+    """
+    provider, model = resolve_chat_model(request.model)
+    try:
+        llm_gateway.client(provider)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    # Store user message before generation starts
+    await store_message(request.conversation_id, "user", request.message)
+
+    async def event_stream():
+        parts = []
+        try:
+            deltas = llm_gateway.stream_chat(
+                provider, model, CHAT_SYSTEM_MESSAGE, [{"role": "user", "content": request.message}]
+            )
+            # aclosing() shuts the upstream stream even if we are cancelled mid-yield
+            async with aclosing(deltas):
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield sse_event("token", {"delta": delta})
+        except asyncio.CancelledError:
+            logging.info(f"Chat stream cancelled by client for {request.conversation_id}")
+            raise
+        except Exception as e:
+            logging.error(f"Chat stream error: {str(e)}")
+            yield sse_event("error", {"detail": f"Chat failed: {str(e)}"})
+            return
+        
+        # Store assistant message once, when the stream is complete
+        assistant_msg = await store_message(
+            request.conversation_id, "assistant", "".join(parts), f"{provider}/{model}"
+        )
+        yield sse_event("done", {"message_id": assistant_msg.id, "model": f"{provider}/{model}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # User preferences
+async def upsert_user_preferences(user_id: str, fields: dict) -> dict:
+    """Applies `fields` to a user's preferences, creating them with defaults first if needed.
+
+    One atomic round trip: concurrent first requests for a user cannot create
+    two documents (user_id is uniquely indexed). This is a write even when
+    `fields` is empty, so reads only call it on a miss.
+    """
+    defaults = UserPreference(user_id=user_id).model_dump()
+    update = {"$setOnInsert": {k: v for k, v in defaults.items() if k not in fields and k != "user_id"}}
+    if fields:
+        update["$set"] = fields
+    for attempt in range(2):
+        try:
+            return await db.user_preferences.find_one_and_update(
+                {"user_id": user_id}, update,
+                projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost an insert race the server did not retry; the document exists now
+            if attempt:
+                raise
+
 @api_router.get("/preferences/{user_id}", response_model=UserPreference)
-async def get_user_preferences(user_id: str):
+async def get_user_preferences(request: Request, response: Response, user_id: str):
     prefs = await db.user_preferences.find_one({"user_id": user_id}, {"_id": 0})
     if not prefs:
-        # Create default preferences
-        default_prefs = UserPreference(user_id=user_id)
-        doc = default_prefs.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.user_preferences.insert_one(doc)
-        return default_prefs
-    
-    if isinstance(prefs.get('updated_at'), str):
-        prefs['updated_at'] = datetime.fromisoformat(prefs['updated_at'])
+        prefs = await upsert_user_preferences(user_id, {})
     
+    not_modified = conditional_response(request, response, prefs)
+    if not_modified:
+        return not_modified
     return prefs
 
 @api_router.patch("/preferences/{user_id}", response_model=UserPreference)
 async def update_user_preferences(user_id: str, update: UserPreferenceUpdate):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
-    
-    result = await db.user_preferences.update_one(
-        {"user_id": user_id},
-        {"$set": update_data},
-        upsert=True
-    )
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
-    return await get_user_preferences(user_id)
+    return await upsert_user_preferences(user_id, update_data)
 
 # Feedback endpoints
 @api_router.post("/feedback", response_model=Feedback)
@@ -586,94 +1492,153 @@ async def create_feedback(input: FeedbackCreate):
     feedback_obj = Feedback(**feedback_dict)
     
     doc = feedback_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    
-    await db.feedback.insert_one(doc)
+    writes = [db.feedback.insert_one(doc)]
     
     # Learn from feedback (simple implementation)
     if feedback_obj.feedback_type == "suggestion":
-        # Store suggestion for future use
-        await db.learning_data.insert_one({
+        # Store suggestion for future use; independent of the feedback insert, so sent alongside it
+        writes.append(db.learning_data.insert_one({
             "user_id": feedback_obj.user_id,
             "type": "suggestion",
             "content": feedback_obj.content,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        })
+            "timestamp": datetime.now(timezone.utc)
+        }))
+    await asyncio.gather(*writes)
     
     return feedback_obj
 
 @api_router.get("/feedback", response_model=List[Feedback])
-async def get_feedback(user_id: Optional[str] = None):
+async def get_feedback(
+    request: Request,
+    response: Response,
+    user_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Optional[str] = None
+):
     query = {"user_id": user_id} if user_id else {}
-    feedback_list = await db.feedback.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    for fb in feedback_list:
-        if isinstance(fb.get('created_at'), str):
-            fb['created_at'] = datetime.fromisoformat(fb['created_at'])
-    
-    return feedback_list
+    query.update(date_range("created_at", created_after, created_before))
+    return await list_documents(
+        request, response, db.feedback, Feedback, query, "created_at", -1, limit, after, format
+    )
 
 # Render endpoint
-@api_router.post("/render")
-async def create_render(request: RenderRequest):
-    floorplan = await db.floorplans.find_one({"id": request.floor_plan_id}, {"_id": 0})
+async def build_render(floor_plan_id: str, quality: str, style: str) -> dict:
+    """Top-down and isometric PNGs of the plan's 3D data, from the render cache when possible."""
+    started = time.perf_counter()
+    floorplan = await db.floorplans.find_one({"id": floor_plan_id}, {"_id": 0, **blob_projection("three_d_data")})
     if not floorplan:
         raise HTTPException(status_code=404, detail="Floor plan not found")
     
-    if not floorplan.get('three_d_data'):
+    current_data = (await load_blobs(floorplan, ["three_d_data"])).get('three_d_data')
+    if not current_data:
         raise HTTPException(status_code=400, detail="Floor plan not converted to 3D yet")
     
-    # Mock render process - in production, this would trigger actual rendering
-    render_result = {
+    try:
+        key, manifest, cached = await render_cache.render(json.loads(current_data), style, quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    renders = {view: f"/api/renders/{key}/{view}.png" for view in RENDER_VIEWS}
+    elapsed = time.perf_counter() - started
+    return {
         "status": "completed",
-        "quality": request.quality,
-        "style": request.style,
-        "render_url": floorplan.get('file_url', ''),
-        "processing_time": "15s"
+        "quality": quality,
+        "style": style,
+        "render_url": renders["isometric"],
+        "renders": renders,
+        "views": manifest["views"],
+        "cached": cached,
+        "render_ms": manifest["render_ms"],
+        "processing_time": f"{elapsed:.2f}s"
     }
+
+async def run_render(ctx) -> dict:
+    return await build_render(ctx.floorplan_id, ctx.params["quality"], ctx.params["style"])
+
+@api_router.get("/renders/{key}/{view}.png")
+async def get_render(key: str, view: str):
+    """A cached render; the key covers geometry, colors, style and quality, so it never changes."""
+    if view not in RENDER_VIEWS or not key.isalnum():
+        raise HTTPException(status_code=404, detail="Render not found")
+    path = render_cache.view_path(key, view)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Render not found")
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+
+@api_router.post("/render")
+async def create_render(request: RenderRequest, background: bool = False):
+    if background:
+        if not await db.floorplans.find_one({"id": request.floor_plan_id}, {"_id": 0, "id": 1}):
+            raise HTTPException(status_code=404, detail="Floor plan not found")
+        job = await job_runner.submit(
+            "render", {"quality": request.quality, "style": request.style}, floorplan_id=request.floor_plan_id
+        )
+        return job_accepted(job)
     
-    return render_result
+    return await build_render(request.floor_plan_id, request.quality, request.style)
+
+# Jobs
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    job = await job_runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """Server-Sent Events stream of job progress; ends when the job finishes."""
+    if not await job_runner.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for job in job_runner.watch(job_id):
+            if await request.is_disconnected():
+                break
+            if job is None:
+                yield ": keep-alive\n\n"
+                continue
+            payload = Job(**job).model_dump_json()
+            yield f"event: {job['status']}\ndata: {payload}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def register_jobs():
+    job_runner.register("convert-3d", run_convert_3d, on_failure=mark_floorplan_error)
+    job_runner.register("restyle", run_restyle)
+    job_runner.register("render", run_render)
+    job_runner.register("derivatives", run_derivatives)
+    job_runner.register("batch-ingest", run_batch_ingest)
+
+register_jobs()
+
+@api_router.get("/llm/stats")
+async def get_llm_stats():
+    return llm_gateway.stats()
 
 @api_router.get("/proxy-image")
-async def proxy_image(url: str):
+async def proxy_image(request: Request, url: str):
     """Proxy endpoint to bypass CORS for images"""
     try:
-        import httpx
-        
-        # Add Cloudinary authentication if needed
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
-            logging.info(f"Proxying image from: {url}")
-            response = await client.get(url, headers=headers)
-            
-            logging.info(f"Proxy response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                logging.error(f"Failed to fetch image: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code, 
-                    detail=f"Cloudinary returned {response.status_code}"
-                )
-            
-            return Response(
-                content=response.content,
-                media_type=response.headers.get('content-type', 'image/jpeg'),
-                headers={
-                    'Cache-Control': 'public, max-age=31536000',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET',
-                    'Access-Control-Allow-Headers': '*'
-                }
-            )
-    except httpx.HTTPError as e:
-        logging.error(f"HTTP error proxying image: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"HTTP error: {str(e)}")
-    except Exception as e:
-        logging.error(f"Proxy image error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Proxy error: {str(e)}")
+        return await image_proxy.serve(url, request.headers)
+    except ProxyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@api_router.get("/proxy-image/stats")
+async def get_image_proxy_stats():
+    return {
+        **image_proxy.stats,
+        "entries": len(image_proxy.cache.entries),
+        "cached_bytes": image_proxy.cache.total,
+        "max_bytes": image_proxy.cache.max_bytes,
+    }
 
 # Include router
 app.include_router(api_router)
@@ -684,7 +1649,10 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link", "ETag"],
 )
+# Added last, so it is outermost and compresses the final response
+app.add_middleware(CompressionMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -692,7 +1660,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
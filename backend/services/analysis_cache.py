@@ -0,0 +1,97 @@
+import os
+import hashlib
+import logging
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_TTL_DAYS = int(os.environ.get('ANALYSIS_CACHE_TTL_DAYS', 90))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 20000))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def analysis_cache_key(content_hash: str, model: str, prompt: str) -> str:
+    """Key for an analysis result: same image + same model + same prompt -> same key."""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    return hashlib.sha256(f"{content_hash}:{model}:{prompt_hash}".encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """Persistent cache of AI floor plan analyses keyed by content hash.
+
+    Entries expire through a Mongo TTL index; once the collection grows past
+    max_entries the least recently used entries are evicted.
+    """
+
+    def __init__(self, collection, ttl_days: int = ANALYSIS_CACHE_TTL_DAYS,
+                 max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES, evict_every: int = 100):
+        self.collection = collection
+        self.ttl = timedelta(days=ttl_days)
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    async def get(self, key: str):
+        """Returns the cached result and refreshes its recency, or None."""
+        now = _now()
+        entry = await self.collection.find_one_and_update(
+            {"key": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_hit_at": now}, "$inc": {"hits": 1}},
+            projection={"_id": 0, "result": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["result"]
+
+    async def put(self, key: str, result: dict, model: str, content_hash: str):
+        now = _now()
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {
+                "key": key,
+                "result": result,
+                "model": model,
+                "content_hash": content_hash,
+                "created_at": now,
+                "last_hit_at": now,
+                "expires_at": now + self.ttl,
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True,
+        )
+        self.stores += 1
+        if self.stores % self.evict_every == 0:
+            await self.evict()
+
+    async def evict(self) -> int:
+        """Deletes the least recently used entries above max_entries."""
+        excess = await self.collection.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return 0
+        cursor = self.collection.find({}, {"_id": 1}).sort("last_hit_at", 1).limit(excess)
+        ids = [doc["_id"] async for doc in cursor]
+        result = await self.collection.delete_many({"_id": {"$in": ids}})
+        self.evictions += result.deleted_count
+        logger.info(f"Evicted {result.deleted_count} analysis cache entries")
+        return result.deleted_count
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": await self.collection.estimated_document_count(),
+            "max_entries": self.max_entries,
+        }
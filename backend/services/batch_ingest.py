@@ -0,0 +1,179 @@
+import os
+import uuid
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 16))
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 200))
+
+ITEM_TERMINAL_STATES = ("done", "failed")
+
+# Internal item fields, not returned by the API
+PRIVATE_ITEM_FIELDS = ("source_path", "sha256", "content_type")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def batch_item(index: int, filename: str, floorplan_id: str = None, spooled=None, error: str = None) -> dict:
+    """An item of a new batch: a staged upload for a plan, or a file rejected up front."""
+    item = {
+        "index": index,
+        "filename": filename,
+        "floorplan_id": floorplan_id,
+        "file_type": spooled.file_type if spooled else None,
+        "size": spooled.size if spooled else None,
+        "status": "failed" if error else "queued",
+        "progress": 0,
+        "message": None,
+        "error": error,
+        "file_url": None,
+        "started_at": None,
+        "finished_at": None,
+    }
+    if spooled:
+        item.update(source_path=spooled.path, sha256=spooled.sha256, content_type=spooled.content_type)
+    return item
+
+
+def public_batch(batch: dict, now: datetime = None) -> dict:
+    """The batch as returned by the API: items without staging details, plus its summary."""
+    items = [{k: v for k, v in item.items() if k not in PRIVATE_ITEM_FIELDS} for item in batch["items"]]
+    return {**{k: v for k, v in batch.items() if k != "items"}, "items": items, "summary": batch_summary(batch, now)}
+
+
+def batch_summary(batch: dict, now: datetime = None) -> dict:
+    """Counts per status, overall progress, throughput of the finished items and the failures."""
+    items = batch["items"]
+    counts = Counter(item["status"] for item in items)
+    done = [item for item in items if item["status"] == "done"]
+    started, finished = batch.get("started_at"), batch.get("finished_at") or now or _now()
+    elapsed = (finished - started).total_seconds() if started else 0.0
+    done_bytes = sum(item.get("size") or 0 for item in done)
+    return {
+        "total": len(items),
+        "counts": dict(counts),
+        "done": len(done),
+        "failed": counts["failed"],
+        "progress": round(sum(
+            100 if item["status"] in ITEM_TERMINAL_STATES else item.get("progress") or 0 for item in items
+        ) / len(items)) if items else 100,
+        "elapsed_seconds": round(elapsed, 3),
+        "bytes": done_bytes,
+        "files_per_second": round(len(done) / elapsed, 3) if elapsed > 0 else None,
+        "bytes_per_second": round(done_bytes / elapsed) if elapsed > 0 else None,
+        "failures": [
+            {"index": item["index"], "filename": item["filename"], "error": item.get("error")}
+            for item in items if item["status"] == "failed"
+        ],
+    }
+
+
+class ItemContext:
+    """Stands in for a JobContext when a job handler runs inline as a step of a batch item.
+
+    The handler's 0-100 progress is mapped onto the item's `start`..`end` range.
+    """
+
+    def __init__(self, batches, batch_id: str, index: int, floorplan_id: str,
+                 start: int = 0, end: int = 100, params: dict = None):
+        self.batches = batches
+        self.batch_id = batch_id
+        self.index = index
+        self.floorplan_id = floorplan_id
+        self.params = params or {}
+        self.start = start
+        self.end = end
+
+    async def progress(self, progress: int, message: str = None):
+        value = self.start + (self.end - self.start) * progress // 100
+        await self.batches.update_item(self.batch_id, self.index, {"progress": value, "message": message})
+
+
+class BatchIngest:
+    """Multi-file ingestion batches: one document per batch with an entry per file.
+
+    The items of a batch are processed by a caller-supplied coroutine with at
+    most `concurrency` in flight. Finished items are skipped when a batch is
+    run again, so a batch picked up after a restart resumes where it stopped.
+    """
+
+    def __init__(self, collection, concurrency: int = BATCH_CONCURRENCY):
+        self.collection = collection
+        self.concurrency = max(1, concurrency)
+
+    async def create(self, user_id: str, items: list, convert: bool, concurrency: int = None) -> dict:
+        now = _now()
+        batch = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "status": "queued",
+            "convert": convert,
+            "concurrency": max(1, min(concurrency or self.concurrency, BATCH_MAX_CONCURRENCY)),
+            "job_id": None,
+            "items": items,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "updated_at": now,
+        }
+        await self.collection.insert_one(dict(batch))
+        return batch
+
+    async def get(self, batch_id: str) -> dict:
+        return await self.collection.find_one({"id": batch_id}, {"_id": 0})
+
+    async def update(self, batch_id: str, fields: dict):
+        await self.collection.update_one({"id": batch_id}, {"$set": {**fields, "updated_at": _now()}})
+
+    async def update_item(self, batch_id: str, index: int, fields: dict):
+        """Sets fields of one item in place, without rewriting the others."""
+        update = {f"items.{index}.{key}": value for key, value in fields.items()}
+        await self.collection.update_one({"id": batch_id}, {"$set": {**update, "updated_at": _now()}})
+
+    async def run(self, batch_id: str, process, progress=None) -> dict:
+        """Runs `async process(batch, item)` for every unfinished item and returns the summary.
+
+        An exception from `process` fails that item only. `progress(pct, message)`
+        is awaited as items finish.
+        """
+        batch = await self.get(batch_id)
+        if not batch:
+            raise ValueError(f"Batch {batch_id} not found")
+        pending = [item for item in batch["items"] if item["status"] not in ITEM_TERMINAL_STATES]
+        started_at = batch.get("started_at") or _now()
+        await self.update(batch_id, {"status": "running", "started_at": started_at})
+        semaphore = asyncio.Semaphore(batch["concurrency"])
+        finished = len(batch["items"]) - len(pending)
+
+        async def run_item(item):
+            nonlocal finished
+            async with semaphore:
+                await self.update_item(batch_id, item["index"], {"status": "running", "started_at": _now()})
+                try:
+                    fields = await process(batch, item) or {}
+                    fields.update(status="done", progress=100, message=None)
+                except Exception as e:
+                    logger.error(f"Batch {batch_id} item {item['index']} ({item['filename']}) failed: {e}")
+                    fields = {"status": "failed", "error": str(e)}
+                fields["finished_at"] = _now()
+                await self.update_item(batch_id, item["index"], fields)
+            finished += 1
+            if progress:
+                await progress(finished * 100 // len(batch["items"]), f"{finished}/{len(batch['items'])} file elaborati")
+
+        await asyncio.gather(*[run_item(item) for item in pending])
+        await self.update(batch_id, {"status": "completed", "finished_at": _now()})
+        batch = await self.get(batch_id)
+        summary = batch_summary(batch)
+        logger.info(
+            f"Batch {batch_id}: {summary['done']}/{summary['total']} done, {summary['failed']} failed "
+            f"in {summary['elapsed_seconds']}s ({summary['files_per_second']} files/s)"
+        )
+        return summary
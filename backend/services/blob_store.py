@@ -0,0 +1,149 @@
+import os
+import gzip
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from cachetools import LRUCache
+from pymongo import UpdateOne
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is used without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+BLOB_COMPRESSION = os.environ.get('BLOB_COMPRESSION', 'zstd' if zstandard else 'gzip')
+BLOB_CACHE_BYTES = int(os.environ.get('BLOB_CACHE_BYTES', 64 * 1024 * 1024))
+# Payloads above this are (de)compressed in a worker thread
+BLOB_THREAD_THRESHOLD = 256 * 1024
+
+
+def compress(raw: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    if encoding == "gzip":
+        return gzip.compress(raw, compresslevel=6)
+    raise ValueError(f"Unknown blob encoding '{encoding}'")
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"Unknown blob encoding '{encoding}'")
+
+
+class BlobStore:
+    """Compressed, content-addressed storage for large text payloads.
+
+    Blobs are keyed by the sha256 of their text, so identical payloads are
+    stored once and a stored blob never changes. Documents keep a small
+    reference ({"hash", "size", "stored_size", "encoding"}) and load the text
+    only when needed; recently read blobs are kept decompressed in memory.
+    """
+
+    def __init__(self, collection, encoding: str = BLOB_COMPRESSION, cache_bytes: int = BLOB_CACHE_BYTES):
+        if encoding == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, falling back to gzip blobs")
+            encoding = "gzip"
+        self.collection = collection
+        self.encoding = encoding
+        self._cache = LRUCache(maxsize=cache_bytes, getsizeof=len)
+
+    async def put(self, text: str) -> dict:
+        """Stores `text` (once per distinct content) and returns its reference."""
+        return (await self.put_many([text]))[0]
+
+    async def put_many(self, texts: list) -> list:
+        """Stores several texts with one unordered bulk write; returns their references in order."""
+        refs, writes = [], {}
+        now = datetime.now(timezone.utc)
+        for text in texts:
+            raw = text.encode('utf-8')
+            digest = hashlib.sha256(raw).hexdigest()
+            if len(raw) > BLOB_THREAD_THRESHOLD:
+                data = await asyncio.to_thread(compress, raw, self.encoding)
+            else:
+                data = compress(raw, self.encoding)
+            ref = {"hash": digest, "size": len(raw), "stored_size": len(data), "encoding": self.encoding}
+            refs.append(ref)
+            writes[digest] = UpdateOne(
+                {"hash": digest},
+                {"$setOnInsert": {**ref, "data": data, "created_at": now}, "$set": {"stored_at": now}},
+                upsert=True,
+            )
+            self._remember(digest, text)
+        if writes:
+            await self.collection.bulk_write(list(writes.values()), ordered=False)
+        return refs
+
+    async def get(self, ref: dict) -> str:
+        digest = ref["hash"]
+        text = self._cache.get(digest)
+        if text is not None:
+            return text
+        blob = await self.collection.find_one({"hash": digest}, {"_id": 0, "data": 1, "encoding": 1})
+        if blob is None:
+            raise KeyError(f"Blob {digest} not found")
+        if len(blob["data"]) > BLOB_THREAD_THRESHOLD:
+            text = await asyncio.to_thread(self._decode, blob)
+        else:
+            text = self._decode(blob)
+        self._remember(digest, text)
+        return text
+
+    async def get_many(self, refs) -> dict:
+        """Loads several blobs in one query; returns hash -> text."""
+        texts, missing = {}, set()
+        for ref in refs:
+            text = self._cache.get(ref["hash"])
+            if text is None:
+                missing.add(ref["hash"])
+            else:
+                texts[ref["hash"]] = text
+        if missing:
+            cursor = self.collection.find({"hash": {"$in": list(missing)}}, {"_id": 0, "hash": 1, "data": 1, "encoding": 1})
+            async for blob in cursor:
+                texts[blob["hash"]] = self._decode(blob)
+                self._remember(blob["hash"], texts[blob["hash"]])
+        return texts
+
+    @staticmethod
+    def _decode(blob: dict) -> str:
+        return decompress(blob["data"], blob.get("encoding", "gzip")).decode('utf-8')
+
+    def _remember(self, digest: str, text: str):
+        if len(text) <= self._cache.maxsize:
+            self._cache[digest] = text
+
+    async def prune(self, referenced_in, older_than: datetime, batch_size: int = 1000, dry_run: bool = False) -> int:
+        """Deletes blobs no longer referenced, skipping recently stored ones that may be mid-write.
+
+        Walks the old blobs in hash order, batch_size at a time, and asks
+        `async referenced_in(hashes) -> set` which of each batch are still in
+        use, so no query ever carries the full set of referenced hashes.
+        """
+        pruned, last_hash = 0, None
+        while True:
+            query = {"stored_at": {"$lt": older_than}}
+            if last_hash is not None:
+                query["hash"] = {"$gt": last_hash}
+            batch = await self.collection.find(query, {"_id": 0, "hash": 1}).sort("hash", 1).limit(batch_size).to_list(batch_size)
+            if not batch:
+                return pruned
+            hashes = [blob["hash"] for blob in batch]
+            last_hash = hashes[-1]
+            unreferenced = set(hashes) - await referenced_in(hashes)
+            if not unreferenced:
+                continue
+            if dry_run:
+                pruned += len(unreferenced)
+                continue
+            # Re-checks the age: a put since the batch was read refreshes stored_at
+            result = await self.collection.delete_many({"hash": {"$in": list(unreferenced)}, "stored_at": {"$lt": older_than}})
+            pruned += result.deleted_count
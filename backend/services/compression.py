@@ -0,0 +1,106 @@
+import os
+import gzip
+import asyncio
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+# Bodies above this are compressed in a worker thread
+COMPRESS_THREAD_THRESHOLD = 1024 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+# Streams are sent as produced; compressing them would hold events back
+STREAMING_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Picks br or gzip from an Accept-Encoding header, or None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br", "gzip") if brotli else ("gzip",)):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """Negotiated br/gzip compression for complete JSON and text responses.
+
+    Only single-message bodies over `minimum_size` are compressed, so
+    streamed responses (SSE, NDJSON, file downloads) pass through untouched
+    and unbuffered. A compressed response gets its own strong ETag: the
+    original with an encoding suffix.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        held_start = None
+
+        async def send_wrapper(message):
+            nonlocal held_start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or content_type.startswith(STREAMING_TYPES)
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    await send(message)
+                else:
+                    # Wait for the body to decide
+                    held_start = message
+                return
+            if message["type"] != "http.response.body" or held_start is None:
+                await send(message)
+                return
+
+            start, held_start = held_start, None
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) > COMPRESS_THREAD_THRESHOLD:
+                compressed = await asyncio.to_thread(compress_body, body, encoding)
+            else:
+                compressed = compress_body(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            etag = headers.get("etag")
+            if etag and etag.endswith('"'):
+                headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,55 @@
+import os
+from PIL import Image, ImageOps, features
+
+# Name -> longest edge in pixels
+DERIVATIVE_SIZES = {
+    "thumb": 320,
+    "preview": 1024,
+    "editor": 2048,
+}
+SAVE_OPTIONS = {
+    "webp": {"quality": 82, "method": 4},
+    "avif": {"quality": 60, "speed": 8},
+}
+
+
+def available_formats() -> tuple:
+    """WebP always; AVIF when this Pillow build can encode it."""
+    if features.check('avif'):
+        return ("webp", "avif")
+    return ("webp",)
+
+
+def build_derivatives(source_path: str, out_dir: str, stem: str, sizes: dict = None, formats: tuple = None) -> list:
+    """Writes resized copies of an image; returns one dict per file written.
+
+    Runs in a worker process. The source is decoded once (JPEGs at reduced
+    scale when possible) and each size is scaled from the next larger one.
+    Sizes larger than the source are written at the source size.
+    """
+    sizes = sizes or DERIVATIVE_SIZES
+    formats = formats or available_formats()
+    largest = max(sizes.values())
+    written = []
+    with Image.open(source_path) as source:
+        source.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        for name, edge in sorted(sizes.items(), key=lambda item: -item[1]):
+            if max(image.size) > edge:
+                image = image.copy()
+                image.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+            for fmt in formats:
+                path = os.path.join(out_dir, f"{stem}_{name}.{fmt}")
+                image.save(path, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                written.append({
+                    "name": name,
+                    "format": fmt,
+                    "width": image.width,
+                    "height": image.height,
+                    "size": os.path.getsize(path),
+                    "path": path,
+                })
+    return written
@@ -0,0 +1,285 @@
+import os
+import uuid
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+DRIVE_UPLOAD_CONCURRENCY = int(os.environ.get('DRIVE_UPLOAD_CONCURRENCY', 2))
+DRIVE_UPLOAD_MAX_ATTEMPTS = int(os.environ.get('DRIVE_UPLOAD_MAX_ATTEMPTS', 6))
+# Earliest due job first
+CLAIM_SORT = [("next_attempt_at", 1)]
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class DriveUploadQueue:
+    """Mongo-backed queue of Drive uploads drained by a bounded worker pool.
+
+    Jobs survive restarts: a job whose worker died is picked up again once its
+    lease expires, while attempts remain; otherwise it is failed. Failed
+    attempts are retried with jittered exponential backoff, and the staged
+    file is removed only when the job is finished. The resumable upload
+    session is stored on the job, so a retry continues from the bytes Drive
+    already holds. Retries only resume on the host that queued the job: the
+    staged file lives on its local disk, and a worker elsewhere fails the job
+    as missing its file.
+    """
+
+    def __init__(self, collection, drive_service, root_folder: str,
+                 concurrency: int = DRIVE_UPLOAD_CONCURRENCY,
+                 max_attempts: int = DRIVE_UPLOAD_MAX_ATTEMPTS,
+                 base_delay: float = 5.0, max_delay: float = 600.0,
+                 lease_seconds: float = 120.0, poll_interval: float = 10.0):
+        self.collection = collection
+        self.drive_service = drive_service
+        self.root_folder = root_folder
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._workers = []
+
+    async def start(self):
+        """Starts the worker pool (indexes come from services.indexes)."""
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(self.concurrency)]
+        logger.info(f"Drive upload queue started with {self.concurrency} workers")
+
+    async def stop(self):
+        """Stops the workers; running jobs are re-claimed after their lease expires."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(self, file_path: str, folder_name: str, file_name: str,
+                      mime_type: str = None, floorplan_id: str = None) -> dict:
+        """Persists an upload job and wakes an idle worker."""
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "floorplan_id": floorplan_id,
+            "file_path": file_path,
+            "file_name": file_name,
+            "folder_name": folder_name,
+            "mime_type": mime_type,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "bytes_sent": 0,
+            "upload_session_uri": None,
+            "total_bytes": os.path.getsize(file_path) if os.path.exists(file_path) else None,
+            "drive_file_id": None,
+            "error": None,
+            "next_attempt_at": now,
+            "lease_expires_at": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.collection.insert_one(dict(job))
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> dict:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    def _attempts_exhausted(self, exhausted: bool = True) -> dict:
+        compare = "$gte" if exhausted else "$lt"
+        return {"$expr": {compare: ["$attempts", {"$ifNull": ["$max_attempts", self.max_attempts]}]}}
+
+    def _claim_filter(self, now: datetime) -> dict:
+        return {"$or": [
+            {"status": "queued", "next_attempt_at": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lt": now}, **self._attempts_exhausted(False)},
+        ]}
+
+    def _exhausted_filter(self, now: datetime) -> dict:
+        return {"status": "running", "lease_expires_at": {"$lt": now}, **self._attempts_exhausted()}
+
+    async def _claim(self):
+        now = _now()
+        return await self.collection.find_one_and_update(
+            self._claim_filter(now),
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=CLAIM_SORT,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self, n: int):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Drive queue worker {n} failed to claim a job: {e}")
+                job = None
+
+            if not job:
+                try:
+                    await self._fail_exhausted()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Drive queue worker {n} failed to expire exhausted jobs: {e}")
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Left as running; re-claimed once the lease expires, while attempts remain
+                logger.error(f"Drive queue worker {n} crashed on job {job['id']}: {e}", exc_info=True)
+
+    async def _process(self, job: dict):
+        job_id = job["id"]
+        if not self.drive_service.service:
+            await self._finish(job, "skipped", error="Drive integration disabled")
+            return
+        if not os.path.exists(job["file_path"]):
+            await self._finish(job, "failed", error="Staged file no longer exists")
+            return
+
+        loop = asyncio.get_running_loop()
+        progress = {"bytes_sent": job.get("bytes_sent") or 0}
+
+        def on_chunk(bytes_sent, total_bytes):
+            progress["bytes_sent"] = bytes_sent
+
+        def on_session(session_uri):
+            # Stored right away: a crash before the next heartbeat can still resume
+            asyncio.run_coroutine_threadsafe(self.collection.update_one(
+                {"id": job_id, "status": "running"}, {"$set": {"upload_session_uri": session_uri}}
+            ), loop)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, progress))
+        try:
+            drive_file_id = await asyncio.to_thread(self._upload, job, on_chunk, on_session)
+        except Exception as e:
+            drive_file_id = None
+            error = str(e)
+        else:
+            error = None if drive_file_id else "Drive upload returned no file ID"
+        finally:
+            heartbeat.cancel()
+
+        if drive_file_id:
+            logger.info(f"Drive upload job {job_id} finished: {drive_file_id}")
+            await self._finish(job, "done", drive_file_id=drive_file_id)
+        elif job["attempts"] >= job.get("max_attempts", self.max_attempts):
+            logger.error(f"Drive upload job {job_id} failed permanently: {error}")
+            await self._finish(job, "failed", error=error)
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (job["attempts"] - 1))
+            delay = random.uniform(delay / 2, delay)
+            logger.warning(f"Drive upload job {job_id} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+            now = _now()
+            update = {
+                "status": "queued",
+                "error": error,
+                "bytes_sent": progress["bytes_sent"],
+                "next_attempt_at": now + timedelta(seconds=delay),
+                "lease_expires_at": None,
+                "updated_at": now,
+            }
+            if job.get("upload_session_uri") and progress["bytes_sent"] <= (job.get("bytes_sent") or 0):
+                # Resuming made no progress; the next attempt opens a new session
+                update["upload_session_uri"] = None
+            await self.collection.update_one({"id": job_id}, {"$set": update})
+            loop.call_later(delay, self._wakeup.set)
+
+    def _upload(self, job: dict, on_chunk, on_session) -> str:
+        folder_id = self.drive_service.ensure_folder(self.root_folder, job["folder_name"])
+        if not folder_id:
+            raise RuntimeError(f"Could not resolve Drive folder '{job['folder_name']}'")
+        file_id = self.drive_service.upload_file(
+            job["file_path"],
+            folder_id=folder_id,
+            mime_type=job.get("mime_type"),
+            file_name=job.get("file_name"),
+            on_chunk=on_chunk,
+            session_uri=job.get("upload_session_uri"),
+            on_session=on_session,
+        )
+        if not file_id:
+            # The cached folder may have been deleted on Drive
+            self.drive_service.invalidate_folder(self.root_folder, job["folder_name"])
+        return file_id
+
+    async def _heartbeat(self, job_id: str, progress: dict):
+        """Extends the lease of a running job and records upload progress."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            now = _now()
+            await self.collection.update_one(
+                {"id": job_id, "status": "running"},
+                {"$set": {
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "bytes_sent": progress["bytes_sent"],
+                    "updated_at": now,
+                }}
+            )
+
+    async def _fail_exhausted(self):
+        """Fails running jobs whose lease expired on their last allowed attempt.
+
+        Each update is conditional on the lease read, so only one process
+        fails a job and removes its staged file.
+        """
+        stale = await self.collection.find(self._exhausted_filter(_now()), {"_id": 0}).to_list(100)
+        for job in stale:
+            error = f"Worker stopped during each of {job['attempts']} attempts"
+            result = await self.collection.update_one(
+                {"id": job["id"], "status": "running", "lease_expires_at": job["lease_expires_at"]},
+                {"$set": self._finished("failed", error=error)}
+            )
+            if result.modified_count:
+                logger.error(f"Drive upload job {job['id']} failed permanently: {error}")
+                self._remove_staged(job)
+
+    def _finished(self, status: str, error: str = None) -> dict:
+        return {
+            "status": status,
+            "error": error,
+            "upload_session_uri": None,
+            "lease_expires_at": None,
+            "updated_at": _now(),
+        }
+
+    async def _finish(self, job: dict, status: str, drive_file_id: str = None, error: str = None):
+        update = self._finished(status, error=error)
+        if drive_file_id:
+            update["drive_file_id"] = drive_file_id
+            update["bytes_sent"] = job.get("total_bytes")
+        await self.collection.update_one({"id": job["id"]}, {"$set": update})
+        self._remove_staged(job)
+
+    def _remove_staged(self, job: dict):
+        try:
+            os.remove(job["file_path"])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove staged file {job['file_path']}: {e}")
@@ -1,11 +1,19 @@
 import os
 import logging
+import threading
+from concurrent.futures import Future
+from cachetools import TTLCache
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # must be a multiple of 256 KiB
+FOLDER_CACHE_TTL = int(os.environ.get('DRIVE_FOLDER_CACHE_TTL', 3600))
+FOLDER_CACHE_SIZE = int(os.environ.get('DRIVE_FOLDER_CACHE_SIZE', 1024))
+
 class DriveService:
     SCOPES = ['https://www.googleapis.com/auth/drive']
     
@@ -13,6 +21,10 @@ class DriveService:
         self.creds = None
         self.service = None
         self.credentials_file = credentials_file
+        # Folder path tuple -> Drive folder ID, LRU-evicted with a TTL
+        self._folder_cache = TTLCache(maxsize=FOLDER_CACHE_SIZE, ttl=FOLDER_CACHE_TTL)
+        self._folder_inflight = {}
+        self._folder_lock = threading.Lock()
         self._authenticate()
 
     def _authenticate(self):
@@ -49,8 +61,16 @@ class DriveService:
             logger.error(f"Error creating folder '{folder_name}': {e}")
             return None
 
-    def upload_file(self, file_path: str, folder_id: str = None, mime_type: str = None) -> str:
-        """Uploads a file to Google Drive."""
+    def upload_file(self, file_path: str, folder_id: str = None, mime_type: str = None,
+                    file_name: str = None, on_chunk=None, session_uri: str = None,
+                    on_session=None) -> str:
+        """Uploads a file to Google Drive as a resumable, chunked upload.
+
+        on_chunk(bytes_sent, total_bytes) is called after every chunk, and
+        on_session(uri) once the upload session is open. Passing that URI back
+        as session_uri continues an interrupted upload from the offset Drive
+        already holds; an expired session starts a new upload.
+        """
         if not self.service:
             logger.warning("Drive service not initialized. Cannot upload file.")
             return None
@@ -60,18 +80,21 @@ class DriveService:
             return None
 
         try:
-            file_name = os.path.basename(file_path)
+            file_name = file_name or os.path.basename(file_path)
             file_metadata = {'name': file_name}
             if folder_id:
                 file_metadata['parents'] = [folder_id]
 
-            media = MediaFileUpload(file_path, mimetype=mime_type)
-            
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
+            if session_uri:
+                try:
+                    file = self._send_chunks(file_path, file_metadata, mime_type, on_chunk, on_session, session_uri)
+                except HttpError as e:
+                    if e.resp.status not in (404, 410):
+                        raise
+                    logger.info(f"Drive upload session for '{file_path}' expired, starting over")
+                    file = self._send_chunks(file_path, file_metadata, mime_type, on_chunk, on_session)
+            else:
+                file = self._send_chunks(file_path, file_metadata, mime_type, on_chunk, on_session)
             
             logger.info(f"Uploaded file '{file_name}' to Drive with ID: {file.get('id')}")
             return file.get('id')
@@ -79,13 +102,54 @@ class DriveService:
             logger.error(f"Error uploading file '{file_path}': {e}")
             return None
 
+    def _send_chunks(self, file_path: str, file_metadata: dict, mime_type: str, on_chunk, on_session,
+                     session_uri: str = None) -> dict:
+        media = MediaFileUpload(file_path, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+        request = self.service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id'
+        )
+        file = None
+        if session_uri:
+            file = self._resume_session(request, session_uri, media.size())
+        while file is None:
+            # Transient errors on a chunk are retried without restarting the upload
+            status, file = request.next_chunk(num_retries=3)
+            if on_session and request.resumable_uri != session_uri:
+                session_uri = request.resumable_uri
+                on_session(session_uri)
+            if status and on_chunk:
+                on_chunk(status.resumable_progress, status.total_size)
+        return file
+
+    def _resume_session(self, request, session_uri: str, size: int):
+        """Asks Drive how many bytes of an interrupted upload it holds.
+
+        Points `request` at the next byte to send, or returns the file when the
+        upload had already completed. Raises HttpError (404/410) for an
+        expired session.
+        """
+        resp, content = request.http.request(
+            session_uri, 'PUT', headers={'Content-Range': f'bytes */{size}', 'Content-Length': '0'}
+        )
+        if resp.status in (200, 201):
+            return request.postproc(resp, content)
+        if resp.status != 308:
+            raise HttpError(resp, content, uri=session_uri)
+        held = resp.get('range')
+        request.resumable_uri = session_uri
+        request.resumable_progress = int(held.rsplit('-', 1)[1]) + 1 if held else 0
+        return None
+
     def find_folder(self, folder_name: str, parent_id: str = None) -> str:
         """Finds a folder by name, optionally within a parent folder. Returns first match ID."""
         if not self.service:
             return None
 
         try:
-            query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
+            escaped_name = folder_name.replace('\\', '\\\\').replace("'", "\\'")
+            query = f"mimeType='application/vnd.google-apps.folder' and name='{escaped_name}' and trashed=false"
             if parent_id:
                 query += f" and '{parent_id}' in parents"
             
@@ -98,3 +162,56 @@ class DriveService:
         except Exception as e:
             logger.error(f"Error finding folder '{folder_name}': {e}")
             return None
+
+    def ensure_folder(self, *path: str) -> str:
+        """Returns the ID of a folder path such as ('Root', 'Project'), creating missing folders.
+
+        IDs are cached per path, and concurrent calls for the same path share a
+        single in-flight lookup so racing uploads never create duplicate folders.
+        """
+        folder_id = None
+        for depth in range(1, len(path) + 1):
+            folder_id = self._ensure_folder_segment(tuple(path[:depth]), folder_id)
+            if not folder_id:
+                return None
+        return folder_id
+
+    def invalidate_folder(self, *path: str):
+        """Drops a cached folder path and everything below it."""
+        key = tuple(path)
+        with self._folder_lock:
+            for cached in list(self._folder_cache.keys()):
+                if cached[:len(key)] == key:
+                    self._folder_cache.pop(cached, None)
+
+    def _ensure_folder_segment(self, key: tuple, parent_id: str) -> str:
+        with self._folder_lock:
+            cached = self._folder_cache.get(key)
+            if cached:
+                return cached
+            pending = self._folder_inflight.get(key)
+            if pending is None:
+                pending = self._folder_inflight[key] = Future()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            return pending.result()
+
+        try:
+            folder_name = key[-1]
+            folder_id = self.find_folder(folder_name, parent_id=parent_id)
+            if not folder_id:
+                folder_id = self.create_folder(folder_name, parent_id=parent_id)
+            if folder_id:
+                with self._folder_lock:
+                    self._folder_cache[key] = folder_id
+            pending.set_result(folder_id)
+            return folder_id
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._folder_lock:
+                self._folder_inflight.pop(key, None)
@@ -0,0 +1,435 @@
+import os
+import math
+import hashlib
+from collections import defaultdict
+
+import numpy as np
+
+# Same defaults as frontend/src/utils/roomDetection.js (canvas pixels)
+SNAP_TOLERANCE = float(os.environ.get('ROOM_SNAP_TOLERANCE', 15))
+MIN_ROOM_AREA = float(os.environ.get('ROOM_MIN_AREA', 10000))
+
+# Scene normalization tolerances (meters, as in three_d_data)
+SCENE_SNAP_METERS = float(os.environ.get('SCENE_SNAP_METERS', 0.05))
+SCENE_ANGLE_DEGREES = float(os.environ.get('SCENE_ANGLE_DEGREES', 1.0))
+SCENE_MIN_WALL_METERS = float(os.environ.get('SCENE_MIN_WALL_METERS', 0.05))
+# Farthest a door or window may sit from the wall that hosts it
+SCENE_HOST_METERS = float(os.environ.get('SCENE_HOST_METERS', 0.3))
+# Coordinates farther out than this are treated as invalid (AI output can be absurd)
+SCENE_MAX_METERS = float(os.environ.get('SCENE_MAX_METERS', 10_000))
+SCENE_GRID_CELL = 1.0
+# A segment or lookup spanning more grid cells than this is brute-forced instead
+SCENE_GRID_MAX_CELLS = 1024
+
+
+class SnapGrid:
+    """Merges points closer than `tolerance` using a hash of grid cells.
+
+    Each point only looks at its own cell and the eight around it, so
+    snapping n points is O(n). The first point seen in a cluster is the
+    one kept, as in the editor.
+    """
+
+    def __init__(self, tolerance: float = SNAP_TOLERANCE):
+        self.tolerance = max(float(tolerance), 1e-9)
+        self.cells = {}
+        self.points = []
+
+    def index(self, x: float, y: float) -> int:
+        cx, cy = round(x / self.tolerance), round(y / self.tolerance)
+        best, best_distance = None, None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in self.cells.get((cx + dx, cy + dy), ()):
+                    px, py = self.points[i]
+                    distance = (px - x) ** 2 + (py - y) ** 2
+                    if distance <= self.tolerance ** 2 and (best is None or distance < best_distance):
+                        best, best_distance = i, distance
+        if best is not None:
+            return best
+        self.cells.setdefault((cx, cy), []).append(len(self.points))
+        self.points.append((float(x), float(y)))
+        return len(self.points) - 1
+
+
+def wall_segments(walls) -> np.ndarray:
+    """(n, 4) array of x1, y1, x2, y2 from canvas walls ({"points": [x1, y1, x2, y2]})."""
+    segments = []
+    for wall in walls or []:
+        points = wall.get("points") if isinstance(wall, dict) else None
+        if not isinstance(points, (list, tuple)) or len(points) < 4:
+            continue
+        try:
+            segment = [float(v) for v in points[:4]]
+        except (TypeError, ValueError):
+            continue
+        if all(math.isfinite(v) for v in segment):
+            segments.append(segment)
+    return np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+
+
+class PlanarGraph:
+    """Half-edge graph of snapped wall segments.
+
+    Half-edge h and h + E are twins. `next` walks each face keeping it on
+    the left (counter-clockwise in y-up coordinates), so bounded faces have
+    positive signed area and the outer boundary negative.
+    """
+
+    def __init__(self, segments: np.ndarray, tolerance: float = SNAP_TOLERANCE):
+        grid = SnapGrid(tolerance)
+        ends = np.array(
+            [(grid.index(x1, y1), grid.index(x2, y2)) for x1, y1, x2, y2 in segments], dtype=np.int64
+        ).reshape(-1, 2)
+        self.vertices = np.asarray(grid.points, dtype=np.float64).reshape(-1, 2)
+
+        # Undirected edges, without self-loops or duplicates
+        ends = ends[ends[:, 0] != ends[:, 1]]
+        ends = np.unique(np.sort(ends, axis=1), axis=0)
+        self.edge_count = len(ends)
+        self.origin = np.concatenate([ends[:, 0], ends[:, 1]])
+        self.dest = np.concatenate([ends[:, 1], ends[:, 0]])
+        self.next = self._link()
+
+    def twin(self, half_edges):
+        return (half_edges + self.edge_count) % (2 * self.edge_count)
+
+    def _link(self) -> np.ndarray:
+        if self.edge_count == 0:
+            return np.empty(0, dtype=np.int64)
+        delta = self.vertices[self.dest] - self.vertices[self.origin]
+        angle = np.arctan2(delta[:, 1], delta[:, 0])
+        # Outgoing half-edges grouped by origin, ascending angle within each group
+        order = np.lexsort((angle, self.origin))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        degree = np.bincount(self.origin, minlength=len(self.vertices))
+        start = np.concatenate([[0], np.cumsum(degree)[:-1]])
+
+        # Arriving at v along u->v, leave by the spoke just before v->u in angular order
+        twin = self.twin(np.arange(len(order)))
+        v = self.dest
+        previous = start[v] + (rank[twin] - start[v] - 1) % degree[v]
+        return order[previous]
+
+    def faces(self) -> tuple:
+        """(face id per half-edge, list of half-edge cycles)."""
+        face = np.full(len(self.next), -1, dtype=np.int64)
+        cycles = []
+        next_edge = self.next.tolist()
+        for first in range(len(next_edge)):
+            if face[first] >= 0:
+                continue
+            cycle, h = [], first
+            while face[h] < 0:
+                face[h] = len(cycles)
+                cycle.append(h)
+                h = next_edge[h]
+            cycles.append(cycle)
+        return face, cycles
+
+    def face_areas(self, face: np.ndarray, count: int) -> np.ndarray:
+        """Signed shoelace area of each of `count` faces at once."""
+        o, d = self.vertices[self.origin], self.vertices[self.dest]
+        cross = o[:, 0] * d[:, 1] - d[:, 0] * o[:, 1]
+        return np.bincount(face, weights=cross, minlength=count) / 2
+
+
+def remove_spikes(ring: list) -> list:
+    """Drops there-and-back detours (dangling walls) from a closed vertex ring."""
+    stack = []
+    for vertex in ring:
+        if len(stack) >= 2 and stack[-2] == vertex:
+            stack.pop()
+        elif not stack or stack[-1] != vertex:
+            stack.append(vertex)
+    changed = True
+    while changed and len(stack) >= 3:
+        changed = False
+        if stack[0] == stack[-1] or stack[-2] == stack[0]:
+            stack.pop()
+            changed = True
+        elif stack[1] == stack[-1]:
+            stack.pop(0)
+            changed = True
+    return stack
+
+
+def detect_rooms(walls, tolerance: float = SNAP_TOLERANCE, min_area: float = MIN_ROOM_AREA) -> list:
+    """Rooms enclosed by canvas walls: [{"id", "points": [{"x", "y"}], "area"}].
+
+    Server-side counterpart of detectRooms in the editor. Building the graph
+    is O(E log E) and face extraction O(E). Unlike the editor, the outer
+    boundary of the plan is not returned as a room.
+    """
+    segments = wall_segments(walls)
+    if len(segments) < 3:
+        return []
+    graph = PlanarGraph(segments, tolerance)
+    if graph.edge_count == 0:
+        return []
+    face, cycles = graph.faces()
+    areas = graph.face_areas(face, len(cycles))
+
+    rooms = []
+    for face_id in np.flatnonzero(areas >= min_area):
+        ring = remove_spikes(graph.origin[cycles[face_id]].tolist())
+        if len(ring) < 3:
+            continue
+        points = [{"x": float(x), "y": float(y)} for x, y in graph.vertices[ring]]
+        key = ";".join(f"{p['x']:.1f},{p['y']:.1f}" for p in points)
+        rooms.append({
+            "id": f"auto-room-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}",
+            "points": points,
+            "area": float(areas[face_id]),
+        })
+    return rooms
+
+
+def rooms_to_scene(rooms: list, pixels_per_meter: float, height: float = 2.8) -> list:
+    """Detected rooms in the 3D data format (meters, bounding box plus polygon)."""
+    scene = []
+    for room in rooms:
+        xs = [p["x"] / pixels_per_meter for p in room["points"]]
+        ys = [p["y"] / pixels_per_meter for p in room["points"]]
+        scene.append({
+            "id": room["id"],
+            "type": "room",
+            "width": round(max(xs) - min(xs), 3),
+            "depth": round(max(ys) - min(ys), 3),
+            "height": height,
+            "area": round(room["area"] / pixels_per_meter ** 2, 3),
+            "polygon": [[round(x, 3), round(y, 3)] for x, y in zip(xs, ys)],
+        })
+    return scene
+
+
+def walls_to_scene(walls, pixels_per_meter: float, height: float = 2.8, thickness: float = 0.2) -> list:
+    """Canvas walls in the 3D data format (meters)."""
+    return [
+        {
+            "start": [round(x1 / pixels_per_meter, 3), round(y1 / pixels_per_meter, 3)],
+            "end": [round(x2 / pixels_per_meter, 3), round(y2 / pixels_per_meter, 3)],
+            "height": height,
+            "thickness": thickness,
+        }
+        for x1, y1, x2, y2 in wall_segments(walls).tolist()
+    ]
+
+
+def _xy(value, limit: float = SCENE_MAX_METERS):
+    """(x, y) from a [x, y, ...] list, or None when it is not a finite point within `limit` of the origin."""
+    if not isinstance(value, (list, tuple)) or len(value) < 2:
+        return None
+    try:
+        x, y = float(value[0]), float(value[1])
+    except (TypeError, ValueError):
+        return None
+    return (x, y) if abs(x) <= limit and abs(y) <= limit else None
+
+
+def _positive(item: dict, *keys) -> bool:
+    """False when one of `keys` is present but not a positive number."""
+    for key in keys:
+        if key in item:
+            try:
+                if not float(item[key]) > 0:
+                    return False
+            except (TypeError, ValueError):
+                return False
+    return True
+
+
+class SegmentGrid:
+    """Uniform grid over segment bounding boxes, for nearest-segment lookups.
+
+    Work per segment and per lookup is capped at `max_cells` grid cells:
+    longer segments are kept aside and checked on every lookup, and a lookup
+    reaching further is answered by checking every segment.
+    """
+
+    def __init__(self, segments: np.ndarray, cell: float = SCENE_GRID_CELL, max_cells: int = SCENE_GRID_MAX_CELLS):
+        self.segments = segments
+        self.cell = cell
+        self.max_cells = max_cells
+        self.cells = defaultdict(list)
+        self.oversized = []
+        for i, (x1, y1, x2, y2) in enumerate(segments.tolist()):
+            span = self._span(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+            if span is None:
+                self.oversized.append(i)
+                continue
+            for cell_key in span:
+                self.cells[cell_key].append(i)
+
+    def _span(self, x1: float, y1: float, x2: float, y2: float):
+        """Cells covering a box, or None when there are more than max_cells of them."""
+        cx1, cx2 = math.floor(x1 / self.cell), math.floor(x2 / self.cell)
+        cy1, cy2 = math.floor(y1 / self.cell), math.floor(y2 / self.cell)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.max_cells:
+            return None
+        return [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
+
+    def nearest(self, x: float, y: float, max_distance: float):
+        """(segment index, distance along it, distance from it), or None if none is in reach."""
+        span = self._span(x - max_distance, y - max_distance, x + max_distance, y + max_distance)
+        if span is None:
+            candidates = set(range(len(self.segments)))
+        else:
+            candidates = set(self.oversized)
+            for cell_key in span:
+                candidates.update(self.cells.get(cell_key, ()))
+        if not candidates:
+            return None
+        index = np.fromiter(candidates, dtype=np.int64)
+        segments = self.segments[index]
+        start, delta = segments[:, :2], segments[:, 2:] - segments[:, :2]
+        length_sq = np.maximum((delta ** 2).sum(axis=1), 1e-12)
+        t = np.clip(((np.array([x, y]) - start) * delta).sum(axis=1) / length_sq, 0.0, 1.0)
+        distance = np.hypot(*(start + delta * t[:, None] - np.array([x, y])).T)
+        best = int(np.argmin(distance))
+        if distance[best] > max_distance:
+            return None
+        return int(index[best]), float(t[best] * np.sqrt(length_sq[best])), float(distance[best])
+
+
+def _clusters(values: np.ndarray, tolerance: float) -> list:
+    """Indices of `values` grouped into runs whose neighbours differ by at most `tolerance`."""
+    order = np.argsort(values, kind='stable')
+    breaks = np.flatnonzero(np.diff(values[order]) > tolerance) + 1
+    return np.split(order, breaks)
+
+
+def merge_collinear(segments: np.ndarray, groups: np.ndarray, snap: float, angle_tolerance: float) -> list:
+    """Merges collinear, touching or overlapping segments that share a group id.
+
+    Returns a list of (x1, y1, x2, y2, source indices). Segments are bucketed
+    by direction, then by offset from the origin, then swept along the line
+    as 1D intervals, so the whole pass is O(n log n).
+    """
+    delta = segments[:, 2:] - segments[:, :2]
+    angle = np.mod(np.arctan2(delta[:, 1], delta[:, 0]), np.pi)
+    # Directions just under pi are the same lines as those just over 0
+    angle = np.where(angle > np.pi - angle_tolerance, angle - np.pi, angle)
+
+    merged = []
+    for group in np.unique(groups):
+        in_group = np.flatnonzero(groups == group)
+        for by_angle in _clusters(angle[in_group], angle_tolerance):
+            members = in_group[by_angle]
+            mean = float(np.mean(angle[members]))
+            direction = np.array([math.cos(mean), math.sin(mean)])
+            normal = np.array([-direction[1], direction[0]])
+            midpoints = (segments[members, :2] + segments[members, 2:]) / 2
+            for by_offset in _clusters(midpoints @ normal, snap):
+                line = members[by_offset]
+                s1, s2 = segments[line, :2] @ direction, segments[line, 2:] @ direction
+                low, high = np.minimum(s1, s2), np.maximum(s1, s2)
+                low_point = np.where((s1 <= s2)[:, None], segments[line, :2], segments[line, 2:])
+                high_point = np.where((s1 <= s2)[:, None], segments[line, 2:], segments[line, :2])
+                run = None
+                for k in np.argsort(low, kind='stable'):
+                    if run is not None and low[k] <= run["high"] + snap:
+                        if high[k] > run["high"]:
+                            run["high"], run["end"] = high[k], high_point[k]
+                        run["sources"].append(int(line[k]))
+                        continue
+                    if run is not None:
+                        merged.append((*run["start"], *run["end"], run["sources"]))
+                    run = {"high": high[k], "start": low_point[k], "end": high_point[k], "sources": [int(line[k])]}
+                merged.append((*run["start"], *run["end"], run["sources"]))
+    merged.sort(key=lambda item: min(item[4]))
+    return merged
+
+
+def normalize_scene(data: dict, snap: float = SCENE_SNAP_METERS, angle_degrees: float = SCENE_ANGLE_DEGREES,
+                    min_wall: float = SCENE_MIN_WALL_METERS, host_distance: float = SCENE_HOST_METERS) -> tuple:
+    """Cleans up 3D data (walls, doors, windows, rooms); returns (normalized, report).
+
+    Wall endpoints are snapped together, degenerate elements dropped,
+    collinear and overlapping walls with the same height and thickness
+    merged, and each door and window attached to the nearest wall (its
+    `wall` index and `offset` along it) and moved onto it. Other keys are
+    kept as they are. Runs in a worker process.
+    """
+    data = data if isinstance(data, dict) else {}
+    before = {key: len(data.get(key) or []) for key in ("walls", "doors", "windows", "rooms")}
+
+    # Walls: snap endpoints, drop degenerate ones
+    raw_walls, ends = [], []
+    for wall in data.get("walls") or []:
+        if not isinstance(wall, dict) or not _positive(wall, "height", "thickness"):
+            continue
+        start, end = _xy(wall.get("start")), _xy(wall.get("end"))
+        if start is None or end is None:
+            continue
+        raw_walls.append(wall)
+        ends.append(start + end)
+    grid = SnapGrid(snap)
+    snapped = np.array(
+        [grid.points[grid.index(x1, y1)] + grid.points[grid.index(x2, y2)] for x1, y1, x2, y2 in ends],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+    keep = np.hypot(snapped[:, 2] - snapped[:, 0], snapped[:, 3] - snapped[:, 1]) >= min_wall
+    raw_walls = [wall for wall, kept in zip(raw_walls, keep) if kept]
+    snapped = snapped[keep]
+
+    # Merge only walls that would look the same
+    kinds = {}
+    groups = np.array([
+        kinds.setdefault((round(float(w.get("height") or 0), 2), round(float(w.get("thickness") or 0), 2)), len(kinds))
+        for w in raw_walls
+    ], dtype=np.int64)
+    walls = []
+    for x1, y1, x2, y2, sources in merge_collinear(snapped, groups, snap, math.radians(angle_degrees)):
+        wall = {k: v for k, v in raw_walls[sources[0]].items() if k not in ("start", "end")}
+        wall["start"] = [round(float(x1), 3), round(float(y1), 3)]
+        wall["end"] = [round(float(x2), 3), round(float(y2), 3)]
+        walls.append(wall)
+
+    # Doors and windows: attach to the nearest wall, dropping duplicates on the same spot
+    segments = np.array([w["start"] + w["end"] for w in walls], dtype=np.float64).reshape(-1, 4)
+    index = SegmentGrid(segments)
+    openings, hosted = {}, {}
+    for key in ("doors", "windows"):
+        items, seen = [], set()
+        for item in data.get(key) or []:
+            if not isinstance(item, dict) or not _positive(item, "width", "height"):
+                continue
+            position = _xy(item.get("position"))
+            if position is None:
+                continue
+            item = dict(item)
+            found = index.nearest(*position, host_distance) if len(walls) else None
+            if found is None:
+                item["position"] = [round(position[0], 3), round(position[1], 3), *item["position"][2:]]
+                items.append(item)
+                continue
+            wall_index, offset, _ = found
+            spot = (wall_index, round(offset / snap))
+            if spot in seen:
+                continue
+            seen.add(spot)
+            x1, y1, x2, y2 = segments[wall_index]
+            length = max(math.hypot(x2 - x1, y2 - y1), 1e-12)
+            item["position"] = [
+                round(x1 + (x2 - x1) * offset / length, 3), round(y1 + (y2 - y1) * offset / length, 3),
+                *item["position"][2:],
+            ]
+            item["wall"] = wall_index
+            item["offset"] = round(offset, 3)
+            items.append(item)
+        openings[key] = items
+        hosted[key] = sum(1 for item in items if "wall" in item)
+
+    rooms = [room for room in data.get("rooms") or [] if isinstance(room, dict) and _positive(room, "width", "depth")]
+    normalized = dict(data, walls=walls, rooms=rooms, **openings)
+    after = {key: len(normalized[key]) for key in ("walls", "doors", "windows", "rooms")}
+    report = {
+        "before": before,
+        "after": after,
+        "hosted": hosted,
+        "elements_before": sum(before.values()),
+        "elements_after": sum(after.values()),
+    }
+    return normalized, report
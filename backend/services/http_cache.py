@@ -0,0 +1,47 @@
+import json
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Clients must revalidate, but may keep the body and get a 304 when it is unchanged
+CACHE_CONTROL = "private, no-cache"
+# For content-addressed URLs: the body behind them never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Compressed variants carry the base ETag plus one of these (see services.compression)
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def compute_etag(value) -> str:
+    """Strong ETag from the canonical JSON of a document (or list of documents)."""
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return '"' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def _base_tag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, per RFC 9110), ignoring content-coding suffixes."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_base_tag(tag) == etag for tag in if_none_match.split(","))
+
+
+def conditional_response(request: Request, response: Response, value) -> Optional[Response]:
+    """Sets ETag/Cache-Control for `value`; returns a 304 when the client already has it."""
+    etag = compute_etag(value)
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return None
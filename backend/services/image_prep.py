@@ -0,0 +1,148 @@
+import io
+import os
+import math
+import numpy as np
+from PIL import Image, ImageOps
+
+# Longest edge sent to the vision model, and the floor under which we never shrink
+ANALYSIS_MAX_EDGE = int(os.environ.get('ANALYSIS_MAX_EDGE', 2048))
+ANALYSIS_MIN_EDGE = int(os.environ.get('ANALYSIS_MIN_EDGE', 768))
+# Thinnest wall stroke to keep after downsampling, in pixels
+MIN_STROKE_PX = 2.0
+MAX_SKEW_DEGREES = 5.0
+TILE_PX = 512
+# Working resolution for the first decode; scans larger than this are never needed
+WORK_EDGE = 4096
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Threshold that best separates ink from paper in a grayscale histogram."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    mean_bg = np.cumsum(hist * levels)
+    mean_total = mean_bg[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (mean_total * weight_bg - mean_bg * weight_bg[-1]) ** 2 / (weight_bg * weight_fg)
+    between = np.nan_to_num(between[:-1])
+    # between[t] splits levels <= t from the rest; callers test gray < threshold
+    return int(np.argmax(between)) + 1
+
+
+def estimate_skew(ink: np.ndarray, max_degrees: float = MAX_SKEW_DEGREES) -> float:
+    """Rotation (degrees) that best aligns walls with the axes.
+
+    Floor plans are dominated by horizontal and vertical strokes, so the
+    right angle maximizes the variance of the row and column ink profiles. Searched on a
+    small copy, coarse then fine.
+    """
+    small = Image.fromarray((ink * 255).astype(np.uint8))
+    small.thumbnail((800, 800))
+
+    def score(angle):
+        rotated = np.asarray(small.rotate(angle, resample=Image.BILINEAR, fillcolor=0), dtype=np.float32)
+        return rotated.sum(axis=1).var() + rotated.sum(axis=0).var()
+
+    best = max(np.arange(-max_degrees, max_degrees + 0.01, 1.0), key=score)
+    best = max(np.arange(best - 1.0, best + 1.01, 0.1), key=score)
+    return round(float(best), 2)
+
+
+def content_box(ink: np.ndarray, margin: float = 0.02, min_fraction: float = 0.002):
+    """(left, top, right, bottom) around the drawing, ignoring sparse specks near the edges."""
+    height, width = ink.shape
+    rows = np.flatnonzero(ink.sum(axis=1) > min_fraction * width)
+    cols = np.flatnonzero(ink.sum(axis=0) > min_fraction * height)
+    if rows.size == 0 or cols.size == 0:
+        return 0, 0, width, height
+    pad_y, pad_x = int(margin * height), int(margin * width)
+    return (
+        max(0, cols[0] - pad_x),
+        max(0, rows[0] - pad_y),
+        min(width, cols[-1] + 1 + pad_x),
+        min(height, rows[-1] + 1 + pad_y),
+    )
+
+
+def stroke_width(ink: np.ndarray) -> float:
+    """Median horizontal run length of ink, a proxy for wall thickness in pixels."""
+    padded = np.pad(ink.astype(np.int8), ((0, 0), (1, 1)))
+    edges = np.diff(padded, axis=1)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    runs = ends - starts
+    return float(np.median(runs)) if runs.size else 1.0
+
+
+def vision_tokens(width: int, height: int) -> int:
+    """Image input tokens for GPT-4o at detail=high (85 base + 170 per 512px tile)."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / TILE_PX) * math.ceil(height / TILE_PX)
+
+
+def prepare_for_analysis(source_path: str, binarize: bool = True,
+                         max_edge: int = ANALYSIS_MAX_EDGE, min_edge: int = ANALYSIS_MIN_EDGE) -> dict:
+    """Crops, deskews, thresholds and downsamples a floor plan image for the vision model.
+
+    Runs in a worker process. Returns the PNG bytes plus what was done, so
+    callers can log the savings.
+    """
+    with Image.open(source_path) as source:
+        original_size = source.size
+        source.draft('L', (WORK_EDGE, WORK_EDGE))
+        image = ImageOps.exif_transpose(source).convert('L')
+    image.thumbnail((WORK_EDGE, WORK_EDGE), Image.LANCZOS)
+
+    gray = np.asarray(image)
+    threshold = otsu_threshold(gray)
+    ink = gray < threshold
+
+    angle = estimate_skew(ink)
+    if abs(angle) >= 0.1:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+        gray = np.asarray(image)
+        ink = gray < threshold
+
+    box = content_box(ink)
+    image = image.crop(box)
+    ink = ink[box[1]:box[3], box[0]:box[2]]
+
+    # Shrink as far as the thinnest walls allow, within the edge limits
+    long_edge = max(image.size)
+    scale = MIN_STROKE_PX / max(stroke_width(ink), 1.0)
+    min_scale = min(1.0, min_edge / long_edge)
+    scale = max(scale, min_scale)
+    scale = min(scale, 1.0, max_edge / long_edge)
+    # A dimension just past a 512px tile boundary costs a whole extra tile; trim it
+    # (only when the model will not rescale the image itself, and never below min_edge)
+    if min(image.size) * scale <= 768:
+        for dim in image.size:
+            tiles = dim * scale / TILE_PX
+            if tiles > 1 and tiles - math.floor(tiles) < 0.1:
+                trimmed = scale * math.floor(tiles) / tiles
+                if trimmed >= min_scale:
+                    scale = trimmed
+    if scale < 1.0:
+        image = image.resize(
+            (max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS
+        )
+
+    if binarize:
+        image = image.point(lambda value: 255 if value >= threshold else 0).convert('1')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return {
+        "png": buffer.getvalue(),
+        "width": image.width,
+        "height": image.height,
+        "original_width": original_size[0],
+        "original_height": original_size[1],
+        "skew_degrees": angle,
+        "crop_box": [int(v) for v in box],
+        "tokens": vision_tokens(image.width, image.height),
+        "original_tokens": vision_tokens(*original_size),
+    }
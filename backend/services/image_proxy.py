@@ -0,0 +1,422 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+from services.http_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PROXY_ALLOWED_HOSTS = [
+    h.strip().lower() for h in os.environ.get('IMAGE_PROXY_ALLOWED_HOSTS', 'res.cloudinary.com').split(',') if h.strip()
+]
+IMAGE_PROXY_CACHE_BYTES = int(os.environ.get('IMAGE_PROXY_CACHE_BYTES', 512 * 1024 * 1024))
+IMAGE_PROXY_MAX_BYTES = int(os.environ.get('IMAGE_PROXY_MAX_BYTES', 50 * 1024 * 1024))
+# Cached copies younger than this are served without asking upstream
+IMAGE_PROXY_FRESH_SECONDS = int(os.environ.get('IMAGE_PROXY_FRESH_SECONDS', 3600))
+IMAGE_PROXY_CONNECTIONS = int(os.environ.get('IMAGE_PROXY_CONNECTIONS', 20))
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+CLIENT_CACHE_CONTROL = 'public, max-age=31536000'
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET',
+    'Access-Control-Allow-Headers': '*',
+}
+
+
+class ProxyError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+def cache_dir() -> str:
+    path = os.environ.get('IMAGE_PROXY_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'image_proxy')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def host_allowed(host: str, allowed_hosts) -> bool:
+    """Exact match, or a subdomain of an entry written as ".example.com"."""
+    host = (host or "").lower()
+    return any(host == h or (h.startswith('.') and host.endswith(h)) for h in allowed_hosts)
+
+
+def parse_range(header: Optional[str], size: int):
+    """(start, end) inclusive for a single "bytes=" range; None to serve the whole body.
+
+    Raises ProxyError(416) when the range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ProxyError(416, f"Range not satisfiable for {size} bytes")
+    return start, min(end, size - 1)
+
+
+def _write_chunk(handle, chunk: bytes):
+    handle.write(chunk)
+    handle.flush()
+
+
+@dataclass
+class CachedImage:
+    key: str
+    url: str
+    size: int
+    content_type: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class DiskLRU:
+    """Size-capped directory of cached bodies, least recently used evicted first.
+
+    Each entry is <key>.bin plus a <key>.json sidecar; recency survives restarts
+    through the body's mtime, which is bumped on every hit. put() runs in a
+    worker thread while get() runs on the event loop, so both take the lock.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def path(self, key: str, ext: str = 'bin') -> str:
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            full = os.path.join(self.directory, name)
+            if '.part-' in name:
+                os.remove(full)
+            elif name.endswith('.json'):
+                try:
+                    with open(full) as handle:
+                        entry = CachedImage(**json.load(handle))
+                    found.append((os.path.getmtime(self.path(entry.key)), entry))
+                except (OSError, ValueError, TypeError):
+                    self._remove_files(name[:-5])
+        for _, entry in sorted(found, key=lambda item: item[0]):
+            self.entries[entry.key] = entry
+            self.total += entry.size
+        self.evict()
+
+    def get(self, key: str) -> Optional[CachedImage]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is not None:
+            try:
+                os.utime(self.path(key))
+            except OSError:
+                pass
+        return entry
+
+    def put(self, entry: CachedImage, body_path: str):
+        """Moves a completed download into the cache under entry.key."""
+        with self._lock:
+            old = self.entries.pop(entry.key, None)
+            if old:
+                self.total -= old.size
+            os.replace(body_path, self.path(entry.key))
+            self.save(entry)
+            self.entries[entry.key] = entry
+            self.total += entry.size
+            self.evict()
+
+    def save(self, entry: CachedImage):
+        with open(self.path(entry.key, 'json'), 'w') as handle:
+            json.dump(asdict(entry), handle)
+
+    def evict(self):
+        while self.total > self.max_bytes and self.entries:
+            key, entry = self.entries.popitem(last=False)
+            self.total -= entry.size
+            self._remove_files(key)
+
+    def _remove_files(self, key: str):
+        for ext in ('bin', 'json'):
+            try:
+                os.remove(self.path(key, ext))
+            except FileNotFoundError:
+                pass
+
+
+class Download:
+    """An upstream body being written to disk; any number of readers follow it as it grows."""
+
+    def __init__(self, path: str, content_type: str):
+        self.path = path
+        self.final_path = None
+        self.content_type = content_type
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+        open(path, 'wb').close()
+
+    def open(self):
+        # The cache moves the part file to final_path from a worker thread, so
+        # try the part file first and fall back to where it is moved to
+        try:
+            return open(self.path, 'rb')
+        except FileNotFoundError:
+            if self.final_path is None:
+                raise
+            return open(self.final_path, 'rb')
+
+    async def advance(self, written: int = 0, done: bool = False, error: Exception = None):
+        async with self.changed:
+            self.written += written
+            self.done = self.done or done
+            self.error = self.error or error
+            self.changed.notify_all()
+
+    async def follow(self, handle):
+        """Yields the body as it arrives, until the download completes."""
+        offset = 0
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(lambda: self.written > offset or self.done)
+                if self.error:
+                    raise self.error
+                if self.written > offset:
+                    data = await asyncio.to_thread(handle.read, min(self.written - offset, CHUNK_SIZE * 16))
+                    offset += len(data)
+                    yield data
+                elif self.done:
+                    return
+        finally:
+            handle.close()
+
+
+class ImageProxy:
+    """Image pass-through for the editor, restricted to allowlisted hosts.
+
+    One pooled HTTP client serves all requests. Bodies are streamed to the
+    client while being written to a size-capped disk cache; concurrent
+    requests for the same URL share a single upstream fetch. Cached copies
+    are revalidated with ETag/Last-Modified once older than `fresh_seconds`.
+    """
+
+    def __init__(self, allowed_hosts=None, cache_bytes: int = IMAGE_PROXY_CACHE_BYTES,
+                 max_bytes: int = IMAGE_PROXY_MAX_BYTES, fresh_seconds: int = IMAGE_PROXY_FRESH_SECONDS):
+        self.allowed_hosts = allowed_hosts or IMAGE_PROXY_ALLOWED_HOSTS
+        self.cache_bytes = cache_bytes
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.cache = None
+        self._http = None
+        self._inflight = {}
+        self._downloads = set()
+        self.stats = {"hits": 0, "revalidated": 0, "fetches": 0, "coalesced": 0, "rejected": 0}
+
+    async def start(self):
+        self.cache = await asyncio.to_thread(DiskLRU, cache_dir(), self.cache_bytes)
+        self._http = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=IMAGE_PROXY_CONNECTIONS, max_keepalive_connections=IMAGE_PROXY_CONNECTIONS),
+            headers={'User-Agent': USER_AGENT},
+            event_hooks={"request": [self._check_redirect]},
+        )
+        logger.info(f"Image proxy started: {len(self.cache.entries)} cached, hosts {', '.join(self.allowed_hosts)}")
+
+    async def close(self):
+        for task in list(self._downloads):
+            task.cancel()
+        await asyncio.gather(*self._downloads, return_exceptions=True)
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+
+    async def _check_redirect(self, request: httpx.Request):
+        # Redirects must stay on allowed hosts too
+        if not host_allowed(request.url.host, self.allowed_hosts):
+            raise ProxyError(403, f"Host '{request.url.host}' is not allowed")
+
+    def check_url(self, url: str) -> str:
+        """Returns the cache key for an allowed URL."""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not host_allowed(parts.hostname, self.allowed_hosts):
+            self.stats["rejected"] += 1
+            raise ProxyError(403, "URL host is not allowed")
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    async def serve(self, url: str, headers) -> Response:
+        key = self.check_url(url)
+        entry = self.cache.get(key)
+        if entry and time.time() - entry.fetched_at < self.fresh_seconds:
+            self.stats["hits"] += 1
+            return await self._cached_response(entry, headers)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, url, entry))
+            self._inflight[key] = task
+        else:
+            self.stats["coalesced"] += 1
+        result = await asyncio.shield(task)
+
+        if isinstance(result, CachedImage):
+            return await self._cached_response(result, headers)
+        if headers.get('range'):
+            # Ranges are served from the completed cache entry
+            async with result.changed:
+                await result.changed.wait_for(lambda: result.done)
+            if result.error or self.cache.get(key) is None:
+                raise ProxyError(502, "Upstream image fetch failed")
+            return await self._cached_response(self.cache.get(key), headers)
+        try:
+            handle = result.open()
+        except FileNotFoundError:
+            raise ProxyError(503, "Cached image was evicted, retry")
+        return StreamingResponse(
+            result.follow(handle),
+            media_type=result.content_type,
+            headers={'Cache-Control': CLIENT_CACHE_CONTROL, **CORS_HEADERS},
+        )
+
+    async def _fetch(self, key: str, url: str, entry: Optional[CachedImage]):
+        """Upstream request for `url`: the revalidated entry, or a Download in progress."""
+        request_headers = {}
+        if entry and entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+        if entry and entry.last_modified:
+            request_headers['If-Modified-Since'] = entry.last_modified
+        try:
+            upstream = await self._http.send(self._http.build_request('GET', url, headers=request_headers), stream=True)
+        except httpx.HTTPError as e:
+            self._inflight.pop(key, None)
+            logger.error(f"Image proxy fetch failed for {url}: {e}")
+            raise ProxyError(502, f"Upstream error: {e}")
+        except BaseException:
+            self._inflight.pop(key, None)
+            raise
+
+        if upstream.status_code == 304 and entry:
+            await upstream.aclose()
+            self._inflight.pop(key, None)
+            entry.fetched_at = time.time()
+            await asyncio.to_thread(self.cache.save, entry)
+            self.stats["revalidated"] += 1
+            return entry
+        if upstream.status_code != 200:
+            await upstream.aclose()
+            self._inflight.pop(key, None)
+            logger.error(f"Image proxy upstream returned {upstream.status_code} for {url}")
+            raise ProxyError(404 if upstream.status_code == 404 else 502, f"Upstream returned {upstream.status_code}")
+        length = int(upstream.headers.get('content-length') or 0)
+        if length > self.max_bytes:
+            await upstream.aclose()
+            self._inflight.pop(key, None)
+            raise ProxyError(502, f"Upstream image exceeds {self.max_bytes} bytes")
+
+        self.stats["fetches"] += 1
+        download = Download(
+            self.cache.path(key, f"part-{uuid.uuid4().hex}"),
+            upstream.headers.get('content-type', 'image/jpeg'),
+        )
+        # The loop only keeps weak references to tasks; hold this one until it finishes
+        task = asyncio.create_task(self._pump(key, url, upstream, download))
+        self._downloads.add(task)
+        task.add_done_callback(self._downloads.discard)
+        return download
+
+    async def _pump(self, key: str, url: str, upstream: httpx.Response, download: Download):
+        """Copies the upstream body to disk and into the cache, independent of any client."""
+        try:
+            with open(download.path, 'wb') as handle:
+                async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+                    if download.written + len(chunk) > self.max_bytes:
+                        raise ProxyError(502, f"Upstream image exceeds {self.max_bytes} bytes")
+                    await asyncio.to_thread(_write_chunk, handle, chunk)
+                    await download.advance(len(chunk))
+            entry = CachedImage(
+                key=key,
+                url=url,
+                size=download.written,
+                content_type=download.content_type,
+                etag=upstream.headers.get('etag'),
+                last_modified=upstream.headers.get('last-modified'),
+                fetched_at=time.time(),
+            )
+            download.final_path = self.cache.path(key)
+            await asyncio.to_thread(self.cache.put, entry, download.path)
+            await download.advance(done=True)
+        except Exception as e:
+            logger.error(f"Image proxy download failed for {url}: {e}")
+            try:
+                os.remove(download.path)
+            except OSError:
+                pass
+            await download.advance(done=True, error=e if isinstance(e, ProxyError) else ProxyError(502, str(e)))
+        finally:
+            await upstream.aclose()
+            self._inflight.pop(key, None)
+
+    async def _cached_response(self, entry: CachedImage, headers) -> Response:
+        response_headers = {'Cache-Control': CLIENT_CACHE_CONTROL, 'Accept-Ranges': 'bytes', **CORS_HEADERS}
+        if entry.etag:
+            response_headers['ETag'] = entry.etag
+            if etag_matches(headers.get('if-none-match'), entry.etag):
+                return Response(status_code=304, headers=response_headers)
+        if entry.last_modified:
+            response_headers['Last-Modified'] = entry.last_modified
+
+        try:
+            handle = open(self.cache.path(entry.key), 'rb')
+        except FileNotFoundError:
+            raise ProxyError(503, "Cached image was evicted, retry")
+        byte_range = parse_range(headers.get('range'), entry.size)
+        if byte_range is None:
+            start, end, status = 0, entry.size - 1, 200
+        else:
+            (start, end), status = byte_range, 206
+            response_headers['Content-Range'] = f"bytes {start}-{end}/{entry.size}"
+        response_headers['Content-Length'] = str(end - start + 1)
+
+        async def body():
+            try:
+                await asyncio.to_thread(handle.seek, start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = await asyncio.to_thread(handle.read, min(CHUNK_SIZE * 16, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+            finally:
+                handle.close()
+
+        return StreamingResponse(body(), status_code=status, media_type=entry.content_type, headers=response_headers)
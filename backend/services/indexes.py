@@ -0,0 +1,80 @@
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Every query the API runs should be served by one of these indexes.
+# Collection -> indexes, ensured at startup by ensure_indexes().
+INDEXES = {
+    "floorplans": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # get_floorplans(user_id) sorted newest first; id breaks ties for keyset pages
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created"),
+        # get_floorplans() without a user filter
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created"),
+        # Blob prune reference checks (scripts/migrate_blobs.py --prune)
+        IndexModel([("canvas_data_blob.hash", ASCENDING)], name="canvas_blob_hash", sparse=True),
+        IndexModel([("three_d_data_blob.hash", ASCENDING)], name="three_d_blob_hash", sparse=True),
+    ],
+    "conversations": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created"),
+    ],
+    "messages": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("conversation_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="conversation_timestamp"),
+    ],
+    "user_preferences": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Databases with duplicates from before this index: run scripts/migrate_preferences.py first
+        IndexModel([("user_id", ASCENDING)], name="user_unique", unique=True),
+    ],
+    "feedback": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created"),
+    ],
+    "learning_data": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp"),
+    ],
+    "drive_upload_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created"),
+        IndexModel([("floorplan_id", ASCENDING), ("kind", ASCENDING), ("status", ASCENDING)], name="floorplan_kind_status"),
+    ],
+    "batches": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "analysis_cache": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+        IndexModel([("last_hit_at", ASCENDING)], name="last_hit"),
+    ],
+    "blobs": [
+        IndexModel([("hash", ASCENDING)], name="hash_unique", unique=True),
+    ],
+    "style_palettes": [
+        IndexModel([("style", ASCENDING)], name="style_unique", unique=True),
+    ],
+}
+
+
+async def ensure_indexes(db, registry: dict = None) -> dict:
+    """Creates any missing index from the registry; returns created names per collection.
+
+    create_indexes is idempotent, so this is cheap to run on every startup. A
+    failure on one collection (e.g. duplicates blocking a unique index) is
+    logged and does not stop the others.
+    """
+    created = {}
+    for collection_name, indexes in (registry or INDEXES).items():
+        try:
+            created[collection_name] = await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            logger.error(f"Could not create indexes on '{collection_name}': {e}")
+    return created
@@ -0,0 +1,302 @@
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 4))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+
+ACTIVE_STATES = ("queued", "running")
+TERMINAL_STATES = ("completed", "failed")
+# Oldest claimable job first
+CLAIM_SORT = [("created_at", 1)]
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """Handed to a job handler to read its parameters and report progress."""
+
+    def __init__(self, runner, job: dict):
+        self.runner = runner
+        self.job = job
+        self.id = job["id"]
+        self.params = job.get("params") or {}
+        self.floorplan_id = job.get("floorplan_id")
+
+    async def progress(self, progress: int, message: str = None):
+        await self.runner._update(self.id, {"progress": progress, "message": message})
+
+
+class JobRunner:
+    """Runs long operations (AI conversion, restyle, render) as persisted jobs.
+
+    Jobs live in a Mongo collection and are claimed atomically by a bounded
+    pool of workers, so any API process can report on any job. Handlers are
+    registered per kind and return a JSON-serializable result.
+
+    A job whose worker died is re-claimed once its lease expires, counting as
+    another attempt; after max_attempts claims it is failed instead, so a job
+    that crashes its process cannot loop forever.
+    """
+
+    def __init__(self, collection, concurrency: int = JOB_CONCURRENCY,
+                 max_attempts: int = JOB_MAX_ATTEMPTS,
+                 lease_seconds: float = 120.0, poll_interval: float = 5.0):
+        self.collection = collection
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._wakeup = asyncio.Event()
+        self._changed = {}
+        self._workers = []
+
+    def register(self, kind: str, handler, on_failure=None):
+        """Registers `async handler(ctx) -> dict` and an optional `async on_failure(ctx, error)`."""
+        self._handlers[kind] = (handler, on_failure)
+
+    async def start(self):
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(self.concurrency)]
+        logger.info(f"Job runner started with {self.concurrency} workers")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, kind: str, params: dict = None, floorplan_id: str = None, dedupe: bool = True) -> dict:
+        """Queues a job, or returns the active one for the same floor plan and kind (unless dedupe is off)."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        if floorplan_id and dedupe:
+            active = await self.collection.find_one(
+                {"floorplan_id": floorplan_id, "kind": kind, "status": {"$in": list(ACTIVE_STATES)}},
+                {"_id": 0}
+            )
+            if active:
+                return active
+
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "floorplan_id": floorplan_id,
+            "params": params or {},
+            "status": "queued",
+            "progress": 0,
+            "message": None,
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "lease_expires_at": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "updated_at": now,
+        }
+        await self.collection.insert_one(dict(job))
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> dict:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0, "lease_expires_at": 0})
+
+    def _attempts_exhausted(self, exhausted: bool = True) -> dict:
+        # Jobs queued before attempts were tracked count as never claimed
+        compare = "$gte" if exhausted else "$lt"
+        return {"$expr": {compare: [
+            {"$ifNull": ["$attempts", 0]},
+            {"$ifNull": ["$max_attempts", self.max_attempts]},
+        ]}}
+
+    async def watch(self, job_id: str, heartbeat: float = 15.0):
+        """Yields the job whenever it changes (or None as a keep-alive) until it finishes.
+
+        Changes made by this process are pushed immediately; jobs running in
+        another process are picked up by polling.
+        """
+        last = None
+        waited = 0.0
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in TERMINAL_STATES:
+                self._changed.pop(job_id, None)
+                if job is not None:
+                    yield job
+                return
+            snapshot = (job["status"], job.get("progress"), job.get("message"))
+            if snapshot != last:
+                last = snapshot
+                waited = 0.0
+                yield job
+
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                waited += 1.0
+                if waited >= heartbeat:
+                    waited = 0.0
+                    yield None
+            changed.clear()
+
+    async def _update(self, job_id: str, fields: dict):
+        fields["updated_at"] = _now()
+        await self.collection.update_one({"id": job_id}, {"$set": fields})
+        changed = self._changed.get(job_id)
+        if changed:
+            changed.set()
+
+    def _claim_filter(self, now: datetime) -> dict:
+        return {
+            "kind": {"$in": list(self._handlers)},
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_expires_at": {"$lt": now}, **self._attempts_exhausted(False)},
+            ],
+        }
+
+    def _exhausted_filter(self, now: datetime) -> dict:
+        return {
+            "kind": {"$in": list(self._handlers)},
+            "status": "running",
+            "lease_expires_at": {"$lt": now},
+            **self._attempts_exhausted(),
+        }
+
+    async def _claim(self):
+        now = _now()
+        return await self.collection.find_one_and_update(
+            self._claim_filter(now),
+            {
+                "$set": {
+                    "status": "running",
+                    "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=CLAIM_SORT,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self, n: int):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {n} failed to claim a job: {e}")
+                job = None
+
+            if not job:
+                try:
+                    await self._fail_exhausted()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Job worker {n} failed to expire exhausted jobs: {e}")
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Left as running; re-claimed once the lease expires, while attempts remain
+                logger.error(f"Job worker {n} crashed on job {job['id']}: {e}", exc_info=True)
+
+    async def _run(self, job: dict):
+        handler, on_failure = self._handlers[job["kind"]]
+        ctx = JobContext(self, job)
+        changed = self._changed.get(job["id"])
+        if changed:
+            changed.set()
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await handler(ctx)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}", exc_info=True)
+            await self._on_failure(ctx, on_failure, e)
+            await self._update(job["id"], {
+                "status": "failed",
+                "error": str(e),
+                "finished_at": _now(),
+                "lease_expires_at": None,
+            })
+        else:
+            await self._update(job["id"], {
+                "status": "completed",
+                "progress": 100,
+                "result": result,
+                "finished_at": _now(),
+                "lease_expires_at": None,
+            })
+        finally:
+            heartbeat.cancel()
+            self._changed.pop(job["id"], None)
+
+    async def _on_failure(self, ctx: JobContext, on_failure, error: Exception):
+        if on_failure:
+            try:
+                await on_failure(ctx, error)
+            except Exception as hook_error:
+                logger.error(f"Failure hook for job {ctx.id} raised: {hook_error}")
+
+    async def _fail_exhausted(self):
+        """Fails running jobs whose lease expired on their last allowed attempt.
+
+        Their worker died mid-run every time, so they are not claimed again.
+        Each update is conditional on the lease read, so only one process
+        fails a job and runs its failure hook.
+        """
+        stale = await self.collection.find(self._exhausted_filter(_now()), {"_id": 0}).to_list(100)
+        for job in stale:
+            error = f"Worker stopped during each of {job.get('attempts', 0)} attempts"
+            now = _now()
+            result = await self.collection.update_one(
+                {"id": job["id"], "status": "running", "lease_expires_at": job["lease_expires_at"]},
+                {"$set": {
+                    "status": "failed",
+                    "error": error,
+                    "finished_at": now,
+                    "lease_expires_at": None,
+                    "updated_at": now,
+                }}
+            )
+            if not result.modified_count:
+                continue
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {error}")
+            _, on_failure = self._handlers[job["kind"]]
+            await self._on_failure(JobContext(self, job), on_failure, RuntimeError(error))
+            changed = self._changed.get(job["id"])
+            if changed:
+                changed.set()
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self.collection.update_one(
+                {"id": job_id, "status": "running"},
+                {"$set": {"lease_expires_at": _now() + timedelta(seconds=self.lease_seconds)}}
+            )
@@ -0,0 +1,140 @@
+import copy
+
+# RFC 6902 operations and the members each one requires besides "op" and "path"
+OPERATIONS = {
+    "add": ("value",),
+    "remove": (),
+    "replace": ("value",),
+    "move": ("from",),
+    "copy": ("from",),
+    "test": ("value",),
+}
+
+
+class JsonPatchError(ValueError):
+    """Raised for a malformed patch, or one that does not apply to the document (including a failed test)."""
+
+
+def parse_pointer(pointer: str) -> list:
+    """Splits an RFC 6901 JSON Pointer into unescaped reference tokens."""
+    if not isinstance(pointer, str):
+        raise JsonPatchError(f"Invalid JSON Pointer {pointer!r}")
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"JSON Pointer must start with '/': {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _index(container: list, token: str, pointer: str, allow_end: bool = False) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index '{token}' in {pointer}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index {index} out of range in {pointer}")
+    return index
+
+
+def _resolve(document, tokens: list, pointer: str):
+    """The value `tokens` point at."""
+    value = document
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise JsonPatchError(f"Path {pointer} does not exist")
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_index(value, token, pointer)]
+        else:
+            raise JsonPatchError(f"Path {pointer} does not exist")
+    return value
+
+
+def _parent(document, tokens: list, pointer: str):
+    """(container, last token) for a path; the container must exist."""
+    if not tokens:
+        raise JsonPatchError("The document root cannot be the target here")
+    container = _resolve(document, tokens[:-1], pointer)
+    if not isinstance(container, (dict, list)):
+        raise JsonPatchError(f"Path {pointer} does not exist")
+    return container, tokens[-1]
+
+
+def _add(document, tokens: list, value, pointer: str):
+    if not tokens:
+        return value
+    container, token = _parent(document, tokens, pointer)
+    if isinstance(container, dict):
+        container[token] = value
+    else:
+        container.insert(_index(container, token, pointer, allow_end=True), value)
+    return document
+
+
+def _remove(document, tokens: list, pointer: str):
+    container, token = _parent(document, tokens, pointer)
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError(f"Path {pointer} does not exist")
+        return container.pop(token)
+    return container.pop(_index(container, token, pointer))
+
+
+def _equal(a, b) -> bool:
+    # JSON equality: no bool/number mixing, order-sensitive arrays, unordered objects
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    return type(a) is type(b) and a == b
+
+
+def apply_patch(document, patch: list):
+    """Applies an RFC 6902 patch and returns the patched document.
+
+    All-or-nothing: the operations run on a copy, so `document` is left
+    untouched when any of them fails.
+    """
+    if not isinstance(patch, list):
+        raise JsonPatchError("A JSON Patch must be an array of operations")
+    document = copy.deepcopy(document)
+    for number, operation in enumerate(patch):
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise JsonPatchError(f"Operation {number}: unknown or missing 'op'")
+        op = operation["op"]
+        missing = [member for member in ("path",) + OPERATIONS[op] if member not in operation]
+        if missing:
+            raise JsonPatchError(f"Operation {number} ({op}): missing {', '.join(missing)}")
+        pointer = operation["path"]
+        tokens = parse_pointer(pointer)
+        try:
+            if op == "add":
+                document = _add(document, tokens, copy.deepcopy(operation["value"]), pointer)
+            elif op == "remove":
+                _remove(document, tokens, pointer)
+            elif op == "replace":
+                _resolve(document, tokens, pointer)
+                if tokens:
+                    _remove(document, tokens, pointer)
+                document = _add(document, tokens, copy.deepcopy(operation["value"]), pointer)
+            elif op in ("move", "copy"):
+                source = parse_pointer(operation["from"])
+                if op == "move" and tokens[:len(source)] == source and tokens != source:
+                    raise JsonPatchError(f"Cannot move {operation['from']} into its own child {pointer}")
+                if op == "move":
+                    value = _remove(document, source, operation["from"]) if source else document
+                else:
+                    value = copy.deepcopy(_resolve(document, source, operation["from"]))
+                document = _add(document, tokens, value, pointer)
+            elif op == "test":
+                if not _equal(_resolve(document, tokens, pointer), operation["value"]):
+                    raise JsonPatchError(f"Test failed at {pointer}")
+        except JsonPatchError as e:
+            raise JsonPatchError(f"Operation {number} ({op}): {e}")
+    return document
@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+
+import httpx
+from openai import AsyncOpenAI
+
+try:
+    from anthropic import AsyncAnthropic
+except ImportError:  # optional provider SDK
+    AsyncAnthropic = None
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("openai", "anthropic", "gemini")
+GEMINI_OPENAI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+@dataclass
+class ProviderLimits:
+    max_concurrency: int = 8
+    tokens_per_minute: int = 200_000
+    timeout: float = 60.0
+    max_retries: int = 3
+
+    @classmethod
+    def from_env(cls, provider: str) -> "ProviderLimits":
+        prefix = f"LLM_{provider.upper()}_"
+        return cls(
+            max_concurrency=int(os.environ.get(prefix + 'CONCURRENCY', cls.max_concurrency)),
+            tokens_per_minute=int(os.environ.get(prefix + 'TPM', cls.tokens_per_minute)),
+            timeout=float(os.environ.get(prefix + 'TIMEOUT', cls.timeout)),
+            max_retries=int(os.environ.get(prefix + 'MAX_RETRIES', cls.max_retries)),
+        )
+
+
+class TokenBucket:
+    """Token-per-minute limiter; callers wait until enough budget has refilled.
+
+    Each caller reserves its tokens up front, possibly driving the balance
+    negative, and then sleeps off its share of that debt without holding the
+    lock, so a large request never stalls the callers queued behind it.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        # A single request larger than the bucket is let through once it is full
+        tokens = min(float(tokens), self.capacity)
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class ProviderStats:
+    def __init__(self, window: int = 500):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, 'prompt_tokens', None) or getattr(usage, 'input_tokens', 0) or 0
+        self.completion_tokens += getattr(usage, 'completion_tokens', None) or getattr(usage, 'output_tokens', 0) or 0
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_p50_s": percentile(0.5),
+            "latency_p95_s": percentile(0.95),
+        }
+
+
+def estimate_tokens(payload, max_tokens: int = 0) -> int:
+    """Rough prompt size (4 chars per token) plus the completion budget."""
+    return len(json.dumps(payload, default=str)) // 4 + (max_tokens or 0)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError", "ServiceUnavailableError")
+
+
+class LLMGateway:
+    """One place for all LLM traffic: pooled clients, limits, timeouts, retries and stats.
+
+    Created once per process and started in the app lifespan, so TLS
+    connections are reused across requests. Each provider has its own
+    concurrency semaphore and token bucket; bursts queue here instead of
+    turning into provider 429s.
+    """
+
+    def __init__(self, limits: dict = None):
+        self.limits = {p: (limits or {}).get(p) or ProviderLimits.from_env(p) for p in PROVIDERS}
+        self._semaphores = {p: asyncio.Semaphore(l.max_concurrency) for p, l in self.limits.items()}
+        self._buckets = {p: TokenBucket(l.tokens_per_minute) for p, l in self.limits.items()}
+        self._stats = {p: ProviderStats() for p in PROVIDERS}
+        self._http = None
+        self._clients = {}
+
+    async def start(self):
+        max_connections = sum(l.max_concurrency for l in self.limits.values())
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(max(l.timeout for l in self.limits.values()), connect=10.0),
+        )
+        # SDK-level retries are disabled; retry policy lives in call().
+        # A provider without a key gets no client, so client() fails fast for it.
+        if os.environ.get('OPENAI_API_KEY'):
+            self._clients["openai"] = AsyncOpenAI(
+                api_key=os.environ['OPENAI_API_KEY'], http_client=self._http, max_retries=0
+            )
+        if os.environ.get('GEMINI_API_KEY'):
+            self._clients["gemini"] = AsyncOpenAI(
+                api_key=os.environ['GEMINI_API_KEY'], base_url=GEMINI_OPENAI_BASE_URL,
+                http_client=self._http, max_retries=0
+            )
+        if AsyncAnthropic and os.environ.get('ANTHROPIC_API_KEY'):
+            self._clients["anthropic"] = AsyncAnthropic(
+                api_key=os.environ['ANTHROPIC_API_KEY'], http_client=self._http, max_retries=0
+            )
+        logger.info(f"LLM gateway started with clients: {', '.join(sorted(self._clients))}")
+
+    async def close(self):
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+        self._clients = {}
+
+    def client(self, provider: str):
+        client = self._clients.get(provider)
+        if client is None:
+            raise RuntimeError(f"LLM provider '{provider}' is not configured")
+        return client
+
+    async def call(self, provider: str, make_request, estimated_tokens: int = 0):
+        """Runs `await make_request()` under the provider's limits with timeout and jittered retries."""
+        limits = self.limits[provider]
+        stats = self._stats[provider]
+        await self._buckets[provider].acquire(estimated_tokens)
+        attempt = 0
+        while True:
+            attempt += 1
+            # The slot is held per attempt only; backoff sleeps leave it to fresh requests
+            async with self._semaphores[provider]:
+                stats.calls += 1
+                stats.in_flight += 1
+                started = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(make_request(), timeout=limits.timeout)
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+                finally:
+                    stats.in_flight -= 1
+                    stats.latencies.append(time.perf_counter() - started)
+
+            if error is None:
+                stats.record_usage(getattr(result, 'usage', None))
+                return result
+            stats.errors += 1
+            if isinstance(error, asyncio.TimeoutError):
+                stats.timeouts += 1
+            if attempt > limits.max_retries or not is_retryable(error):
+                raise error
+            stats.retries += 1
+            # Full jitter: spread retries from a burst of callers
+            delay = random.uniform(0, min(20.0, 0.5 * 2 ** attempt))
+            logger.warning(f"{provider} call failed ({type(error).__name__}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def chat_completion(self, provider: str = "openai", **kwargs):
+        """OpenAI-style chat completion through a pooled client (openai or gemini)."""
+        client = self.client(provider)
+        estimated = estimate_tokens(kwargs.get("messages"), kwargs.get("max_tokens") or 1000)
+        return await self.call(provider, lambda: client.chat.completions.create(**kwargs), estimated)
+
+    async def complete_chat(self, provider: str, model: str, system: str, messages: list,
+                            max_tokens: int = 2000) -> str:
+        """Non-streaming chat reply text from any configured provider."""
+        client = self.client(provider)
+        estimated = estimate_tokens([system, messages], max_tokens)
+        if provider == "anthropic":
+            response = await self.call(provider, lambda: client.messages.create(
+                model=model, system=system, messages=messages, max_tokens=max_tokens
+            ), estimated)
+            return "".join(block.text for block in response.content if getattr(block, "text", None))
+        response = await self.call(provider, lambda: client.chat.completions.create(
+            model=model, messages=[{"role": "system", "content": system}] + messages, max_tokens=max_tokens
+        ), estimated)
+        return response.choices[0].message.content or ""
+
+    async def stream_chat(self, provider: str, model: str, system: str, messages: list, max_tokens: int = 2000):
+        """Yields text deltas as the provider produces them.
+
+        The provider slot is held for the whole stream. Connection failures are
+        retried only before the first token; a gap longer than the timeout
+        between tokens aborts the stream. Closing the generator (e.g. on client
+        disconnect) closes the upstream response and stops generation.
+        """
+        client = self.client(provider)
+        limits = self.limits[provider]
+        stats = self._stats[provider]
+        await self._buckets[provider].acquire(estimate_tokens([system, messages], max_tokens))
+        if provider == "anthropic":
+            open_stream = lambda: client.messages.create(
+                model=model, system=system, messages=messages, max_tokens=max_tokens, stream=True
+            )
+        else:
+            open_stream = lambda: client.chat.completions.create(
+                model=model,
+                messages=[{"role": "system", "content": system}] + messages,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        stats.calls += 1
+        stats.in_flight += 1
+        started = time.perf_counter()
+        try:
+            stream = await self._open_stream(provider, open_stream)
+            try:
+                iterator = stream.__aiter__()
+                while True:
+                    try:
+                        event = await asyncio.wait_for(iterator.__anext__(), timeout=limits.timeout)
+                    except StopAsyncIteration:
+                        break
+                    delta = self._stream_delta(provider, event, stats)
+                    if delta:
+                        yield delta
+            finally:
+                try:
+                    await stream.close()
+                finally:
+                    self._semaphores[provider].release()
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+            stats.latencies.append(time.perf_counter() - started)
+
+    async def _open_stream(self, provider: str, open_stream):
+        """Opens the stream and returns it holding a provider slot, which the caller releases.
+
+        The slot is given back between attempts, so backoff sleeps do not block
+        other requests.
+        """
+        limits = self.limits[provider]
+        semaphore = self._semaphores[provider]
+        attempt = 0
+        while True:
+            attempt += 1
+            await semaphore.acquire()
+            try:
+                return await asyncio.wait_for(open_stream(), timeout=limits.timeout)
+            except BaseException as e:
+                semaphore.release()
+                if not isinstance(e, Exception) or attempt > limits.max_retries or not is_retryable(e):
+                    raise
+                self._stats[provider].retries += 1
+                delay = random.uniform(0, min(20.0, 0.5 * 2 ** attempt))
+                logger.warning(f"{provider} stream failed to open ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _stream_delta(provider: str, event, stats: ProviderStats):
+        if provider == "anthropic":
+            if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                return event.delta.text
+            if event.type == "message_start":
+                stats.prompt_tokens += getattr(event.message.usage, "input_tokens", 0) or 0
+            elif event.type == "message_delta":
+                stats.completion_tokens += getattr(event.usage, "output_tokens", 0) or 0
+            return None
+        if getattr(event, "usage", None):
+            stats.record_usage(event.usage)
+        if event.choices:
+            return event.choices[0].delta.content
+        return None
+
+    def stats(self) -> dict:
+        return {
+            provider: {
+                **self._stats[provider].snapshot(),
+                "configured": provider in self._clients,
+                "max_concurrency": self.limits[provider].max_concurrency,
+                "tokens_per_minute": self.limits[provider].tokens_per_minute,
+            }
+            for provider in PROVIDERS
+        }
@@ -0,0 +1,466 @@
+import os
+import json
+import math
+import struct
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter
+
+import numpy as np
+
+from services.geometry import PlanarGraph, SegmentGrid, SCENE_HOST_METERS, SCENE_SNAP_METERS
+from services.process_pool import run_in_process
+from services.style_engine import geometry_hash
+
+logger = logging.getLogger(__name__)
+
+# Bump when the baked output changes, so cached meshes are rebuilt
+MESH_VERSION = 1
+MESH_CACHE_BYTES = int(os.environ.get('MESH_CACHE_BYTES', 512 * 1024 * 1024))
+
+WALL_COLOR = "#cbd5e1"
+FLOOR_COLOR = "#e5e7eb"
+GLASS_COLOR = "#a5d8ff"
+DOOR_HEIGHT = 2.1
+WINDOW_HEIGHT = 1.2
+WINDOW_SILL = 0.9
+GLASS_THICKNESS = 0.02
+MIN_FLOOR_AREA = 0.5  # m²
+
+# glTF constants
+FLOAT, UNSIGNED_SHORT, UNSIGNED_INT = 5126, 5123, 5125
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+
+
+def mesh_cache_dir() -> str:
+    path = os.environ.get('MESH_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'meshes')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def mesh_hash(three_d_data: dict) -> str:
+    """Cache key for the baked mesh: geometry hash plus the colors, plus the baker version."""
+    colors = [
+        [item.get("color") for item in three_d_data.get(key) or [] if isinstance(item, dict)]
+        for key in ("walls", "rooms")
+    ]
+    style = json.dumps(colors, separators=(',', ':'))
+    return hashlib.sha256(f"{MESH_VERSION}:{geometry_hash(three_d_data)}:{style}".encode('utf-8')).hexdigest()[:40]
+
+
+def _box_template():
+    """Unit cube as 24 corners (4 per face, for flat normals) in [0, 1]³, outward-facing triangles."""
+    corners, normals, indices = [], [], []
+    for axis in range(3):
+        for side in (0, 1):
+            normal = np.zeros(3)
+            normal[axis] = 1 if side else -1
+            u, v = (axis + 1) % 3, (axis + 2) % 3
+            quad = np.zeros((4, 3))
+            quad[:, axis] = side
+            quad[:, u] = (0, 1, 1, 0)
+            quad[:, v] = (0, 0, 1, 1)
+            if np.dot(np.cross(quad[1] - quad[0], quad[2] - quad[0]), normal) < 0:
+                quad = quad[::-1]
+            base = len(corners)
+            corners.extend(quad)
+            normals.extend([normal] * 4)
+            indices.extend([base, base + 1, base + 2, base, base + 2, base + 3])
+    return np.array(corners), np.array(normals), np.array(indices, dtype=np.uint32)
+
+
+BOX_CORNERS, BOX_NORMALS, BOX_INDICES = _box_template()
+
+
+def boxes_to_mesh(boxes: np.ndarray, frames: np.ndarray) -> tuple:
+    """Triangles for many oriented boxes at once.
+
+    `boxes` is (n, 6): along-wall start/end, bottom/top, across-wall
+    start/end, in the local frame of each box. `frames` is (n, 4): origin x,
+    z and unit direction x, z of that frame on the plan. Plan (x, y) maps to
+    glTF (x, z), with y up.
+    """
+    low = boxes[:, [0, 2, 4]]
+    high = boxes[:, [1, 3, 5]]
+    local = low[:, None, :] + BOX_CORNERS[None] * (high - low)[:, None, :]
+    ox, oz, dx, dz = (frames[:, i][:, None] for i in range(4))
+    nx, nz = -dz, dx
+    positions = np.stack([
+        ox + local[..., 0] * dx + local[..., 2] * nx,
+        local[..., 1],
+        oz + local[..., 0] * dz + local[..., 2] * nz,
+    ], axis=-1)
+    n = BOX_NORMALS[None]
+    normals = np.stack([
+        n[..., 0] * dx + n[..., 2] * nx,
+        np.broadcast_to(n[..., 1], local.shape[:2]),
+        n[..., 0] * dz + n[..., 2] * nz,
+    ], axis=-1)
+    indices = (BOX_INDICES[None] + (np.arange(len(boxes), dtype=np.uint32) * len(BOX_CORNERS))[:, None]).ravel()
+    return positions.reshape(-1, 3), normals.reshape(-1, 3), indices
+
+
+def triangulate(polygon: np.ndarray) -> list:
+    """Ear-clipping triangulation of a simple polygon; index triples, counter-clockwise on the plan."""
+    count = len(polygon)
+    if count < 3:
+        return []
+    x, y = polygon[:, 0], polygon[:, 1]
+    area = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+    remaining = list(range(count)) if area >= 0 else list(range(count))[::-1]
+
+    def cross(a, b, c):
+        return (polygon[b][0] - polygon[a][0]) * (polygon[c][1] - polygon[a][1]) \
+            - (polygon[b][1] - polygon[a][1]) * (polygon[c][0] - polygon[a][0])
+
+    triangles = []
+    while len(remaining) > 3:
+        for i in range(len(remaining)):
+            a, b, c = remaining[i - 1], remaining[i], remaining[(i + 1) % len(remaining)]
+            turn = cross(a, b, c)
+            if abs(turn) < 1e-12:
+                remaining.pop(i)  # collinear vertex
+                break
+            if turn < 0:
+                continue  # reflex
+            if any(
+                cross(a, b, p) >= 0 and cross(b, c, p) >= 0 and cross(c, a, p) >= 0
+                for p in remaining if p not in (a, b, c)
+            ):
+                continue
+            triangles.append((a, b, c))
+            remaining.pop(i)
+            break
+        else:
+            break  # not simple; fan what is left
+    triangles.extend((remaining[0], remaining[i], remaining[i + 1]) for i in range(1, len(remaining) - 1))
+    return triangles
+
+
+def floor_polygons(three_d_data: dict, segments: np.ndarray) -> list:
+    """(polygon, color) for every floor: room outlines when known, else the faces the walls enclose."""
+    rooms = [room for room in three_d_data.get("rooms") or [] if isinstance(room, dict)]
+    floors = []
+    for room in rooms:
+        try:
+            polygon = np.array(room.get("polygon") or [], dtype=np.float64).reshape(-1, 2)
+        except (TypeError, ValueError):
+            continue
+        if len(polygon) >= 3:
+            floors.append((polygon, room.get("color") or FLOOR_COLOR))
+    if floors or len(segments) < 3:
+        return floors
+
+    colors = Counter(room["color"] for room in rooms if room.get("color"))
+    color = colors.most_common(1)[0][0] if colors else FLOOR_COLOR
+    graph = PlanarGraph(segments, SCENE_SNAP_METERS)
+    if graph.edge_count == 0:
+        return floors
+    face, cycles = graph.faces()
+    areas = graph.face_areas(face, len(cycles))
+    for face_id in np.flatnonzero(areas >= MIN_FLOOR_AREA):
+        floors.append((graph.vertices[graph.origin[cycles[face_id]]], color))
+    return floors
+
+
+def _number(value, default: float) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if math.isfinite(number) else default
+
+
+def scene_meshes(three_d_data: dict) -> dict:
+    """Triangles grouped by material: {(kind, color): (positions, normals, indices)}."""
+    walls, segments = [], []
+    for wall in three_d_data.get("walls") or []:
+        if not isinstance(wall, dict):
+            continue
+        try:
+            x1, y1 = float(wall["start"][0]), float(wall["start"][1])
+            x2, y2 = float(wall["end"][0]), float(wall["end"][1])
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+        if math.hypot(x2 - x1, y2 - y1) < 1e-6:
+            continue
+        walls.append(wall)
+        segments.append((x1, y1, x2, y2))
+    segments = np.array(segments, dtype=np.float64).reshape(-1, 4)
+
+    # Openings per wall, from the normalization pass or the nearest wall
+    index = SegmentGrid(segments) if len(segments) else None
+    openings = [[] for _ in walls]
+    for key, default_height, default_sill in (("doors", DOOR_HEIGHT, 0.0), ("windows", WINDOW_HEIGHT, WINDOW_SILL)):
+        for item in three_d_data.get(key) or []:
+            if not isinstance(item, dict) or index is None:
+                continue
+            host = item.get("wall")
+            if isinstance(host, int) and 0 <= host < len(walls) and "offset" in item:
+                offset = _number(item["offset"], 0.0)
+            else:
+                try:
+                    x, y = float(item["position"][0]), float(item["position"][1])
+                except (KeyError, IndexError, TypeError, ValueError):
+                    continue
+                found = index.nearest(x, y, SCENE_HOST_METERS)
+                if found is None:
+                    continue
+                host, offset, _ = found
+            width = _number(item.get("width"), 0.0)
+            height = _number(item.get("height"), default_height)
+            sill = _number(item.get("sill"), default_sill)
+            if width > 0 and height > 0:
+                openings[host].append((offset - width / 2, offset + width / 2, sill, sill + height, key == "windows"))
+
+    groups = {}
+
+    def add(kind, color, box, frame):
+        groups.setdefault((kind, color), ([], []))
+        groups[(kind, color)][0].append(box)
+        groups[(kind, color)][1].append(frame)
+
+    for wall, (x1, y1, x2, y2), holes in zip(walls, segments, openings):
+        length = math.hypot(x2 - x1, y2 - y1)
+        frame = (x1, y1, (x2 - x1) / length, (y2 - y1) / length)
+        height = _number(wall.get("height"), 2.8)
+        half = _number(wall.get("thickness"), 0.2) / 2
+        color = wall.get("color") or WALL_COLOR
+        # Solid stretches run half a thickness past each end, closing the corners
+        cursor = -half
+        for start, end, bottom, top, glazed in sorted(holes):
+            start, end = max(start, cursor, 0.0), min(end, length)
+            bottom, top = max(bottom, 0.0), min(top, height)
+            if end <= start or top <= bottom:
+                continue
+            if start > cursor:
+                add("wall", color, (cursor, start, 0.0, height, -half, half), frame)
+            if bottom > 0:
+                add("wall", color, (start, end, 0.0, bottom, -half, half), frame)
+            if top < height:
+                add("wall", color, (start, end, top, height, -half, half), frame)
+            if glazed:
+                add("glass", GLASS_COLOR, (start, end, bottom, top, -GLASS_THICKNESS / 2, GLASS_THICKNESS / 2), frame)
+            cursor = end
+        if cursor < length + half:
+            add("wall", color, (cursor, length + half, 0.0, height, -half, half), frame)
+
+    meshes = {}
+    for key, (boxes, frames) in groups.items():
+        meshes[key] = boxes_to_mesh(np.array(boxes, dtype=np.float64), np.array(frames, dtype=np.float64))
+
+    for polygon, color in floor_polygons(three_d_data, segments):
+        triangles = triangulate(polygon)
+        if not triangles:
+            continue
+        positions = np.column_stack([polygon[:, 0], np.zeros(len(polygon)), polygon[:, 1]])
+        # Counter-clockwise on the plan faces down once y becomes z; flip to face up
+        indices = np.array([(a, c, b) for a, b, c in triangles], dtype=np.uint32).ravel()
+        normals = np.tile([0.0, 1.0, 0.0], (len(polygon), 1))
+        key = ("floor", color)
+        if key in meshes:
+            p, n, i = meshes[key]
+            meshes[key] = (np.vstack([p, positions]), np.vstack([n, normals]), np.concatenate([i, indices + len(p)]))
+        else:
+            meshes[key] = (positions, normals, indices)
+    return meshes
+
+
+def _linear_rgb(color: str) -> list:
+    """sRGB hex to the linear RGB glTF expects in baseColorFactor."""
+    color = (color or "").lstrip('#')
+    if len(color) == 3:
+        color = "".join(c * 2 for c in color)
+    try:
+        channels = [int(color[i:i + 2], 16) / 255 for i in (0, 2, 4)]
+    except ValueError:
+        channels = [0.8, 0.8, 0.8]
+    return [c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4 for c in channels]
+
+
+def encode_glb(meshes: dict) -> bytes:
+    """One glTF mesh with a primitive per material, in a single binary buffer."""
+    gltf = {
+        "asset": {"version": "2.0", "generator": "floorplan mesh baker"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "name": "floorplan"}],
+        "meshes": [{"name": "floorplan", "primitives": []}],
+        "materials": [],
+        "accessors": [],
+        "bufferViews": [],
+    }
+    body = bytearray()
+
+    def view(data: bytes, target: int) -> int:
+        body.extend(b"\x00" * (-len(body) % 4))
+        gltf["bufferViews"].append({"buffer": 0, "byteOffset": len(body), "byteLength": len(data), "target": target})
+        body.extend(data)
+        return len(gltf["bufferViews"]) - 1
+
+    def accessor(**fields) -> int:
+        gltf["accessors"].append(fields)
+        return len(gltf["accessors"]) - 1
+
+    for (kind, color), (positions, normals, indices) in sorted(meshes.items()):
+        if not len(indices):
+            continue
+        positions = positions.astype(np.float32)
+        material = {
+            "name": f"{kind}-{color}",
+            "pbrMetallicRoughness": {
+                "baseColorFactor": _linear_rgb(color) + [0.35 if kind == "glass" else 1.0],
+                "metallicFactor": 0.0,
+                "roughnessFactor": 0.1 if kind == "glass" else 0.8,
+            },
+        }
+        if kind == "glass":
+            material["alphaMode"] = "BLEND"
+            material["doubleSided"] = True
+        gltf["materials"].append(material)
+        index_type = UNSIGNED_SHORT if len(positions) < 65536 else UNSIGNED_INT
+        index_data = indices.astype(np.uint16 if index_type == UNSIGNED_SHORT else np.uint32)
+        gltf["meshes"][0]["primitives"].append({
+            "attributes": {
+                "POSITION": accessor(
+                    bufferView=view(positions.tobytes(), ARRAY_BUFFER), componentType=FLOAT,
+                    count=len(positions), type="VEC3",
+                    min=positions.min(axis=0).tolist(), max=positions.max(axis=0).tolist(),
+                ),
+                "NORMAL": accessor(
+                    bufferView=view(normals.astype(np.float32).tobytes(), ARRAY_BUFFER), componentType=FLOAT,
+                    count=len(normals), type="VEC3",
+                ),
+            },
+            "indices": accessor(
+                bufferView=view(index_data.tobytes(), ELEMENT_ARRAY_BUFFER), componentType=index_type,
+                count=len(index_data), type="SCALAR",
+            ),
+            "material": len(gltf["materials"]) - 1,
+        })
+
+    if not gltf["meshes"][0]["primitives"]:
+        # glTF requires at least one primitive per mesh; an empty scene has no mesh at all
+        gltf["nodes"] = [{"name": "floorplan"}]
+        for key in ("meshes", "materials", "accessors", "bufferViews"):
+            del gltf[key]
+    body.extend(b"\x00" * (-len(body) % 4))
+    if body:
+        gltf["buffers"] = [{"byteLength": len(body)}]
+
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    chunks = struct.pack("<II", len(json_chunk), 0x4E4F534A) + json_chunk
+    if body:
+        chunks += struct.pack("<II", len(body), 0x004E4942) + bytes(body)
+    return struct.pack("<III", 0x46546C67, 2, 12 + len(chunks)) + chunks
+
+
+def bake_glb(three_d_data: dict, path: str) -> dict:
+    """Writes the scene as a GLB file; runs in a worker process."""
+    meshes = scene_meshes(three_d_data)
+    data = encode_glb(meshes)
+    with open(path, 'wb') as handle:
+        handle.write(data)
+    return {
+        "bytes": len(data),
+        "materials": len(meshes),
+        "triangles": int(sum(len(indices) for _, _, indices in meshes.values()) // 3),
+    }
+
+
+class MeshBaker:
+    """GLB files baked from three_d_data, cached on disk by mesh_hash.
+
+    Baking happens in the shared process pool; concurrent requests for the
+    same scene share one bake. The cache directory is kept under
+    `cache_bytes`, evicting the least recently used meshes; a mesh being
+    opened through open_glb() is pinned and never evicted.
+    """
+
+    def __init__(self, cache_bytes: int = MESH_CACHE_BYTES):
+        self.cache_bytes = cache_bytes
+        self._inflight = {}
+        # Path -> number of open_glb() calls opening it; evict() runs in a thread
+        self._pins = {}
+        self._pins_lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(mesh_cache_dir(), f"{key}.glb")
+
+    async def glb_path(self, key: str, three_d_data: dict) -> str:
+        """Path of the baked mesh for `key` (see mesh_hash), baking it if needed."""
+        path = self.path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._bake(key, three_d_data))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def open_glb(self, key: str, three_d_data: dict):
+        """The baked mesh for `key` opened for reading, baking it if needed.
+
+        The file is pinned until it is open; after that an eviction only
+        unlinks its name. If another process evicted it in between, it is
+        baked again.
+        """
+        path = self.path(key)
+        self._pin(path, 1)
+        try:
+            for attempt in range(2):
+                path = await self.glb_path(key, three_d_data)
+                try:
+                    return open(path, 'rb')
+                except FileNotFoundError:
+                    if attempt:
+                        raise
+        finally:
+            self._pin(self.path(key), -1)
+
+    def _pin(self, path: str, delta: int):
+        with self._pins_lock:
+            count = self._pins.get(path, 0) + delta
+            if count:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    async def _bake(self, key: str, three_d_data: dict) -> str:
+        path = self.path(key)
+        work_path = f"{path}.part-{os.getpid()}-{id(three_d_data)}"
+        try:
+            stats = await run_in_process(bake_glb, three_d_data, work_path)
+            os.replace(work_path, path)
+        finally:
+            if os.path.exists(work_path):
+                os.remove(work_path)
+        logger.info(f"Baked mesh {key}: {stats['triangles']} triangles, {stats['materials']} materials, {stats['bytes']} bytes")
+        await asyncio.to_thread(self.evict)
+        return path
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(mesh_cache_dir()):
+            if entry.name.endswith(".glb"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_bytes:
+                break
+            with self._pins_lock:
+                if path in self._pins:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
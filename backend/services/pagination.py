@@ -0,0 +1,82 @@
+import json
+import base64
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    """Opaque cursor pointing just past `doc` in (sort_field, id) order."""
+    value = doc.get(sort_field)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps({"v": value, "id": doc["id"]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Returns (sort_value, id) from a cursor produced by encode_cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        value = data["v"]
+        if isinstance(value, dict) and "$date" in value:
+            value = datetime.fromisoformat(value["$date"])
+        return value, data["id"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+
+
+def keyset_sort(sort_field: str, direction: int) -> list:
+    """Sort on the key plus id, so pages are stable when sort values tie."""
+    return [(sort_field, direction), ("id", direction)]
+
+
+def keyset_query(query: dict, sort_field: str, direction: int, after: str = None) -> dict:
+    """Adds the "strictly after the cursor" condition to a filter."""
+    if not after:
+        return query
+    value, last_id = decode_cursor(after)
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$and": [query, {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "id": {op: last_id}},
+    ]}]}
+
+
+def find_page(collection, query: dict, sort_field: str, direction: int,
+              after: str = None, limit: int = None, projection: dict = None):
+    """Motor cursor for one keyset page (no limit when `limit` is None)."""
+    cursor = collection.find(
+        keyset_query(query, sort_field, direction, after),
+        projection or {"_id": 0}
+    ).sort(keyset_sort(sort_field, direction))
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+async def fetch_page(collection, query: dict, sort_field: str, direction: int,
+                     after: str = None, limit: int = DEFAULT_PAGE_SIZE, projection: dict = None):
+    """Returns (docs, next_cursor); next_cursor is None on the last page."""
+    docs = await find_page(collection, query, sort_field, direction, after, limit + 1, projection).to_list(limit + 1)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], sort_field)
+
+
+async def ndjson_lines(cursor, model):
+    """Serializes documents from a Motor cursor one line at a time."""
+    async for doc in cursor:
+        yield model.model_validate(doc).model_dump_json() + "\n"
+
+
+def wants_ndjson(accept: str = None, format: str = None) -> bool:
+    return format == "ndjson" or NDJSON_MEDIA_TYPE in (accept or "")
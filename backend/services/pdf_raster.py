@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import base64
+import shutil
+import asyncio
+import logging
+import tempfile
+import threading
+import contextlib
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # optional, PDFs are sent to analysis as-is without it
+    pdfium = None
+
+from services.process_pool import run_in_process
+from services.upload_spool import spool_download
+
+logger = logging.getLogger(__name__)
+
+PDF_RASTER_DPI = int(os.environ.get('PDF_RASTER_DPI', 150))
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 20))
+# Longest edge of a page raster; large-format sheets are scaled below the target DPI
+PDF_MAX_EDGE = int(os.environ.get('PDF_MAX_EDGE', 3072))
+PDF_RASTER_CACHE_BYTES = int(os.environ.get('PDF_RASTER_CACHE_BYTES', 1024 * 1024 * 1024))
+# Entries used this recently are never evicted: another API process may still be reading them
+PDF_RASTER_LEASE_SECONDS = int(os.environ.get('PDF_RASTER_LEASE_SECONDS', 600))
+
+
+def raster_cache_dir() -> str:
+    path = os.environ.get('PDF_RASTER_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pdf_rasters')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def rasterize_pdf(pdf_path: str, out_dir: str, dpi: int = PDF_RASTER_DPI,
+                  max_pages: int = PDF_MAX_PAGES, max_edge: int = PDF_MAX_EDGE) -> list:
+    """Renders each page to a grayscale PNG; returns [{"page", "path", "width", "height"}].
+
+    Runs in a worker process. Pages are rendered one at a time, so memory
+    stays bounded by a single page.
+    """
+    pdf = pdfium.PdfDocument(pdf_path)
+    pages = []
+    try:
+        for index in range(min(len(pdf), max_pages)):
+            page = pdf[index]
+            try:
+                width, height = page.get_size()  # points, 1/72 inch
+                scale = min(dpi / 72.0, max_edge / max(width, height))
+                image = page.render(scale=scale).to_pil().convert('L')
+            finally:
+                page.close()
+            path = os.path.join(out_dir, f"page-{index + 1:04d}.png")
+            image.save(path, format='PNG', compress_level=6)
+            pages.append({"page": index + 1, "path": path, "width": image.width, "height": image.height})
+    finally:
+        pdf.close()
+    return pages
+
+
+def page_data_url(path: str) -> str:
+    with open(path, 'rb') as handle:
+        return "data:image/png;base64," + base64.b64encode(handle.read()).decode('ascii')
+
+
+def merge_page_results(results: list, gap: float = 1.0) -> dict:
+    """Merges per-page analyses [(page, result)] into one scene.
+
+    Pages are laid out left to right with `gap` meters between them, and
+    room ids are prefixed with the page so they stay unique.
+    """
+    merged = {"rooms": [], "walls": [], "doors": [], "windows": [], "pages": len(results)}
+    offset = 0.0
+    for page, result in results:
+        xs = [offset]
+
+        def shift(point):
+            if isinstance(point, (list, tuple)) and len(point) >= 2 and all(isinstance(v, (int, float)) for v in point[:2]):
+                xs.append(point[0] + offset)
+                return [point[0] + offset, *point[1:]]
+            return point
+
+        for room in result.get("rooms") or []:
+            room = dict(room, page=page)
+            if room.get("id") is not None:
+                room["id"] = f"p{page}_{room['id']}"
+            xs.append(offset + float(room.get("width") or 0))
+            merged["rooms"].append(room)
+        for wall in result.get("walls") or []:
+            merged["walls"].append(dict(wall, start=shift(wall.get("start")), end=shift(wall.get("end")), page=page))
+        for key in ("doors", "windows"):
+            for item in result.get(key) or []:
+                merged[key].append(dict(item, position=shift(item.get("position")), page=page))
+        offset = max(xs) + gap
+    return merged
+
+
+class PdfRasterizer:
+    """Page rasters for PDF floor plans, cached on disk by content hash.
+
+    Rasterizing happens in the shared process pool; concurrent requests for
+    the same PDF share one run. The cache directory is kept under
+    `cache_bytes`, evicting the least recently used PDFs; entries pinned
+    through open_pages() or touched within the lease window are kept.
+    """
+
+    def __init__(self, dpi: int = PDF_RASTER_DPI, cache_bytes: int = PDF_RASTER_CACHE_BYTES,
+                 lease_seconds: float = PDF_RASTER_LEASE_SECONDS):
+        self.dpi = dpi
+        self.cache_bytes = cache_bytes
+        self.lease_seconds = lease_seconds
+        self._inflight = {}
+        # Entry dir -> number of open_pages() blocks reading it; evict() runs in a thread
+        self._pins = {}
+        self._pins_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return pdfium is not None
+
+    def _entry_dir(self, content_hash: str) -> str:
+        return os.path.join(raster_cache_dir(), f"{content_hash}_{self.dpi}")
+
+    @contextlib.asynccontextmanager
+    async def open_pages(self, file_url: str, content_hash: str):
+        """pages(), with the page files kept from eviction until the block exits."""
+        entry_dir = self._entry_dir(content_hash)
+        self._pin(entry_dir, 1)
+        try:
+            yield await self.pages(file_url, content_hash)
+        finally:
+            self._pin(entry_dir, -1)
+
+    def _pin(self, entry_dir: str, delta: int):
+        with self._pins_lock:
+            count = self._pins.get(entry_dir, 0) + delta
+            if count:
+                self._pins[entry_dir] = count
+            else:
+                self._pins.pop(entry_dir, None)
+
+    async def pages(self, file_url: str, content_hash: str) -> list:
+        """Rasterized pages of the PDF at `file_url`, from cache when possible."""
+        if pdfium is None:
+            raise RuntimeError("pypdfium2 is not installed")
+        entry_dir = self._entry_dir(content_hash)
+        manifest = os.path.join(entry_dir, "pages.json")
+        if os.path.exists(manifest):
+            os.utime(entry_dir)
+            with open(manifest) as handle:
+                return json.load(handle)
+
+        task = self._inflight.get(entry_dir)
+        if task is None:
+            task = asyncio.create_task(self._rasterize(file_url, entry_dir))
+            self._inflight[entry_dir] = task
+            task.add_done_callback(lambda _: self._inflight.pop(entry_dir, None))
+        return await asyncio.shield(task)
+
+    async def _rasterize(self, file_url: str, entry_dir: str) -> list:
+        pdf_path = await spool_download(file_url)
+        work_dir = tempfile.mkdtemp(prefix="raster_", dir=raster_cache_dir())
+        try:
+            pages = await run_in_process(rasterize_pdf, pdf_path, work_dir, self.dpi)
+            for page in pages:
+                page["path"] = os.path.join(entry_dir, os.path.basename(page["path"]))
+            with open(os.path.join(work_dir, "pages.json"), 'w') as handle:
+                json.dump(pages, handle)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(work_dir, entry_dir)
+            logger.info(f"Rasterized {len(pages)} PDF pages into {entry_dir}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.remove(pdf_path)
+        await asyncio.to_thread(self.evict)
+        return pages
+
+    def evict(self):
+        root = raster_cache_dir()
+        entries = []
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name.startswith("raster_") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        total = sum(size for _, size, _ in entries)
+        leased_after = time.time() - self.lease_seconds
+        for mtime, size, path in sorted(entries):
+            if total <= self.cache_bytes or mtime > leased_after:
+                break
+            with self._pins_lock:
+                if path in self._pins:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,48 @@
+import os
+import asyncio
+import logging
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+PROCESS_POOL_WORKERS = int(os.environ.get('PROCESS_POOL_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+
+_pool = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Shared pool for CPU-bound work (image processing, rasterizing, rendering).
+
+    Workers are spawned rather than forked: the parent runs an event loop and
+    driver threads that must not be copied into children.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_WORKERS, mp_context=multiprocessing.get_context('spawn')
+        )
+        logger.info(f"Started process pool with {PROCESS_POOL_WORKERS} workers")
+    return _pool
+
+
+async def run_in_process(fn, *args, **kwargs):
+    """Runs a picklable, module-level function in the pool without blocking the loop."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_pool(), functools.partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge image); start a fresh pool for later calls
+        logger.error("Process pool broke, restarting it")
+        _pool = None
+        raise
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
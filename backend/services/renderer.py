@@ -0,0 +1,304 @@
+import os
+import json
+import math
+import time
+import asyncio
+import shutil
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from services.mesh_baker import scene_meshes, mesh_hash
+from services.process_pool import run_in_process
+
+logger = logging.getLogger(__name__)
+
+# Bump when renders change, so cached images are redrawn
+RENDER_VERSION = 1
+RENDER_CACHE_BYTES = int(os.environ.get('RENDER_CACHE_BYTES', 1024 * 1024 * 1024))
+
+# Quality -> (longest image edge in pixels, supersampling factor per axis)
+RENDER_TIERS = {
+    "low": (640, 1),
+    "medium": (1024, 2),
+    "high": (1920, 2),
+}
+RENDER_STYLES = ("realistic", "wireframe", "stylized")
+RENDER_VIEWS = ("top", "isometric")
+MARGIN = 0.05
+LIGHT = np.array([0.4, 1.0, 0.6]) / np.linalg.norm([0.4, 1.0, 0.6])
+GLASS_ALPHA = 0.35
+# The top view is a plan: walls are cut at this height so door gaps and windows show
+PLAN_CUT_HEIGHT = 1.2
+
+
+def render_cache_dir() -> str:
+    path = os.environ.get('RENDER_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'renders')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def render_key(three_d_data: dict, style: str, quality: str) -> str:
+    """Cache key: the mesh hash (geometry plus colors), style and quality."""
+    raw = f"{RENDER_VERSION}:{mesh_hash(three_d_data)}:{style}:{quality}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:40]
+
+
+def view_rotation(view: str) -> np.ndarray:
+    """World-to-camera rotation; camera x right, y up, z towards the viewer."""
+    if view == "top":
+        # Looking straight down, plan y (world z) running down the image as in the editor
+        return np.array([[1.0, 0.0, 0.0], [0.0, 0.0, -1.0], [0.0, 1.0, 0.0]])
+    azimuth, elevation = math.radians(45), math.atan(1 / math.sqrt(2))
+    z = np.array([math.cos(elevation) * math.sin(azimuth), math.sin(elevation), math.cos(elevation) * math.cos(azimuth)])
+    x = np.cross([0.0, 1.0, 0.0], z)
+    x /= np.linalg.norm(x)
+    return np.array([x, np.cross(z, x), z])
+
+
+def _hex_rgb(color: str) -> tuple:
+    color = (color or "").lstrip('#')
+    if len(color) == 3:
+        color = "".join(c * 2 for c in color)
+    try:
+        return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return (204, 204, 204)
+
+
+def rasterize(triangles: np.ndarray, depth: np.ndarray, ids: np.ndarray, id_offset: int = 0,
+              write: bool = True) -> np.ndarray:
+    """Z-buffered scan conversion of screen-space triangles (n, 3, 3: x, y, depth; larger depth is closer).
+
+    Each triangle is filled over its bounding box with barycentric edge
+    functions. With write=False the buffers are left alone and a per-pixel
+    index of the closest passing triangle is returned instead (for blending).
+    """
+    height, width = depth.shape
+    hits = np.full(depth.shape, -1, dtype=np.int32) if not write else None
+    local_depth = depth if write else np.full(depth.shape, -np.inf, dtype=depth.dtype)
+    for index, ((x0, y0, z0), (x1, y1, z1), (x2, y2, z2)) in enumerate(triangles.tolist()):
+        area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+        if abs(area) < 1e-12:
+            continue
+        left, right = max(int(min(x0, x1, x2)), 0), min(int(math.ceil(max(x0, x1, x2))), width - 1)
+        top, bottom = max(int(min(y0, y1, y2)), 0), min(int(math.ceil(max(y0, y1, y2))), height - 1)
+        if left > right or top > bottom:
+            continue
+        px = np.arange(left, right + 1, dtype=np.float32)[None, :] + 0.5
+        py = np.arange(top, bottom + 1, dtype=np.float32)[:, None] + 0.5
+        w0 = ((x1 - px) * (y2 - py) - (x2 - px) * (y1 - py)) / area
+        w1 = ((x2 - px) * (y0 - py) - (x0 - px) * (y2 - py)) / area
+        w2 = 1.0 - w0 - w1
+        z = w0 * z0 + w1 * z1 + w2 * z2
+        region = local_depth[top:bottom + 1, left:right + 1]
+        visible = (w0 >= 0) & (w1 >= 0) & (w2 >= 0) & (z > region)
+        if not write:
+            visible &= z > depth[top:bottom + 1, left:right + 1]
+            hits[top:bottom + 1, left:right + 1][visible] = id_offset + index
+        else:
+            ids[top:bottom + 1, left:right + 1][visible] = id_offset + index
+        region[visible] = z[visible]
+    return hits
+
+
+def _outline(surface: np.ndarray, thickness: int) -> np.ndarray:
+    """Pixels where the visible surface changes, grown to `thickness` pixels."""
+    edges = np.zeros(surface.shape, dtype=bool)
+    edges[1:, :] |= surface[1:, :] != surface[:-1, :]
+    edges[:, 1:] |= surface[:, 1:] != surface[:, :-1]
+    grown = edges.copy()
+    for shift in range(1, thickness):
+        grown[shift:, :] |= edges[:-shift, :]
+        grown[:, shift:] |= edges[:, :-shift]
+    return grown
+
+
+def render_view(three_d_data: dict, view: str, quality: str, style: str, path: str) -> dict:
+    """Renders one view of the scene to a PNG at `path`; runs in a worker process.
+
+    A NumPy software rasterizer: orthographic projection, back-face culling,
+    a z-buffer holding triangle ids, flat Lambert shading resolved per id,
+    surface outlines, glass blended over the result, and supersampling
+    averaged down to the output size.
+    """
+    started = time.perf_counter()
+    edge, samples = RENDER_TIERS[quality]
+    rotation = view_rotation(view)
+    if view == "top":
+        three_d_data = dict(three_d_data, walls=[
+            dict(wall, height=min(float(wall.get("height") or 2.8), PLAN_CUT_HEIGHT)) if isinstance(wall, dict) else wall
+            for wall in three_d_data.get("walls") or []
+        ])
+
+    opaque, glass = [], []
+    for (kind, color), (positions, normals, indices) in scene_meshes(three_d_data).items():
+        corners = positions[indices.reshape(-1, 3)]
+        face_normals = normals[indices.reshape(-1, 3)[:, 0]]
+        (glass if kind == "glass" else opaque).append((corners, face_normals, _hex_rgb(color)))
+
+    background = (255, 255, 255) if style != "realistic" else (248, 250, 252)
+    all_corners = [corners for corners, _, _ in opaque + glass]
+    if not all_corners:
+        Image.new('RGB', (edge, edge), background).save(path, format='PNG')
+        return {"view": view, "width": edge, "height": edge, "triangles": 0,
+                "render_ms": round((time.perf_counter() - started) * 1000)}
+
+    camera = np.vstack([c.reshape(-1, 3) for c in all_corners]) @ rotation.T
+    low, high = camera.min(axis=0), camera.max(axis=0)
+    extent = np.maximum(high - low, 1e-6)
+    scale = edge * (1 - 2 * MARGIN) / max(extent[0], extent[1])
+    pad = round(edge * MARGIN)
+    width = int(round(extent[0] * scale)) + 2 * pad
+    height = int(round(extent[1] * scale)) + 2 * pad
+    big_w, big_h = width * samples, height * samples
+
+    def to_screen(corners):
+        cam = corners @ rotation.T
+        screen = np.empty_like(cam)
+        screen[..., 0] = ((cam[..., 0] - low[0]) * scale + pad) * samples
+        screen[..., 1] = ((high[1] - cam[..., 1]) * scale + pad) * samples
+        screen[..., 2] = cam[..., 2]
+        return screen
+
+    def prepare(groups):
+        """Front-facing triangles in screen space, with per-triangle color and surface key."""
+        screens, colors, shades, keys = [], [], [], []
+        for group, (corners, face_normals, color) in enumerate(groups):
+            front = (face_normals @ rotation.T)[:, 2] > 1e-6
+            if not front.any():
+                continue
+            corners, face_normals = corners[front], face_normals[front]
+            screens.append(to_screen(corners))
+            colors.append(np.tile(color, (len(corners), 1)))
+            shades.append(0.45 + 0.55 * np.clip(face_normals @ LIGHT, 0.0, 1.0))
+            plane = np.einsum('ij,ij->i', face_normals, corners[:, 0])
+            keys.append(np.column_stack([np.full(len(corners), group), np.round(face_normals, 3), np.round(plane, 3)]))
+        if not screens:
+            return np.empty((0, 3, 3)), np.empty((0, 3)), np.empty(0), np.empty((0, 5))
+        return np.vstack(screens), np.vstack(colors), np.concatenate(shades), np.vstack(keys)
+
+    screens, colors, shades, keys = prepare(opaque)
+    depth = np.full((big_h, big_w), -np.inf, dtype=np.float32)
+    ids = np.full((big_h, big_w), -1, dtype=np.int32)
+    rasterize(screens, depth, ids)
+
+    covered = ids >= 0
+    image = np.empty((big_h, big_w, 3), dtype=np.float32)
+    image[:] = background
+    if style == "realistic":
+        shaded = colors * shades[:, None]
+    elif style == "stylized":
+        shaded = colors.astype(np.float32)
+    else:
+        shaded = np.full(colors.shape, 250.0)
+    image[covered] = shaded[ids[covered]]
+
+    if len(keys):
+        _, surface_of = np.unique(keys, axis=0, return_inverse=True)
+        surface = np.where(covered, surface_of.ravel()[np.maximum(ids, 0)], -1)
+        thickness = {"realistic": 1, "stylized": 2, "wireframe": 1}[style] * samples
+        edges = _outline(surface, thickness)
+        ink = 0.55 if style == "realistic" else 0.1
+        image[edges] *= ink
+
+    glass_screens, glass_colors, _, _ = prepare(glass)
+    if len(glass_screens) and style != "wireframe":
+        hits = rasterize(glass_screens, depth, ids, write=False)
+        seen = hits >= 0
+        image[seen] = image[seen] * (1 - GLASS_ALPHA) + glass_colors[hits[seen]] * GLASS_ALPHA
+
+    if samples > 1:
+        image = image.reshape(height, samples, width, samples, 3).mean(axis=(1, 3))
+    Image.fromarray(np.clip(image + 0.5, 0, 255).astype(np.uint8)).save(path, format='PNG', compress_level=6)
+    return {
+        "view": view,
+        "width": width,
+        "height": height,
+        "triangles": int(len(screens) + len(glass_screens)),
+        "render_ms": round((time.perf_counter() - started) * 1000),
+    }
+
+
+class RenderCache:
+    """PNG renders of three_d_data on disk, keyed by render_key.
+
+    Each entry is a directory with one PNG per view and a render.json
+    describing it. Views are rendered in parallel in the shared process
+    pool; concurrent requests for the same key share one run. The cache is
+    kept under `cache_bytes`, evicting the least recently used renders.
+    """
+
+    def __init__(self, cache_bytes: int = RENDER_CACHE_BYTES):
+        self.cache_bytes = cache_bytes
+        self._inflight = {}
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(render_cache_dir(), key)
+
+    def view_path(self, key: str, view: str) -> str:
+        return os.path.join(self.entry_dir(key), f"{view}.png")
+
+    async def render(self, three_d_data: dict, style: str, quality: str) -> tuple:
+        """(key, manifest, cached) for the scene; the manifest lists each view's size and render time."""
+        if quality not in RENDER_TIERS:
+            raise ValueError(f"Unknown quality '{quality}', expected one of {', '.join(RENDER_TIERS)}")
+        if style not in RENDER_STYLES:
+            raise ValueError(f"Unknown style '{style}', expected one of {', '.join(RENDER_STYLES)}")
+        key = render_key(three_d_data, style, quality)
+        manifest = os.path.join(self.entry_dir(key), "render.json")
+        if os.path.exists(manifest):
+            os.utime(self.entry_dir(key))
+            with open(manifest) as handle:
+                return key, json.load(handle), True
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._render(key, three_d_data, style, quality))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return key, await asyncio.shield(task), False
+
+    async def _render(self, key: str, three_d_data: dict, style: str, quality: str) -> dict:
+        entry_dir = self.entry_dir(key)
+        work_dir = tempfile.mkdtemp(prefix="render_", dir=render_cache_dir())
+        try:
+            started = time.perf_counter()
+            views = await asyncio.gather(*[
+                run_in_process(render_view, three_d_data, view, quality, style, os.path.join(work_dir, f"{view}.png"))
+                for view in RENDER_VIEWS
+            ])
+            manifest = {
+                "style": style,
+                "quality": quality,
+                "views": {view["view"]: view for view in views},
+                "render_ms": round((time.perf_counter() - started) * 1000),
+            }
+            with open(os.path.join(work_dir, "render.json"), 'w') as handle:
+                json.dump(manifest, handle)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(work_dir, entry_dir)
+            logger.info(f"Rendered {key} ({quality}, {style}) in {manifest['render_ms']} ms")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        await asyncio.to_thread(self.evict)
+        return manifest
+
+    def evict(self):
+        root = render_cache_dir()
+        entries = []
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name.startswith("render_") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
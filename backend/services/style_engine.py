@@ -0,0 +1,170 @@
+import os
+import re
+import copy
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from cachetools import LRUCache, TTLCache
+
+logger = logging.getLogger(__name__)
+
+STYLE_PALETTE_CACHE_TTL = int(os.environ.get('STYLE_PALETTE_CACHE_TTL', 3600))
+STYLE_PALETTE_CACHE_SIZE = int(os.environ.get('STYLE_PALETTE_CACHE_SIZE', 1024))
+
+HEX_COLOR = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+# Palettes are applied locally: walls get "walls", rooms get rooms[type] or "floor".
+STYLE_PALETTES = {
+    "industrial": {"walls": "#7d7d7d", "floor": "#4a4a4a", "rooms": {"kitchen": "#5a5a5a", "bathroom": "#6b6b6b"}},
+    "scandinavian": {"walls": "#f0f0f0", "floor": "#d2b48c", "rooms": {"bathroom": "#e8e8e8"}},
+    "modern": {"walls": "#fafafa", "floor": "#9e9e9e", "rooms": {"kitchen": "#bdbdbd", "bathroom": "#cfd8dc"}},
+    "minimal": {"walls": "#ffffff", "floor": "#e0e0e0", "rooms": {}},
+    "classic": {"walls": "#f5f0e1", "floor": "#8b5a2b", "rooms": {"bathroom": "#e6dccb", "kitchen": "#c8b99b"}},
+    "rustic": {"walls": "#e8dcc8", "floor": "#7b4a2a", "rooms": {"kitchen": "#a0522d"}},
+    "mediterranean": {"walls": "#fdf6e3", "floor": "#c4623a", "rooms": {"bathroom": "#2e86ab", "kitchen": "#e9c46a"}},
+    "japandi": {"walls": "#ede6db", "floor": "#b89b72", "rooms": {"bathroom": "#d6cfc4"}},
+    "loft": {"walls": "#a0522d", "floor": "#3e3e3e", "rooms": {"kitchen": "#555555"}},
+}
+
+STYLE_ALIASES = {
+    "industriale": "industrial",
+    "scandinavo": "scandinavian",
+    "nordico": "scandinavian",
+    "nordic": "scandinavian",
+    "moderno": "modern",
+    "contemporaneo": "modern",
+    "contemporary": "modern",
+    "minimalista": "minimal",
+    "minimalist": "minimal",
+    "classico": "classic",
+    "rustico": "rustic",
+    "mediterraneo": "mediterranean",
+}
+
+
+def normalize_style(style: str) -> str:
+    """Lower-cased, whitespace-collapsed style name with aliases resolved."""
+    name = " ".join(style.strip().lower().split())
+    return STYLE_ALIASES.get(name, name)
+
+
+def geometry_hash(three_d_data: dict) -> str:
+    """Hash of the scene ignoring the colors apply_palette sets, so restyled copies share a hash.
+
+    Only walls[*].color and rooms[*].color are dropped; any other color (on
+    furniture, say) is part of the scene a palette leaves alone.
+    """
+    canonical_data = dict(three_d_data)
+    for key in ("walls", "rooms"):
+        items = three_d_data.get(key)
+        if isinstance(items, list):
+            canonical_data[key] = [
+                {k: v for k, v in item.items() if k != "color"} if isinstance(item, dict) else item
+                for item in items
+            ]
+    canonical = json.dumps(canonical_data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def validate_palette(palette) -> dict:
+    """Returns a clean palette or raises ValueError."""
+    if not isinstance(palette, dict):
+        raise ValueError("Palette must be an object")
+    walls, floor = palette.get("walls"), palette.get("floor")
+    if not (isinstance(walls, str) and HEX_COLOR.match(walls) and isinstance(floor, str) and HEX_COLOR.match(floor)):
+        raise ValueError("Palette needs hex 'walls' and 'floor' colors")
+    rooms = palette.get("rooms") or {}
+    return {
+        "walls": walls,
+        "floor": floor,
+        "rooms": {str(k): v for k, v in rooms.items() if isinstance(v, str) and HEX_COLOR.match(v)},
+    }
+
+
+def apply_palette(three_d_data: dict, palette: dict) -> dict:
+    """Returns a copy of the scene with wall and room colors set from the palette."""
+    styled = copy.deepcopy(three_d_data)
+    for wall in styled.get("walls") or []:
+        if isinstance(wall, dict):
+            wall["color"] = palette["walls"]
+    room_colors = palette.get("rooms") or {}
+    for room in styled.get("rooms") or []:
+        if isinstance(room, dict):
+            room["color"] = room_colors.get(room.get("type"), palette["floor"])
+    return styled
+
+
+class StyleEngine:
+    """Applies named palettes locally and memoizes restyled scenes.
+
+    Unknown style names are resolved once through `generate_palette` (an LLM
+    call); the resulting palette is stored in Mongo so it is never requested
+    again, even across restarts. Stored palettes are cached in memory (LRU
+    with a TTL), and concurrent requests for the same new style share one
+    lookup, so a burst of them makes a single LLM call.
+    """
+
+    def __init__(self, collection, max_results: int = 512,
+                 palette_cache_size: int = STYLE_PALETTE_CACHE_SIZE,
+                 palette_cache_ttl: int = STYLE_PALETTE_CACHE_TTL):
+        self.collection = collection
+        self._results = LRUCache(maxsize=max_results)
+        # Normalized style name -> palette, for styles not in STYLE_PALETTES
+        self._palettes = TTLCache(maxsize=palette_cache_size, ttl=palette_cache_ttl)
+        self._palette_inflight = {}
+
+    async def resolve_palette(self, style: str, generate_palette=None) -> dict:
+        key = normalize_style(style)
+        palette = STYLE_PALETTES.get(key) or self._palettes.get(key)
+        if palette:
+            return palette
+
+        pending = self._palette_inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = self._palette_inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            palette = await self._load_palette(key, style, generate_palette)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Marks the exception retrieved when no other request was waiting
+            pending.exception()
+            raise
+        else:
+            self._palettes[key] = palette
+            pending.set_result(palette)
+            return palette
+        finally:
+            self._palette_inflight.pop(key, None)
+
+    async def _load_palette(self, key: str, style: str, generate_palette) -> dict:
+        stored = await self.collection.find_one({"style": key}, {"_id": 0, "palette": 1})
+        if stored:
+            palette = stored["palette"]
+        elif generate_palette:
+            palette = validate_palette(await generate_palette(style))
+            await self.collection.update_one(
+                {"style": key},
+                {"$set": {"palette": palette, "created_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+            logger.info(f"Stored generated palette for style '{key}'")
+        else:
+            raise KeyError(f"Unknown style '{style}'")
+        return palette
+
+    async def restyle(self, three_d_data: dict, style: str, generate_palette=None) -> dict:
+        """Returns the scene styled with `style`, reusing earlier results for the same geometry."""
+        memo_key = (geometry_hash(three_d_data), normalize_style(style))
+        styled = self._results.get(memo_key)
+        if styled is None:
+            palette = await self.resolve_palette(style, generate_palette)
+            styled = apply_palette(three_d_data, palette)
+            self._results[memo_key] = styled
+        return copy.deepcopy(styled)
@@ -0,0 +1,261 @@
+import os
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+import zipfile
+import tempfile
+from dataclasses import dataclass
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 150 * 1024 * 1024))
+MAX_ARCHIVE_BYTES = int(os.environ.get('MAX_ARCHIVE_BYTES', 1024 * 1024 * 1024))
+DOWNLOAD_CONNECTIONS = int(os.environ.get('DOWNLOAD_CONNECTIONS', 20))
+
+# Leading bytes -> (file_type, content_type)
+_SIGNATURES = [
+    (b'%PDF', 'pdf', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image', 'image/png'),
+    (b'\xff\xd8\xff', 'image', 'image/jpeg'),
+    (b'GIF87a', 'image', 'image/gif'),
+    (b'GIF89a', 'image', 'image/gif'),
+    (b'II*\x00', 'image', 'image/tiff'),
+    (b'MM\x00*', 'image', 'image/tiff'),
+    (b'PK\x03\x04', 'zip', 'application/zip'),
+]
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+class ArchiveError(Exception):
+    """Raised for a ZIP that cannot be read or holds too many files."""
+
+
+@dataclass
+class SpooledUpload:
+    """An upload body written once to disk, with its size and content hash."""
+    path: str
+    filename: str
+    size: int
+    sha256: str
+    file_type: str
+    content_type: str
+
+    def link_copy(self) -> str:
+        """A second name for the spool file (a hardlink, or a copy where links are unsupported).
+
+        Lets another consumer own its copy and delete it independently.
+        """
+        path = os.path.join(spool_dir(), f"upload_{uuid.uuid4().hex}{os.path.splitext(self.path)[1]}")
+        try:
+            os.link(self.path, path)
+        except OSError:
+            shutil.copyfile(self.path, path)
+        return path
+
+    def discard(self):
+        """Removes the spool file if it still exists."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove spool file {self.path}: {e}")
+
+
+def sniff_type(head: bytes, fallback: str = None):
+    """Detects (file_type, content_type) from the first bytes of a file."""
+    for magic, file_type, content_type in _SIGNATURES:
+        if head.startswith(magic):
+            return file_type, content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image', 'image/webp'
+    if fallback and fallback.startswith('image/'):
+        return 'image', fallback
+    return 'unknown', fallback or 'application/octet-stream'
+
+
+def spool_dir() -> str:
+    """Directory where uploads are staged; created on first use."""
+    path = os.environ.get('UPLOAD_SPOOL_DIR') or tempfile.gettempdir()
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+_http = None
+
+
+def get_http() -> httpx.AsyncClient:
+    """Shared client for spool downloads, so repeated fetches reuse pooled connections."""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=DOWNLOAD_CONNECTIONS, max_keepalive_connections=DOWNLOAD_CONNECTIONS),
+        )
+    return _http
+
+
+async def close_http():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+def _write_chunk(handle, digest, chunk: bytes):
+    handle.write(chunk)
+    digest.update(chunk)
+
+
+async def spool_upload(file, chunk_size: int = CHUNK_SIZE, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """Streams an UploadFile to a single spool file in fixed-size chunks.
+
+    Only one chunk is held in memory at a time; the SHA-256 and size are
+    computed along the way and the type is sniffed from the first chunk.
+    """
+    suffix = os.path.splitext(file.filename or '')[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='upload_', dir=spool_dir())
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if not head:
+                    head = chunk[:16]
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the {max_bytes} byte upload limit")
+                await asyncio.to_thread(_write_chunk, handle, digest, chunk)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+    file_type, content_type = sniff_type(head, fallback=file.content_type)
+    return SpooledUpload(
+        path=path,
+        filename=file.filename or os.path.basename(path),
+        size=size,
+        sha256=digest.hexdigest(),
+        file_type=file_type,
+        content_type=content_type,
+    )
+
+
+async def spool_download(url: str, chunk_size: int = CHUNK_SIZE, max_bytes: int = MAX_UPLOAD_BYTES,
+                         client: httpx.AsyncClient = None) -> str:
+    """Downloads `url` into a spool file and returns its path, with `client` or the shared one."""
+    client = client or get_http()
+    suffix = os.path.splitext(url.split('?')[0])[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='download_', dir=spool_dir())
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            async with client.stream('GET', url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLarge(f"Download exceeds the {max_bytes} byte limit")
+                    await asyncio.to_thread(handle.write, chunk)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def _spool_member(archive, info, max_bytes: int, chunk_size: int) -> SpooledUpload:
+    """Extracts one archive member to a spool file, counting the bytes actually inflated."""
+    filename = os.path.basename(info.filename)
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1], prefix='upload_', dir=spool_dir())
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    try:
+        with os.fdopen(fd, 'wb') as handle, archive.open(info) as member:
+            while True:
+                chunk = member.read(chunk_size)
+                if not chunk:
+                    break
+                if not head:
+                    head = chunk[:16]
+                size += len(chunk)
+                # The declared size in the archive is not trusted
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{filename} exceeds the {max_bytes} byte upload limit")
+                _write_chunk(handle, digest, chunk)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+    file_type, content_type = sniff_type(head)
+    return SpooledUpload(
+        path=path, filename=filename, size=size, sha256=digest.hexdigest(),
+        file_type=file_type, content_type=content_type,
+    )
+
+
+def expand_zip(path: str, max_files: int, max_bytes: int = MAX_UPLOAD_BYTES,
+               max_total_bytes: int = MAX_ARCHIVE_BYTES, chunk_size: int = CHUNK_SIZE) -> tuple:
+    """Extracts the files of a ZIP into spool files; blocking, run it in a thread.
+
+    Returns (uploads, rejected), rejected being (filename, reason) pairs for
+    members over `max_bytes`, so one oversized plan does not reject the rest
+    of the archive. Folders, macOS resource forks and hidden files are skipped.
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ArchiveError(f"Invalid ZIP archive: {e}")
+    uploads = []
+    rejected = []
+    total = 0
+    try:
+        with archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir()
+                and not info.filename.startswith('__MACOSX/')
+                and not os.path.basename(info.filename).startswith('.')
+            ]
+            if len(members) > max_files:
+                raise ArchiveError(f"Archive holds {len(members)} files, the limit is {max_files}")
+            for info in members:
+                try:
+                    spooled = _spool_member(archive, info, max_bytes, chunk_size)
+                except UploadTooLarge as e:
+                    rejected.append((os.path.basename(info.filename), str(e)))
+                    continue
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                    # Corrupt, encrypted or unsupported compression
+                    raise ArchiveError(f"Cannot extract {info.filename}: {e}")
+                uploads.append(spooled)
+                total += spooled.size
+                if total > max_total_bytes:
+                    raise ArchiveError(f"Archive exceeds the {max_total_bytes} byte limit")
+    except BaseException:
+        for spooled in uploads:
+            spooled.discard()
+        raise
+    return uploads, rejected
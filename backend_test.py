@@ -160,7 +160,20 @@ class Vision3DAPITester:
             self.log_test("Convert to 3D", False, "No floor plan ID available")
             return False
         
-        return self.run_test("Convert to 3D", "POST", f"floorplans/{self.floor_plan_id}/convert-3d", 200)
+        success, response = self.run_test("Convert to 3D", "POST", f"floorplans/{self.floor_plan_id}/convert-3d", 202)
+        if not success:
+            return False
+        
+        # Conversion runs as a job; poll until it finishes
+        for _ in range(60):
+            job = requests.get(f"{self.api_url}/jobs/{response['job_id']}").json()
+            if job.get('status') in ('completed', 'failed'):
+                break
+            time.sleep(1)
+        
+        completed = job.get('status') == 'completed'
+        self.log_test("Convert to 3D Job", completed, f"Job status: {job.get('status')}", job)
+        return completed
 
     def test_create_conversation(self):
         """Test creating conversation"""
@@ -578,7 +578,7 @@ const FloorPlanEditorKonva = ({ floorPlanImage, threeDData, onSave }) => {
               </Button>
               <Button
                 onClick={() => {
-                  const data = { walls, rooms, floors, doors, windows, furniture };
+                  const data = { walls, rooms, floors, doors, windows, furniture, scale };
                   onSave(data);
                 }}
                 className="col-span-2 bg-gradient-to-r from-purple-600 to-pink-600 hover:from-purple-700 hover:to-pink-700 text-white shadow"
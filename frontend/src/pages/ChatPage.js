@@ -58,21 +58,27 @@ const ChatPage = () => {
     setInputMessage('');
     setLoading(true);
 
+    const payload = {
+      conversation_id: conversationId,
+      message: inputMessage,
+      model: selectedModel
+    };
+
     try {
-      const response = await axios.post(`${API}/chat`, {
-        conversation_id: conversationId,
-        message: inputMessage,
-        model: selectedModel
-      });
+      const streamed = await streamAssistantReply(payload);
+      if (!streamed) {
+        // Provider without a streaming client: fall back to the blocking endpoint
+        const response = await axios.post(`${API}/chat`, payload);
 
-      const assistantMessage = {
-        role: 'assistant',
-        content: response.data.message,
-        model: response.data.model,
-        timestamp: new Date().toISOString()
-      };
+        const assistantMessage = {
+          role: 'assistant',
+          content: response.data.message,
+          model: response.data.model,
+          timestamp: new Date().toISOString()
+        };
 
-      setMessages((prev) => [...prev, assistantMessage]);
+        setMessages((prev) => [...prev, assistantMessage]);
+      }
     } catch (error) {
       console.error('Error sending message:', error);
       toast.error('Errore nell\'invio del messaggio');
@@ -81,6 +87,55 @@ const ChatPage = () => {
     }
   };
 
+  // Reads the /chat/stream SSE response and grows the assistant message token by token.
+  // Returns false when streaming is not available for the selected model.
+  const streamAssistantReply = async (payload) => {
+    const response = await fetch(`${API}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+      body: JSON.stringify(payload)
+    });
+    if (response.status === 503) return false;
+    if (!response.ok || !response.body) throw new Error(`Server returned ${response.status}`);
+
+    let assistantIndex = null;
+    setMessages((prev) => {
+      assistantIndex = prev.length;
+      return [...prev, { role: 'assistant', content: '', timestamp: new Date().toISOString() }];
+    });
+    const updateAssistant = (update) => setMessages((prev) => prev.map((msg, idx) => (
+      idx === assistantIndex ? { ...msg, ...update(msg) } : msg
+    )));
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const eventName = (rawEvent.match(/^event: (.*)$/m) || [])[1];
+        const dataLine = (rawEvent.match(/^data: (.*)$/m) || [])[1];
+        if (!eventName || !dataLine) continue;
+        const data = JSON.parse(dataLine);
+
+        if (eventName === 'token') {
+          updateAssistant((msg) => ({ content: msg.content + data.delta }));
+        } else if (eventName === 'done') {
+          updateAssistant(() => ({ model: data.model }));
+        } else if (eventName === 'error') {
+          throw new Error(data.detail);
+        }
+      }
+    }
+    return true;
+  };
+
   const handleKeyPress = (e) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
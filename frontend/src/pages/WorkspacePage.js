@@ -9,6 +9,7 @@ import { Tabs, TabsContent, TabsList, TabsTrigger } from '../components/ui/tabs'
 import { Select, SelectContent, SelectItem, SelectTrigger } from '../components/ui/select';
 import { Boxes, Upload, Pencil, Home, Loader2, Eye, Plus, Save, Trash2, RotateCw } from 'lucide-react';
 import axios from 'axios';
+import { createPatch } from '../utils/jsonPatch';
 import { toast } from 'sonner';
 import { Canvas, useFrame, extend, useThree } from '@react-three/fiber';
 import { OrbitControls } from 'three/examples/jsm/controls/OrbitControls';
@@ -116,13 +117,24 @@ const WorkspacePage = () => {
 
   const loadFloorPlans = async () => {
     try {
-      const response = await axios.get(`${API}/floorplans?user_id=${userId}`);
+      const response = await axios.get(`${API}/floorplans?user_id=${userId}&view=summary`);
       setFloorPlans(response.data);
     } catch (error) {
       console.error('Error loading floor plans:', error);
     }
   };
 
+  // The list only carries summaries; fetch the full plan (canvas and 3D data) on open
+  const openPlan = async (planId) => {
+    try {
+      const response = await axios.get(`${API}/floorplans/${planId}`);
+      setSelectedPlan(response.data);
+    } catch (error) {
+      console.error('Error loading floor plan:', error);
+      toast.error('Errore caricamento progetto');
+    }
+  };
+
   const handleFileChange = (e) => {
     const file = e.target.files[0];
     if (file) {
@@ -190,13 +202,27 @@ const WorkspacePage = () => {
     if (!selectedPlan) return;
     setLoading(true);
     try {
-      await axios.patch(`${API}/floorplans/${selectedPlan.id}`, { three_d_data: JSON.stringify(updatedData) });
-      const planResponse = await axios.get(`${API}/floorplans/${selectedPlan.id}`);
-      setSelectedPlan(planResponse.data);
+      // Send only the changed parts; the server applies them if nobody saved in between
+      const current = selectedPlan.three_d_data ? JSON.parse(selectedPlan.three_d_data) : null;
+      const response = await axios.patch(`${API}/floorplans/${selectedPlan.id}/scene`, {
+        version: selectedPlan.version,
+        three_d_data: createPatch(current, updatedData)
+      });
+      setSelectedPlan({
+        ...selectedPlan,
+        three_d_data: JSON.stringify(updatedData),
+        version: response.data.version,
+        updated_at: response.data.updated_at
+      });
       toast.success('Modello 3D aggiornato!');
     } catch (error) {
       console.error('Update error:', error);
-      toast.error('Errore aggiornamento');
+      if (error.response?.status === 409) {
+        toast.error('Il progetto è stato modificato altrove, ricaricato');
+        openPlan(selectedPlan.id);
+      } else {
+        toast.error('Errore aggiornamento');
+      }
     } finally {
       setLoading(false);
     }
@@ -357,11 +383,11 @@ const WorkspacePage = () => {
                           </div>
                         </div>
                         <div className="flex gap-2 opacity-0 group-hover:opacity-100 transition-opacity">
-                          <Button size="icon" variant="secondary" onClick={() => setSelectedPlan(plan)}>
+                          <Button size="icon" variant="secondary" onClick={() => openPlan(plan.id)}>
                             <Pencil className="w-4 h-4" />
                           </Button>
-                          {plan.three_d_data && (
-                            <Button size="icon" variant="ghost" onClick={() => setSelectedPlan(plan)}>
+                          {plan.has_3d && (
+                            <Button size="icon" variant="ghost" onClick={() => openPlan(plan.id)}>
                               <Eye className="w-4 h-4" />
                             </Button>
                           )}
@@ -0,0 +1,56 @@
+/**
+ * JSON Patch (RFC 6902) generation
+ *
+ * Diffs two JSON values into the operations that turn the first into the
+ * second, so an edit can be sent to the server as a patch instead of the
+ * whole document.
+ */
+
+const escapeToken = (token) => String(token).replace(/~/g, '~0').replace(/\//g, '~1');
+
+const isObject = (value) => value !== null && typeof value === 'object' && !Array.isArray(value);
+
+/**
+ * Operations turning `before` into `after`
+ * @param {*} before - Current JSON value
+ * @param {*} after - Edited JSON value
+ * @param {String} path - JSON Pointer of both values (root by default)
+ * @returns {Array} RFC 6902 operations
+ */
+export const createPatch = (before, after, path = '') => {
+    if (before === after) return [];
+
+    if (Array.isArray(before) && Array.isArray(after)) {
+        const ops = [];
+        const shared = Math.min(before.length, after.length);
+        for (let i = 0; i < shared; i++) {
+            ops.push(...createPatch(before[i], after[i], `${path}/${i}`));
+        }
+        for (let i = shared; i < after.length; i++) {
+            ops.push({ op: 'add', path: `${path}/-`, value: after[i] });
+        }
+        // Remove from the end, so earlier indexes stay valid
+        for (let i = before.length - 1; i >= shared; i--) {
+            ops.push({ op: 'remove', path: `${path}/${i}` });
+        }
+        return ops;
+    }
+
+    if (isObject(before) && isObject(after)) {
+        const ops = [];
+        Object.keys(before).forEach((key) => {
+            if (!(key in after)) ops.push({ op: 'remove', path: `${path}/${escapeToken(key)}` });
+        });
+        Object.keys(after).forEach((key) => {
+            const childPath = `${path}/${escapeToken(key)}`;
+            if (key in before) {
+                ops.push(...createPatch(before[key], after[key], childPath));
+            } else {
+                ops.push({ op: 'add', path: childPath, value: after[key] });
+            }
+        });
+        return ops;
+    }
+
+    return [{ op: 'replace', path, value: after }];
+};
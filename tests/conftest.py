@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Backend modules are imported the way server.py imports them ("services.*")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+class ClaimableCollection:
+    """A mongomock-motor collection whose find_one_and_update honours `sort`.
+
+    mongomock returns the first document in sort order but updates the first
+    one in insertion order, which breaks the oldest-first claims of the job
+    queues. Everything else is passed through.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, return_document=False, **kwargs):
+        doc = await self._collection.find_one(filter, {"_id": 1}, sort=sort)
+        if doc is None:
+            return None
+        before = await self._collection.find_one({"_id": doc["_id"]}, projection)
+        await self._collection.update_one({"_id": doc["_id"]}, update)
+        return await self._collection.find_one({"_id": doc["_id"]}, projection) if return_document else before
+
+
+@pytest.fixture
+def mongo_collection():
+    """Factory for empty mongomock-motor collections that support queue claims."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    client = mongomock_motor.AsyncMongoMockClient()
+    return lambda name: ClaimableCollection(client["test"][name])
+
+
+@pytest.fixture(scope="module")
+def server():
+    """server.py imported against mongomock-motor, one fresh database per test module."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import motor.motor_asyncio
+
+    patch = pytest.MonkeyPatch()
+    for key, value in {"MONGO_URL": "mongodb://localhost", "DB_NAME": "test_server", "CLOUDINARY_CLOUD_NAME": "x",
+                       "CLOUDINARY_API_KEY": "x", "CLOUDINARY_API_SECRET": "x"}.items():
+        patch.setenv(key, value)
+    patch.setattr(motor.motor_asyncio, "AsyncIOMotorClient", lambda *a, **k: mongomock_motor.AsyncMongoMockClient())
+    sys.modules.pop("server", None)
+    import server
+    yield server
+    sys.modules.pop("server", None)
+    patch.undo()
@@ -0,0 +1,51 @@
+"""Analysis cache: keys, hits and misses, expiry and least-recently-used eviction."""
+import asyncio
+from datetime import timedelta
+
+from services.analysis_cache import AnalysisCache, _now, analysis_cache_key
+
+
+def test_cache_key_covers_image_model_and_prompt():
+    key = analysis_cache_key("abc", "gpt-4o", "Analyze this plan")
+    assert key == analysis_cache_key("abc", "gpt-4o", "Analyze this plan")
+    assert len({
+        key,
+        analysis_cache_key("abd", "gpt-4o", "Analyze this plan"),
+        analysis_cache_key("abc", "gpt-4o-mini", "Analyze this plan"),
+        analysis_cache_key("abc", "gpt-4o", "Analyze this plan."),
+    }) == 4
+
+
+def test_get_put_and_expiry(mongo_collection):
+    cache = AnalysisCache(mongo_collection("analysis_cache"))
+
+    async def run():
+        assert await cache.get("k1") is None
+        await cache.put("k1", {"rooms": 2}, "gpt-4o", "abc")
+        await cache.put("k1", {"rooms": 3}, "gpt-4o", "abc")
+        assert await cache.get("k1") == {"rooms": 3}
+        await cache.collection.update_one({"key": "k1"}, {"$set": {"expires_at": _now() - timedelta(seconds=1)}})
+        assert await cache.get("k1") is None
+        return await cache.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 2, 2, 1)
+    assert stats["hit_rate"] == 0.3333
+
+
+def test_evicts_least_recently_used(mongo_collection):
+    cache = AnalysisCache(mongo_collection("analysis_cache"), max_entries=2, evict_every=4)
+    long_ago = _now() - timedelta(days=1)
+
+    async def run():
+        for n, key in enumerate(["a", "b", "c"]):
+            await cache.put(key, {"n": n}, "gpt-4o", key)
+            await cache.collection.update_one({"key": key}, {"$set": {"last_hit_at": long_ago + timedelta(minutes=n)}})
+        # A hit makes "a" the most recently used
+        assert await cache.get("a") == {"n": 0}
+        # The fourth store triggers eviction down to max_entries
+        await cache.put("d", {"n": 3}, "gpt-4o", "d")
+        return sorted([doc["key"] async for doc in cache.collection.find({}, {"key": 1})])
+
+    assert asyncio.run(run()) == ["a", "d"]
+    assert cache.evictions == 2
@@ -0,0 +1,79 @@
+"""Batch ingestion: ZIP expansion limits and the batch summary."""
+import os
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.batch_ingest import batch_item, batch_summary, public_batch
+from services.upload_spool import ArchiveError, expand_zip
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+@pytest.fixture(autouse=True)
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(tmp_path / "spool"))
+
+
+def write_zip(tmp_path, members):
+    path = tmp_path / "plans.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_expand_zip_skips_folders_and_hidden_files(tmp_path):
+    path = write_zip(tmp_path, {
+        "plans/": b"", "plans/a.png": PNG, "b.pdf": b"%PDF-1.4", "__MACOSX/._a.png": b"x", ".DS_Store": b"x",
+    })
+    uploads, rejected = expand_zip(path, max_files=10)
+    assert sorted((u.filename, u.file_type) for u in uploads) == [("a.png", "image"), ("b.pdf", "pdf")]
+    assert rejected == []
+    assert all(os.path.exists(u.path) for u in uploads)
+
+
+def test_expand_zip_rejects_oversized_members_by_inflated_size(tmp_path):
+    # Compresses to a few hundred bytes but inflates past the limit
+    path = write_zip(tmp_path, {"big.png": PNG + b"\x00" * 100_000, "a.png": PNG})
+    uploads, rejected = expand_zip(path, max_files=10, max_bytes=10_000, chunk_size=4096)
+    assert [u.filename for u in uploads] == ["a.png"]
+    assert [name for name, _ in rejected] == ["big.png"]
+
+
+def test_expand_zip_limits(tmp_path):
+    path = write_zip(tmp_path, {f"{n}.png": PNG for n in range(3)})
+    with pytest.raises(ArchiveError):
+        expand_zip(path, max_files=2)
+    with pytest.raises(ArchiveError):
+        expand_zip(path, max_files=3, max_total_bytes=len(PNG) * 2)
+    assert os.listdir(tmp_path / "spool") == []
+    bad = tmp_path / "bad.zip"
+    bad.write_bytes(b"PK\x03\x04garbage")
+    with pytest.raises(ArchiveError):
+        expand_zip(str(bad), max_files=3)
+
+
+def test_batch_summary():
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    items = [batch_item(0, "a.png"), batch_item(1, "b.png"), batch_item(2, "c.png"), batch_item(3, "x.txt", error="bad")]
+    items[0].update(status="done", size=1000)
+    items[1].update(status="done", size=3000)
+    items[2].update(status="running", progress=50)
+    batch = {"id": "b", "items": items, "started_at": start, "finished_at": None}
+    summary = batch_summary(batch, now=start + timedelta(seconds=2))
+    assert summary["counts"] == {"done": 2, "running": 1, "failed": 1}
+    assert summary["progress"] == round((100 + 100 + 50 + 100) / 4)
+    assert summary["files_per_second"] == 1.0 and summary["bytes_per_second"] == 2000
+    assert summary["failures"] == [{"index": 3, "filename": "x.txt", "error": "bad"}]
+
+
+def test_public_batch_hides_staging_details():
+    class Spooled:
+        path, size, sha256, file_type, content_type = "/tmp/x.png", 10, "abc", "image", "image/png"
+
+    batch = {"id": "b", "items": [batch_item(0, "x.png", "fp", Spooled())], "started_at": None}
+    item = public_batch(batch)["items"][0]
+    assert "source_path" not in item and "sha256" not in item
+    assert item["floorplan_id"] == "fp" and item["status"] == "queued"
@@ -0,0 +1,67 @@
+"""Blob store: compressed round trips, dedupe by content, and pruning."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from services.blob_store import BlobStore, compress, decompress
+
+
+def collection():
+    return mongomock_motor.AsyncMongoMockClient()["test_blob_store"]["blobs"]
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_compress_round_trip(encoding):
+    if encoding == "zstd":
+        pytest.importorskip("zstandard")
+    raw = b'{"walls": []}' * 100
+    assert decompress(compress(raw, encoding), encoding) == raw
+    with pytest.raises(ValueError):
+        compress(raw, "lz4")
+
+
+def test_put_get_round_trip():
+    blobs = collection()
+    store = BlobStore(blobs, encoding="gzip")
+    canvas = '{"objects": [' + ', '.join('{"type": "line"}' for _ in range(500)) + ']}'
+
+    async def run():
+        refs = await store.put_many([canvas, "piccolo", canvas])
+        assert await blobs.count_documents({}) == 2
+        # A fresh store has nothing cached, so these come from Mongo
+        fresh = BlobStore(blobs, encoding="gzip")
+        assert await fresh.get(refs[0]) == canvas
+        assert await fresh.get_many(refs) == {refs[0]["hash"]: canvas, refs[1]["hash"]: "piccolo"}
+        with pytest.raises(KeyError):
+            await fresh.get({"hash": "0" * 64})
+        return refs
+
+    refs = asyncio.run(run())
+    assert refs[0] == refs[2]
+    assert refs[0]["size"] == len(canvas.encode("utf-8")) and refs[0]["stored_size"] < refs[0]["size"]
+    assert refs[0]["encoding"] == "gzip"
+
+
+def test_prune_keeps_referenced_and_recent_blobs():
+    blobs = collection()
+    store = BlobStore(blobs, encoding="gzip")
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=1)
+
+    async def run():
+        refs = await store.put_many([f"testo {n}" for n in range(5)])
+        old = [ref["hash"] for ref in refs[:4]]
+        await blobs.update_many({"hash": {"$in": old}}, {"$set": {"stored_at": cutoff - timedelta(hours=1)}})
+        keep = {refs[0]["hash"]}
+
+        async def referenced_in(hashes):
+            return keep & set(hashes)
+
+        assert await store.prune(referenced_in, cutoff, batch_size=2, dry_run=True) == 3
+        assert await store.prune(referenced_in, cutoff, batch_size=2) == 3
+        left = {blob["hash"] async for blob in blobs.find({}, {"hash": 1})}
+        assert left == {refs[0]["hash"], refs[4]["hash"]}
+
+    asyncio.run(run())
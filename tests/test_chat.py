@@ -0,0 +1,93 @@
+"""Both chat endpoints end to end: messages stored with native datetimes, replies
+returned or streamed.
+
+Runs server.py against mongomock-motor with the LLM gateway replaced by a
+canned provider; skipped when mongomock-motor is not installed.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("mongomock_motor")
+httpx = pytest.importorskip("httpx")
+
+
+class FakeGateway:
+    def __init__(self, configured=("openai", "anthropic", "gemini")):
+        self.configured = configured
+        self.calls = []
+
+    def client(self, provider):
+        if provider not in self.configured:
+            raise RuntimeError(f"LLM provider '{provider}' is not configured")
+        return object()
+
+    async def complete_chat(self, provider, model, system, messages, max_tokens=2000):
+        self.calls.append((provider, model, messages))
+        return "Ciao"
+
+    async def stream_chat(self, provider, model, system, messages, max_tokens=2000):
+        self.calls.append((provider, model, messages))
+        for delta in ("Ci", "ao"):
+            yield delta
+
+
+@pytest.fixture
+def gateway(server, monkeypatch):
+    fake = FakeGateway()
+    monkeypatch.setattr(server, "llm_gateway", fake)
+    return fake
+
+
+def request(server, method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+
+def stored(server, conversation_id):
+    async def find():
+        return await server.db.messages.find({"conversation_id": conversation_id}, {"_id": 0}).to_list(None)
+    return asyncio.run(find())
+
+
+def test_chat(server, gateway):
+    response = request(server, "POST", "/api/chat", json={"conversation_id": "c1", "message": "Salve", "model": "claude-x"})
+    assert response.status_code == 200
+    assert response.json() == {"message": "Ciao", "model": "anthropic/claude-x"}
+    assert gateway.calls == [("anthropic", "claude-x", [{"role": "user", "content": "Salve"}])]
+    messages = stored(server, "c1")
+    assert [(m["role"], m["content"]) for m in messages] == [("user", "Salve"), ("assistant", "Ciao")]
+    assert all(isinstance(m["timestamp"], datetime) for m in messages)
+
+
+def test_chat_stream(server, gateway):
+    response = request(server, "POST", "/api/chat/stream", json={"conversation_id": "c2", "message": "Salve"})
+    assert response.status_code == 200
+    assert response.text.count("event: token") == 2
+    assert "event: done" in response.text
+    messages = stored(server, "c2")
+    assert [(m["role"], m["content"], m["model"]) for m in messages] == [
+        ("user", "Salve", None), ("assistant", "Ciao", "openai/gpt-5")
+    ]
+    assert all(isinstance(m["timestamp"], datetime) for m in messages)
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_unconfigured_provider(server, monkeypatch, path):
+    monkeypatch.setattr(server, "llm_gateway", FakeGateway(configured=()))
+    response = request(server, "POST", path, json={"conversation_id": "c3", "message": "Salve"})
+    assert response.status_code == 503
+    assert stored(server, "c3") == []
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_provider_without_key_returns_503(server, monkeypatch, path):
+    # The real gateway, never started: no provider has a client
+    monkeypatch.setattr(server, "llm_gateway", server.LLMGateway())
+    response = request(server, "POST", path, json={"conversation_id": "c4", "message": "Salve", "model": "claude-x"})
+    assert response.status_code == 503
+    assert stored(server, "c4") == []
@@ -0,0 +1,27 @@
+"""Image derivatives: one decode, every size and format, never upscaled."""
+from PIL import Image
+
+from services.derivatives import available_formats, build_derivatives
+
+
+def test_build_derivatives_sizes_and_formats(tmp_path):
+    source = tmp_path / "plan.jpg"
+    Image.new("RGB", (1600, 1200), (240, 240, 240)).save(source, quality=90)
+    written = build_derivatives(str(source), str(tmp_path), "fp-1", sizes={"thumb": 320, "preview": 1024, "editor": 2048})
+    assert {item["format"] for item in written} == set(available_formats())
+    webp = {item["name"]: (item["width"], item["height"]) for item in written if item["format"] == "webp"}
+    # The editor size is larger than the source, so it stays at the source size
+    assert webp == {"thumb": (320, 240), "preview": (1024, 768), "editor": (1600, 1200)}
+    for item in written:
+        with Image.open(item["path"]) as image:
+            assert image.size == (item["width"], item["height"])
+        assert item["path"].endswith(f"fp-1_{item['name']}.{item['format']}")
+        assert item["size"] > 0
+
+
+def test_build_derivatives_keeps_transparency(tmp_path):
+    source = tmp_path / "plan.png"
+    Image.new("RGBA", (400, 200), (0, 0, 0, 0)).save(source)
+    [thumb] = build_derivatives(str(source), str(tmp_path), "fp-2", sizes={"thumb": 100}, formats=("webp",))
+    with Image.open(thumb["path"]) as image:
+        assert image.mode == "RGBA" and image.size == (100, 50)
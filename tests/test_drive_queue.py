@@ -0,0 +1,135 @@
+"""Drive upload queue: retries with backoff, resumable sessions and staged file cleanup."""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from services import drive_queue
+from services.drive_queue import DriveUploadQueue, _now
+
+
+class FakeDrive:
+    """DriveService stand-in; `outcomes` are played back one upload attempt at a time."""
+
+    def __init__(self, outcomes, enabled=True):
+        self.service = object() if enabled else None
+        self.outcomes = list(outcomes)
+        self.uploads = []
+        self.invalidated = []
+
+    def ensure_folder(self, root, folder_name):
+        return f"folder-{folder_name}"
+
+    def invalidate_folder(self, root, folder_name):
+        self.invalidated.append(folder_name)
+
+    def upload_file(self, file_path, folder_id=None, mime_type=None, file_name=None,
+                    on_chunk=None, session_uri=None, on_session=None):
+        self.uploads.append((folder_id, session_uri))
+        sent, outcome = self.outcomes.pop(0)
+        if session_uri is None:
+            on_session(f"https://upload.test/session-{len(self.uploads)}")
+        if sent:
+            on_chunk(sent, 1000)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def staged(tmp_path):
+    path = tmp_path / "plan.pdf"
+    path.write_bytes(b"%PDF-1.4" + b"x" * 992)
+    return path
+
+
+@pytest.fixture
+def highest_delay(monkeypatch):
+    monkeypatch.setattr(drive_queue.random, "uniform", lambda low, high: high)
+
+
+def make_queue(mongo_collection, drive, **kwargs):
+    return DriveUploadQueue(mongo_collection("drive_upload_jobs"), drive, "Floor Plans",
+                            **{"max_attempts": 3, "base_delay": 5.0, **kwargs})
+
+
+async def attempt(queue):
+    """Claims the next job as if it were due now and processes it."""
+    await queue.collection.update_many({"status": "queued"}, {"$set": {"next_attempt_at": _now()}})
+    job = await queue._claim()
+    await queue._process(job)
+    # on_session writes are scheduled from the upload thread
+    for _ in range(3):
+        await asyncio.sleep(0)
+    return await queue.get(job["id"])
+
+
+def test_retries_back_off_and_resume_the_session(mongo_collection, staged, highest_delay):
+    drive = FakeDrive([(400, RuntimeError("connection reset")), (400, RuntimeError("timeout")), (1000, "drive-file-1")])
+    queue = make_queue(mongo_collection, drive)
+
+    async def run():
+        await queue.enqueue(str(staged), "fp-1", "plan.pdf", "application/pdf", floorplan_id="fp-1")
+        started = _now()
+        first = await attempt(queue)
+        delay = (first["next_attempt_at"].replace(tzinfo=None) - started.replace(tzinfo=None)).total_seconds()
+        # Second attempt resumes but makes no progress, so the session is dropped
+        second = await attempt(queue)
+        third = await attempt(queue)
+        return first, delay, second, third
+
+    first, delay, second, third = asyncio.run(run())
+    assert (first["status"], first["attempts"], first["bytes_sent"], first["error"]) == ("queued", 1, 400, "connection reset")
+    assert first["upload_session_uri"] == "https://upload.test/session-1"
+    assert 4.5 < delay <= 5.5
+    assert (second["status"], second["upload_session_uri"]) == ("queued", None)
+    assert (third["status"], third["drive_file_id"], third["bytes_sent"]) == ("done", "drive-file-1", 1000)
+    assert drive.uploads == [
+        ("folder-fp-1", None),
+        ("folder-fp-1", "https://upload.test/session-1"),
+        ("folder-fp-1", None),
+    ]
+    assert not staged.exists()
+
+
+def test_gives_up_after_max_attempts(mongo_collection, staged, highest_delay):
+    drive = FakeDrive([(0, None), (0, RuntimeError("quota exceeded"))])
+    queue = make_queue(mongo_collection, drive, max_attempts=2)
+
+    async def run():
+        await queue.enqueue(str(staged), "fp-1", "plan.pdf")
+        return await attempt(queue), await attempt(queue)
+
+    first, second = asyncio.run(run())
+    assert (first["status"], first["error"]) == ("queued", "Drive upload returned no file ID")
+    assert drive.invalidated == ["fp-1"]
+    assert (second["status"], second["attempts"], second["error"]) == ("failed", 2, "quota exceeded")
+    assert not staged.exists()
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(mongo_collection, staged):
+    queue = make_queue(mongo_collection, FakeDrive([]), max_attempts=1)
+
+    async def run():
+        job = await queue.enqueue(str(staged), "fp-1", "plan.pdf")
+        await queue._claim()
+        await queue.collection.update_one({"id": job["id"]}, {"$set": {"lease_expires_at": _now() - timedelta(seconds=1)}})
+        assert await queue._claim() is None
+        await queue._fail_exhausted()
+        return await queue.get(job["id"])
+
+    job = asyncio.run(run())
+    assert (job["status"], job["error"]) == ("failed", "Worker stopped during each of 1 attempts")
+    assert not staged.exists()
+
+
+def test_disabled_drive_skips_jobs(mongo_collection, staged):
+    queue = make_queue(mongo_collection, FakeDrive([], enabled=False))
+
+    async def run():
+        await queue.enqueue(str(staged), "fp-1", "plan.pdf")
+        return await attempt(queue)
+
+    job = asyncio.run(run())
+    assert (job["status"], job["error"]) == ("skipped", "Drive integration disabled")
+    assert not staged.exists()
@@ -0,0 +1,142 @@
+"""Drive service: the folder ID cache, its single-flight lookups, and resumable uploads."""
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from cachetools import TTLCache
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMockSequence
+
+from services import drive_service
+from services.drive_service import DriveService
+
+
+class FolderDrive(DriveService):
+    """DriveService with the folder API calls answered from a dict."""
+
+    def __init__(self, delay: float = 0.0):
+        self.service = object()
+        self._folder_cache = TTLCache(maxsize=100, ttl=3600)
+        self._folder_inflight = {}
+        self._folder_lock = threading.Lock()
+        self.delay = delay
+        self.folders = {}
+        self.calls = []
+
+    def find_folder(self, folder_name, parent_id=None):
+        self.calls.append(("find", folder_name))
+        time.sleep(self.delay)
+        return self.folders.get((parent_id, folder_name))
+
+    def create_folder(self, folder_name, parent_id=None):
+        self.calls.append(("create", folder_name))
+        folder_id = f"id-{len(self.folders)}"
+        self.folders[(parent_id, folder_name)] = folder_id
+        return folder_id
+
+
+def test_concurrent_lookups_create_each_folder_once():
+    drive = FolderDrive(delay=0.05)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids = list(pool.map(lambda _: drive.ensure_folder("Floor Plans", "fp-1"), range(8)))
+    assert len(set(ids)) == 1
+    assert drive.calls == [("find", "Floor Plans"), ("create", "Floor Plans"), ("find", "fp-1"), ("create", "fp-1")]
+
+
+def test_cached_paths_skip_drive_until_invalidated():
+    drive = FolderDrive()
+    drive.folders = {(None, "Floor Plans"): "root", ("root", "fp-1"): "f1", ("root", "fp-2"): "f2"}
+    assert drive.ensure_folder("Floor Plans", "fp-1") == "f1"
+    assert drive.ensure_folder("Floor Plans", "fp-2") == "f2"
+    assert drive.ensure_folder("Floor Plans", "fp-1") == "f1"
+    assert len(drive.calls) == 3
+
+    # Dropping a path drops everything below it, but not its siblings' parents
+    drive.invalidate_folder("Floor Plans", "fp-1")
+    drive.ensure_folder("Floor Plans", "fp-1")
+    drive.ensure_folder("Floor Plans", "fp-2")
+    assert drive.calls[3:] == [("find", "fp-1")]
+    drive.invalidate_folder("Floor Plans")
+    drive.ensure_folder("Floor Plans", "fp-2")
+    assert drive.calls[4:] == [("find", "Floor Plans"), ("find", "fp-2")]
+
+
+def test_failed_lookup_is_shared_and_not_cached():
+    drive = FolderDrive(delay=0.05)
+
+    def broken(folder_name, parent_id=None):
+        drive.calls.append(("find", folder_name))
+        time.sleep(drive.delay)
+        raise ConnectionError("Drive unavailable")
+
+    drive.find_folder = broken
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(drive.ensure_folder, "Floor Plans") for _ in range(4)]
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result()
+    assert drive.calls == [("find", "Floor Plans")]
+    assert drive._folder_inflight == {} and len(drive._folder_cache) == 0
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(drive_service, "UPLOAD_CHUNK_SIZE", 256 * 1024)
+    path = tmp_path / "plan.pdf"
+    path.write_bytes(b"%PDF" + b"x" * (600 * 1024 - 4))
+    return str(path)
+
+
+def drive_with(responses):
+    """DriveService whose HTTP calls get `responses` in order (requests land in http.request_sequence)."""
+    drive = DriveService.__new__(DriveService)
+    http = HttpMockSequence(responses)
+    drive.service = build("drive", "v3", http=http, static_discovery=True)
+    return drive, http
+
+
+def test_upload_reports_session_and_progress(upload):
+    drive, _ = drive_with([
+        ({"status": "200", "location": "https://upload.test/s1"}, ""),
+        ({"status": "308", "range": "bytes=0-262143"}, ""),
+        ({"status": "308", "range": "bytes=0-524287"}, ""),
+        ({"status": "200"}, json.dumps({"id": "F1"})),
+    ])
+    sessions, progress = [], []
+    file_id = drive.upload_file(upload, on_chunk=lambda sent, total: progress.append(sent), on_session=sessions.append)
+    assert (file_id, sessions, progress) == ("F1", ["https://upload.test/s1"], [262144, 524288])
+
+
+def test_resume_queries_the_session_then_sends_the_rest(upload):
+    drive, http = drive_with([
+        ({"status": "308", "range": "bytes=0-524287"}, ""),
+        ({"status": "200"}, json.dumps({"id": "F2"})),
+    ])
+    assert drive.upload_file(upload, session_uri="https://upload.test/s1") == "F2"
+    (query_uri, query_method, _, query_headers), (_, _, _, chunk_headers) = http.request_sequence
+    assert (query_uri, query_method) == ("https://upload.test/s1", "PUT")
+    assert query_headers["Content-Range"] == f"bytes */{600 * 1024}"
+    assert chunk_headers["Content-Range"] == f"bytes 524288-{600 * 1024 - 1}/{600 * 1024}"
+
+
+def test_resume_of_a_completed_upload_returns_the_file(upload):
+    drive, _ = drive_with([({"status": "200"}, json.dumps({"id": "F3"}))])
+    assert drive.upload_file(upload, session_uri="https://upload.test/s1") == "F3"
+
+
+def test_expired_session_starts_a_new_upload(upload):
+    drive, _ = drive_with([
+        ({"status": "404"}, "{}"),
+        ({"status": "200", "location": "https://upload.test/s2"}, ""),
+        ({"status": "308", "range": "bytes=0-262143"}, ""),
+        ({"status": "308", "range": "bytes=0-524287"}, ""),
+        ({"status": "200"}, json.dumps({"id": "F4"})),
+    ])
+    sessions = []
+    assert drive.upload_file(upload, session_uri="https://upload.test/s1", on_session=sessions.append) == "F4"
+    assert sessions == ["https://upload.test/s2"]
@@ -0,0 +1,46 @@
+"""Floor plan list summaries: payload flags and sizes computed by the server.
+
+The summary projection uses aggregation expressions, which mongomock cannot
+evaluate, so this needs a real MongoDB at TEST_MONGO_URL (as test_indexes).
+"""
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+pymongo = pytest.importorskip("pymongo")
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL not set")
+
+
+@pytest.fixture
+def floorplans():
+    client = pymongo.MongoClient(TEST_MONGO_URL, tz_aware=True)
+    db = client[f"test_summary_{uuid.uuid4().hex[:8]}"]
+    yield db.floorplans
+    client.drop_database(db.name)
+    client.close()
+
+
+def test_summary_projection(server, floorplans):
+    now = datetime.now(timezone.utc)
+    base = {"user_id": "u1", "file_type": "canvas", "status": "ready", "created_at": now, "updated_at": now}
+    floorplans.insert_many([
+        dict(base, id="inline", name="Inline", canvas_data='{"objects": []}', three_d_data="è"),
+        dict(base, id="blob", name="Blob", canvas_data_blob={"hash": "h", "size": 5000, "stored_size": 900, "encoding": "gzip"}),
+        dict(base, id="empty", name="Empty", status="error", error="unreadable plan"),
+    ])
+    docs = {
+        doc["id"]: server.FloorPlanSummary.model_validate(doc)
+        for doc in floorplans.find({}, server.FLOORPLAN_SUMMARY_PROJECTION)
+    }
+    assert (docs["inline"].has_canvas, docs["inline"].has_3d) == (True, True)
+    assert (docs["inline"].canvas_data_size, docs["inline"].three_d_data_size) == (15, 2)
+    assert (docs["blob"].has_canvas, docs["blob"].canvas_data_size, docs["blob"].has_3d) == (True, 5000, False)
+    assert (docs["empty"].has_canvas, docs["empty"].canvas_data_size, docs["empty"].error) == (False, 0, "unreadable plan")
+    # The payloads themselves never leave the server
+    raw = floorplans.find_one({"id": "inline"}, server.FLOORPLAN_SUMMARY_PROJECTION)
+    assert "canvas_data" not in raw and "three_d_data" not in raw and "_id" not in raw
@@ -0,0 +1,220 @@
+"""Room detection (parity with the editor's roomDetection.js, plus the cases it gets wrong)
+and scene normalization.
+
+The parity tests run the editor's module under node and are skipped when
+node is not installed.
+"""
+import json
+import random
+import shutil
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from services.geometry import PlanarGraph, SegmentGrid, detect_rooms, normalize_scene, remove_spikes, wall_segments
+
+ROOM_DETECTION_JS = Path(__file__).resolve().parent.parent / "frontend" / "src" / "utils" / "roomDetection.js"
+
+requires_node = pytest.mark.skipif(shutil.which("node") is None, reason="node not installed")
+
+
+def wall(x1, y1, x2, y2):
+    return {"id": f"w{x1},{y1},{x2},{y2}", "points": [x1, y1, x2, y2]}
+
+
+def rectangle(x, y, width, height):
+    return [
+        wall(x, y, x + width, y),
+        wall(x + width, y, x + width, y + height),
+        wall(x + width, y + height, x, y + height),
+        wall(x, y + height, x, y),
+    ]
+
+
+def grid_plan(columns, rows, size=200, jitter=0.0, seed=0):
+    """columns x rows rooms sharing walls, every wall split at the grid nodes."""
+    rng = random.Random(seed)
+
+    def node(i, j):
+        return i * size + rng.uniform(-jitter, jitter), j * size + rng.uniform(-jitter, jitter)
+
+    walls = []
+    for j in range(rows + 1):
+        for i in range(columns):
+            walls.append(wall(*node(i, j), *node(i + 1, j)))
+    for i in range(columns + 1):
+        for j in range(rows):
+            walls.append(wall(*node(i, j), *node(i, j + 1)))
+    rng.shuffle(walls)
+    return walls
+
+
+def run_js(walls):
+    source = ROOM_DETECTION_JS.read_text().replace("export const", "const")
+    script = source + f"\nprocess.stdout.write(JSON.stringify(detectRooms({json.dumps(walls)})));\n"
+    result = subprocess.run(["node", "-"], input=script, capture_output=True, text=True, check=True, timeout=60)
+    return json.loads(result.stdout)
+
+
+def signed_area(points):
+    return sum(
+        points[i]["x"] * points[(i + 1) % len(points)]["y"] - points[(i + 1) % len(points)]["x"] * points[i]["y"]
+        for i in range(len(points))
+    ) / 2
+
+
+def canonical(rooms):
+    return sorted((round(room["area"], 6), sorted((p["x"], p["y"]) for p in room["points"])) for room in rooms)
+
+
+PARITY_PLANS = {
+    "single room": rectangle(0, 0, 400, 300),
+    "reversed walls": [wall(*w["points"][2:], *w["points"][:2]) for w in rectangle(0, 0, 400, 300)],
+    "duplicate walls": rectangle(0, 0, 400, 300) + rectangle(0, 0, 400, 300)[:2],
+    "two rooms": [
+        wall(0, 0, 200, 0), wall(200, 0, 500, 0), wall(500, 0, 500, 300),
+        wall(500, 300, 200, 300), wall(200, 300, 0, 300), wall(0, 300, 0, 0), wall(200, 0, 200, 300),
+    ],
+    "l shape": [
+        wall(0, 0, 400, 0), wall(400, 0, 400, 200), wall(400, 200, 200, 200),
+        wall(200, 200, 200, 400), wall(200, 400, 0, 400), wall(0, 400, 0, 0),
+    ],
+    "closet below min area": rectangle(0, 0, 400, 300) + rectangle(1000, 0, 50, 50),
+    "grid": grid_plan(4, 3),
+    "jittered grid": grid_plan(5, 4, jitter=2.0, seed=7),
+}
+
+
+@requires_node
+@pytest.mark.parametrize("name", sorted(PARITY_PLANS))
+def test_matches_editor(name):
+    walls = PARITY_PLANS[name]
+    # The editor also reports the plan's outer boundary, which is not a room
+    expected = [room for room in run_js(walls) if signed_area(room["points"]) > 0]
+    assert canonical(detect_rooms(walls)) == canonical(expected)
+
+
+def test_outer_boundary_is_not_a_room():
+    rooms = detect_rooms(grid_plan(2, 2))
+    assert len(rooms) == 4
+    assert all(room["area"] == pytest.approx(200 * 200) for room in rooms)
+
+
+def test_dangling_wall_does_not_change_room():
+    walls = rectangle(0, 0, 400, 300) + [wall(0, 0, 100, 100), wall(400, 300, 600, 300)]
+    rooms = detect_rooms(walls)
+    assert len(rooms) == 1
+    assert len(rooms[0]["points"]) == 4
+    assert rooms[0]["area"] == pytest.approx(400 * 300)
+
+
+def test_snapping_crosses_grid_cells():
+    # 7 and 8 fall in different 15px cells but are 1px apart
+    walls = [wall(7, 0, 400, 0), wall(400, 0, 400, 300), wall(400, 300, 0, 300), wall(0, 300, 8, 0)]
+    assert len(detect_rooms(walls)) == 1
+
+
+def test_ids_are_stable():
+    walls = grid_plan(3, 2, seed=1)
+    assert [room["id"] for room in detect_rooms(walls)] == [room["id"] for room in detect_rooms(walls)]
+
+
+def test_remove_spikes():
+    assert remove_spikes([0, 1, 2, 3, 2, 4]) == [0, 1, 2, 4]
+    assert remove_spikes([5, 0, 1, 2, 0]) == [0, 1, 2]
+
+
+def test_malformed_walls_are_ignored():
+    walls = rectangle(0, 0, 400, 300) + [
+        {"points": [1, 2]}, {"id": "x"}, "wall", {"points": ["a", 0, 1, 1]}, {"points": [0, 0, float("inf"), 1]},
+    ]
+    assert len(wall_segments(walls)) == 4
+    assert len(detect_rooms(walls)) == 1
+
+
+def test_half_edges_form_faces():
+    graph = PlanarGraph(wall_segments(grid_plan(3, 3)))
+    face, cycles = graph.faces()
+    assert sum(len(cycle) for cycle in cycles) == 2 * graph.edge_count
+    # Euler: V - E + F = 2 for a connected plane graph
+    assert len(graph.vertices) - graph.edge_count + len(cycles) == 2
+
+
+def wall_3d(start, end, height=2.8, thickness=0.2):
+    return {"start": list(start), "end": list(end), "height": height, "thickness": thickness}
+
+
+def test_normalize_merges_split_and_overlapping_walls():
+    scene = {"walls": [
+        wall_3d((0, 0), (2.5, 0)),
+        wall_3d((2.52, 0.01), (5, 0)),  # split, endpoints a little apart
+        wall_3d((1, 0), (3, 0)),  # overlapping
+        wall_3d((5, 0), (0, 0.0001)),  # reversed duplicate
+        wall_3d((5, 0), (5, 4)),
+    ]}
+    normalized, report = normalize_scene(scene)
+    assert [(w["start"], w["end"]) for w in normalized["walls"]] == [([0.0, 0.0], [5.0, 0.0]), ([5.0, 0.0], [5.0, 4.0])]
+    assert report["before"]["walls"] == 5 and report["after"]["walls"] == 2
+
+
+def test_normalize_keeps_different_walls_apart():
+    scene = {"walls": [
+        wall_3d((0, 0), (2, 0)),
+        wall_3d((2, 0), (4, 0), height=3.5),  # collinear but taller
+        wall_3d((0, 1), (4, 1)),  # parallel, 1m away
+    ]}
+    normalized, _ = normalize_scene(scene)
+    assert len(normalized["walls"]) == 3
+
+
+def test_normalize_drops_degenerate_elements():
+    scene = {
+        "walls": [wall_3d((0, 0), (4, 0)), wall_3d((1, 1), (1.01, 1)), {"start": ["x", 0], "end": [1, 1]}, "wall"],
+        "doors": [{"position": [1, 0], "width": 0}, {"width": 0.9}, {"position": [2, 0], "width": 0.9, "height": 2.1}],
+        "rooms": [{"id": "a", "width": 3, "depth": 0}, {"id": "b", "width": 3, "depth": 2}],
+        "pages": 2,
+    }
+    normalized, report = normalize_scene(scene)
+    assert len(normalized["walls"]) == 1
+    assert len(normalized["doors"]) == 1
+    assert [room["id"] for room in normalized["rooms"]] == ["b"]
+    assert normalized["pages"] == 2
+    assert report["elements_before"] == 9 and report["elements_after"] == 3
+
+
+def test_normalize_attaches_openings_to_walls():
+    scene = {
+        "walls": [wall_3d((0, 0), (5, 0)), wall_3d((5, 0), (5, 4))],
+        "doors": [
+            {"position": [2.5, 0.1], "width": 0.9, "height": 2.1},
+            {"position": [2.51, 0.05], "width": 0.9, "height": 2.1},  # same door twice
+        ],
+        "windows": [{"position": [4.9, 2], "width": 1.2, "height": 1.5}, {"position": [2, 2], "width": 1.2}],
+    }
+    normalized, report = normalize_scene(scene)
+    assert normalized["doors"] == [{"position": [2.5, 0.0], "width": 0.9, "height": 2.1, "wall": 0, "offset": 2.5}]
+    assert normalized["windows"][0]["wall"] == 1 and normalized["windows"][0]["position"] == [5.0, 2.0]
+    assert "wall" not in normalized["windows"][1]
+    assert report["hosted"] == {"doors": 1, "windows": 1}
+
+
+def test_normalize_drops_absurd_coordinates():
+    scene = {
+        "walls": [wall_3d((0, 0), (5, 0)), wall_3d((0, 0), (1e7, 1e7)), wall_3d((0, 0), (float("nan"), 1))],
+        "doors": [{"position": [2, 0], "width": 0.9}, {"position": [-1e9, 3], "width": 0.9}],
+    }
+    normalized, _ = normalize_scene(scene)
+    assert len(normalized["walls"]) == 1
+    assert [door.get("wall") for door in normalized["doors"]] == [0]
+
+
+def test_segment_grid_brute_forces_oversized_spans():
+    segments = np.array([[0, 0, 5, 0], [0, 2, 9000, 9002]], dtype=np.float64)
+    grid = SegmentGrid(segments, max_cells=64)
+    assert grid.oversized == [1]
+    assert grid.nearest(4000, 4002.1, 0.3)[0] == 1
+    assert grid.nearest(2, 0.1, 0.3)[0] == 0
+    # A lookup reaching further than the cap checks every segment
+    assert grid.nearest(2, -50, 100)[0] == 0
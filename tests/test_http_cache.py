@@ -0,0 +1,117 @@
+"""ETags, conditional GETs and negotiated compression, on a minimal app."""
+import gzip
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+from services import compression
+from services.compression import CompressionMiddleware, negotiate_encoding
+from services.http_cache import compute_etag, conditional_response, etag_matches
+
+DOC = {"id": "fp-1", "name": "Casa " * 400}
+ETAG = compute_etag(DOC)
+
+
+@pytest.mark.parametrize("header,matches", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    (ETAG, True),
+    (f"W/{ETAG}", True),
+    (f'"other", {ETAG}', True),
+    (ETAG[:-1] + '-gzip"', True),
+    (ETAG[:-1] + '-br"', True),
+    (ETAG[:-1] + '-deflate"', False),
+    ('"other"', False),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, ETAG) is matches
+
+
+def test_compute_etag_ignores_key_order():
+    assert compute_etag({"a": 1, "b": [1, 2]}) == compute_etag({"b": [1, 2], "a": 1})
+    assert compute_etag({"a": 1}) != compute_etag({"a": 2})
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate_encoding(header) == expected
+
+
+def build_app():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/doc")
+    async def doc(request: Request, response: Response):
+        not_modified = conditional_response(request, response, DOC)
+        return not_modified or DOC
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for n in range(3):
+                yield ("x" * 1000 + "\n").encode()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return app
+
+
+def get(app, path, **headers):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers=headers)
+    return asyncio.run(run())
+
+
+def test_conditional_get_and_compression(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    app = build_app()
+
+    plain = get(app, "/doc", **{"accept-encoding": "identity"})
+    assert plain.headers["etag"] == ETAG and "content-encoding" not in plain.headers
+    assert plain.json() == DOC
+
+    zipped = get(app, "/doc", **{"accept-encoding": "gzip"})
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert zipped.headers["etag"] == ETAG[:-1] + '-gzip"'
+    assert zipped.headers["vary"] == "Accept-Encoding"
+    assert int(zipped.headers["content-length"]) < len(plain.content)
+    assert zipped.json() == DOC
+
+    # Either ETag revalidates, whichever encoding the client cached
+    for etag in (plain.headers["etag"], zipped.headers["etag"]):
+        revalidated = get(app, "/doc", **{"accept-encoding": "gzip", "if-none-match": etag})
+        assert revalidated.status_code == 304 and revalidated.content == b""
+
+
+def test_small_and_streamed_bodies_pass_through(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    app = build_app()
+    small = get(app, "/small", **{"accept-encoding": "gzip"})
+    assert "content-encoding" not in small.headers and small.json() == {"ok": True}
+    streamed = get(app, "/stream", **{"accept-encoding": "gzip"})
+    assert "content-encoding" not in streamed.headers
+    assert streamed.content == ("x" * 1000 + "\n").encode() * 3
+
+
+def test_compress_body_round_trip():
+    body = b"plan " * 1000
+    assert gzip.decompress(compression.compress_body(body, "gzip")) == body
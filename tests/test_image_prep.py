@@ -0,0 +1,36 @@
+"""Floor plan pre-processing: thresholding, cropping and tile-aware downsampling."""
+import numpy as np
+from PIL import Image, ImageDraw
+
+from services.image_prep import otsu_threshold, prepare_for_analysis
+
+
+def plan(tmp_path, width, height, stroke):
+    """A rectangular room outline on a white margin, in pure black and white."""
+    image = Image.new('L', (width + 40, height + 40), 255)
+    ImageDraw.Draw(image).rectangle([20, 20, 19 + width, 19 + height], outline=0, width=stroke)
+    path = tmp_path / "plan.png"
+    image.save(path)
+    return str(path)
+
+
+def test_otsu_threshold_separates_two_level_images():
+    gray = np.array([[0, 0, 255, 255, 255]], dtype=np.uint8)
+    threshold = otsu_threshold(gray)
+    assert 0 < threshold <= 255
+    assert ((gray < threshold) == (gray == 0)).all()
+
+
+def test_trim_to_tile_boundary(tmp_path):
+    # Stroke 4 allows half scale: 2140px wide becomes 1070, just past two tiles, so it is trimmed
+    result = prepare_for_analysis(plan(tmp_path, 2100, 1200, 4), min_edge=768)
+    assert result["skew_degrees"] == 0
+    assert result["width"] == 1024
+
+
+def test_trim_never_goes_below_min_edge(tmp_path):
+    # Thick walls pin the scale at the min_edge floor (768px long edge); the short
+    # edge lands just past one tile, but trimming it would shrink the long edge too
+    result = prepare_for_analysis(plan(tmp_path, 1000, 680, 20), min_edge=768)
+    assert result["width"] == 768
+    assert result["height"] > 512
@@ -0,0 +1,140 @@
+"""Image proxy: host allowlist, ranges, the disk LRU and coalesced upstream fetches."""
+import os
+import time
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from services.image_proxy import CachedImage, DiskLRU, ImageProxy, ProxyError, host_allowed, parse_range
+
+URL = "https://res.cloudinary.com/demo/plan.png"
+BODY = os.urandom(300_000)
+
+
+@pytest.mark.parametrize("host,allowed", [
+    ("res.cloudinary.com", True),
+    ("RES.Cloudinary.com", True),
+    ("img.example.com", True),
+    ("example.com", False),
+    ("evil-res.cloudinary.com", False),
+    (None, False),
+])
+def test_host_allowed(host, allowed):
+    assert host_allowed(host, ["res.cloudinary.com", ".example.com"]) is allowed
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=500-5000", (500, 999)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=10-5"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ProxyError) as raised:
+        parse_range(header, 1000)
+    assert raised.value.status_code == 416
+
+
+def cache_entry(directory, key, size):
+    body = os.path.join(directory, f"{key}.part-1")
+    with open(body, "wb") as handle:
+        handle.write(b"x" * size)
+    return CachedImage(key=key, url=f"https://res.cloudinary.com/{key}", size=size, content_type="image/png",
+                       etag=None, last_modified=None, fetched_at=time.time()), body
+
+
+def test_disk_lru_evicts_least_recently_used_and_reloads(tmp_path):
+    cache = DiskLRU(str(tmp_path), max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(*cache_entry(str(tmp_path), key, 100))
+    assert cache.get("a") is not None
+    cache.put(*cache_entry(str(tmp_path), "c", 100))
+    assert list(cache.entries) == ["a", "c"] and cache.total == 200
+    assert sorted(os.listdir(tmp_path)) == ["a.bin", "a.json", "c.bin", "c.json"]
+
+    # Leftover partial downloads are dropped when the cache is reopened
+    open(tmp_path / "d.part-2", "wb").close()
+    reopened = DiskLRU(str(tmp_path), max_bytes=250)
+    assert set(reopened.entries) == {"a", "c"} and reopened.total == 200
+    assert not (tmp_path / "d.part-2").exists()
+
+
+@pytest.fixture
+def proxy(tmp_path, monkeypatch):
+    monkeypatch.setenv("IMAGE_PROXY_CACHE_DIR", str(tmp_path / "proxy"))
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        # Slow enough that concurrent requests find the fetch in flight
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, content=BODY, headers={"content-type": "image/png", "etag": '"v1"'})
+
+    async def build():
+        proxy = ImageProxy(allowed_hosts=["res.cloudinary.com"], fresh_seconds=3600)
+        await proxy.start()
+        await proxy._http.aclose()
+        proxy._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return proxy
+
+    proxy = asyncio.run(build())
+    proxy.requests = requests
+    return proxy
+
+
+async def read(response):
+    return response.status_code, b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_concurrent_requests_share_one_fetch(proxy):
+    async def run():
+        responses = await asyncio.gather(*[proxy.serve(URL, {}) for _ in range(3)])
+        bodies = [await read(response) for response in responses]
+        while proxy._downloads:
+            await asyncio.sleep(0.01)
+        cached = await read(await proxy.serve(URL, {"range": "bytes=0-9"}))
+        revalidated = await proxy.serve(URL, {"if-none-match": '"v1"'})
+        await proxy.close()
+        return bodies, cached, revalidated.status_code
+
+    bodies, cached, revalidated = asyncio.run(run())
+    assert bodies == [(200, BODY)] * 3
+    assert cached == (206, BODY[:10])
+    assert revalidated == 304
+    assert len(proxy.requests) == 1
+    assert (proxy.stats["fetches"], proxy.stats["coalesced"], proxy.stats["hits"]) == (1, 2, 2)
+
+
+def test_stale_entries_are_revalidated(proxy):
+    async def run():
+        await read(await proxy.serve(URL, {}))
+        while proxy._downloads:
+            await asyncio.sleep(0.01)
+        proxy.fresh_seconds = 0
+        status, body = await read(await proxy.serve(URL, {}))
+        await proxy.close()
+        return status, body
+
+    assert asyncio.run(run()) == (200, BODY)
+    assert [request.headers.get("if-none-match") for request in proxy.requests] == [None, '"v1"']
+    assert proxy.stats["revalidated"] == 1
+
+
+def test_rejects_other_hosts(proxy):
+    with pytest.raises(ProxyError) as raised:
+        asyncio.run(proxy.serve("https://evil.test/plan.png", {}))
+    assert raised.value.status_code == 403
+    assert proxy.requests == []
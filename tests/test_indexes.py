@@ -0,0 +1,183 @@
+"""Query-plan checks: every query shape the API runs must use an index.
+
+Needs a real MongoDB (explain() is not emulated by mocks). Point
+TEST_MONGO_URL at a disposable server; a throwaway database is created and
+dropped. Skipped when TEST_MONGO_URL is not set.
+"""
+import os
+import uuid
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+pymongo = pytest.importorskip("pymongo")
+motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+
+from services.indexes import INDEXES, ensure_indexes
+from services.job_runner import CLAIM_SORT as JOB_CLAIM_SORT, JobRunner
+from services.drive_queue import CLAIM_SORT as DRIVE_CLAIM_SORT, DriveUploadQueue
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL not set")
+
+# (collection, filter, sort) for every read path in server.py
+QUERY_SHAPES = [
+    ("floorplans", {"id": "fp-1"}, None),
+    ("floorplans", {"user_id": "user-1"}, [("created_at", -1), ("id", -1)]),
+    ("floorplans", {}, [("created_at", -1), ("id", -1)]),
+    ("conversations", {"user_id": "user-1"}, [("created_at", -1), ("id", -1)]),
+    ("messages", {"conversation_id": "conv-1"}, [("timestamp", 1), ("id", 1)]),
+    ("user_preferences", {"user_id": "user-1"}, None),
+    ("feedback", {"user_id": "user-1"}, [("created_at", -1), ("id", -1)]),
+    ("feedback", {}, [("created_at", -1), ("id", -1)]),
+    ("learning_data", {"user_id": "user-1"}, [("timestamp", -1)]),
+    ("drive_upload_jobs", {"id": "job-1"}, None),
+    ("jobs", {"id": "job-1"}, None),
+    ("batches", {"id": "batch-1"}, None),
+    ("jobs", {"floorplan_id": "fp-1", "kind": "convert-3d", "status": {"$in": ["queued", "running"]}}, None),
+    ("analysis_cache", {"key": "k", "expires_at": {"$gt": datetime.now(timezone.utc)}}, None),
+    ("style_palettes", {"style": "industrial"}, None),
+    # Blob prune: one batch of old blobs in hash order, then its references
+    ("blobs", {"hash": {"$gt": "0"}, "stored_at": {"$lt": datetime.now(timezone.utc)}}, [("hash", 1)]),
+    ("floorplans", {"canvas_data_blob.hash": {"$in": ["a", "b"]}}, None),
+    ("floorplans", {"three_d_data_blob.hash": {"$in": ["a", "b"]}}, None),
+    # Date-range filters (created_after/created_before, since/until)
+    ("floorplans", {"user_id": "user-1", "created_at": {"$gte": datetime(2024, 1, 1, tzinfo=timezone.utc)}},
+     [("created_at", -1), ("id", -1)]),
+    ("floorplans", {"created_at": {"$gte": datetime(2024, 1, 1, tzinfo=timezone.utc),
+                                   "$lt": datetime(2025, 1, 1, tzinfo=timezone.utc)}},
+     [("created_at", -1), ("id", -1)]),
+    ("messages", {"conversation_id": "conv-1", "timestamp": {"$gte": datetime(2024, 1, 1, tzinfo=timezone.utc)}},
+     [("timestamp", 1), ("id", 1)]),
+    ("feedback", {"created_at": {"$lt": datetime(2025, 1, 1, tzinfo=timezone.utc)}}, [("created_at", -1), ("id", -1)]),
+]
+
+
+def _queue_shapes():
+    """(collection, filter, sort) of the job queues' claim and expiry queries, as the services build them."""
+    now = datetime.now(timezone.utc)
+    runner = JobRunner(None)
+    runner.register("convert-3d", None)
+    queue = DriveUploadQueue(None, None, "root")
+    return [
+        ("jobs", runner._claim_filter(now), JOB_CLAIM_SORT),
+        ("jobs", runner._exhausted_filter(now), None),
+        ("drive_upload_jobs", queue._claim_filter(now), DRIVE_CLAIM_SORT),
+        ("drive_upload_jobs", queue._exhausted_filter(now), None),
+    ]
+
+
+# Workers claim with an $or of "queued" and "running with an expired lease"
+QUEUE_SHAPES = _queue_shapes()
+
+
+# Keyset continuation pages (see services.pagination.keyset_query)
+KEYSET_SHAPES = [
+    ("floorplans", {"user_id": "user-1"}, "created_at", -1),
+    ("messages", {"conversation_id": "conv-1"}, "timestamp", 1),
+]
+
+
+def _stages(plan):
+    """Flattens a winning plan into its list of stage names."""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _stages(child)
+    return stages
+
+
+@pytest.fixture(scope="module")
+def database():
+    name = f"test_indexes_{uuid.uuid4().hex[:8]}"
+
+    async def setup():
+        client = motor_asyncio.AsyncIOMotorClient(TEST_MONGO_URL)
+        await ensure_indexes(client[name])
+        client.close()
+
+    asyncio.run(setup())
+    client = pymongo.MongoClient(TEST_MONGO_URL)
+    db = client[name]
+    # Some documents so the planner has real choices to make
+    now = datetime.now(timezone.utc)
+    for collection_name in INDEXES:
+        if collection_name in ("analysis_cache", "style_palettes"):
+            continue
+        db[collection_name].insert_many([
+            {
+                "id": f"doc-{i}",
+                # user_preferences and blobs are unique on these
+                "user_id": f"user-{i}" if collection_name == "user_preferences" else f"user-{i % 5}",
+                "hash": f"{i:064x}",
+                "conversation_id": f"conv-{i % 5}",
+                "floorplan_id": f"fp-{i % 5}",
+                "kind": "convert-3d",
+                "status": ("completed", "queued", "running")[i % 3],
+                "created_at": now - timedelta(minutes=i),
+                "timestamp": now - timedelta(minutes=i),
+                "next_attempt_at": now,
+                "lease_expires_at": now - timedelta(minutes=i),
+                "attempts": i % 4,
+                "stored_at": now - timedelta(hours=i),
+            }
+            for i in range(50)
+        ])
+    yield db
+    client.drop_database(name)
+    client.close()
+
+
+def test_registry_is_ensured(database):
+    for collection_name, indexes in INDEXES.items():
+        existing = set(database[collection_name].index_information())
+        expected = {index.document["name"] for index in indexes}
+        assert expected <= existing, f"{collection_name} is missing {expected - existing}"
+
+
+def test_unique_indexes(database):
+    assert database.user_preferences.index_information()["user_unique"]["unique"]
+    for collection_name, indexes in INDEXES.items():
+        if any(index.document["name"] == "id_unique" for index in indexes):
+            assert database[collection_name].index_information()["id_unique"]["unique"]
+
+
+@pytest.mark.parametrize("collection_name,query,sort", QUERY_SHAPES)
+def test_query_uses_index_without_in_memory_sort(database, collection_name, query, sort):
+    cursor = database[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    stages = _stages(plan)
+    assert "IXSCAN" in stages, f"{collection_name} {query}: {stages}"
+    assert "COLLSCAN" not in stages, f"{collection_name} {query}: {stages}"
+    assert "SORT" not in stages, f"{collection_name} {query} sorted in memory: {stages}"
+
+
+@pytest.mark.parametrize("collection_name,query,sort", QUEUE_SHAPES)
+def test_queue_claim_uses_index(database, collection_name, query, sort):
+    cursor = database[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    plan = cursor.limit(1).explain()["queryPlanner"]["winningPlan"]
+    stages = _stages(plan)
+    # Every $or branch must be served by an index; the claimable jobs left to
+    # order are only the queued and expired ones
+    assert "IXSCAN" in stages, f"{collection_name} {query}: {stages}"
+    assert "COLLSCAN" not in stages, f"{collection_name} {query}: {stages}"
+
+
+@pytest.mark.parametrize("collection_name,query,sort_field,direction", KEYSET_SHAPES)
+def test_keyset_page_uses_index(database, collection_name, query, sort_field, direction):
+    from services.pagination import encode_cursor, keyset_query, keyset_sort
+
+    first = database[collection_name].find_one(query, sort=keyset_sort(sort_field, direction))
+    after = encode_cursor(first, sort_field)
+    cursor = database[collection_name].find(keyset_query(query, sort_field, direction, after))
+    plan = cursor.sort(keyset_sort(sort_field, direction)).limit(10).explain()["queryPlanner"]["winningPlan"]
+    stages = _stages(plan)
+    assert "IXSCAN" in stages and "COLLSCAN" not in stages and "SORT" not in stages, stages
@@ -0,0 +1,122 @@
+"""Job runner: dedupe, claims with leases, the attempts cap and failure hooks."""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from services.job_runner import JobRunner, _now
+
+
+@pytest.fixture
+def jobs(mongo_collection):
+    return JobRunner(mongo_collection("jobs"), max_attempts=2, lease_seconds=60)
+
+
+async def expire_leases(jobs):
+    await jobs.collection.update_many({"status": "running"}, {"$set": {"lease_expires_at": _now() - timedelta(seconds=1)}})
+
+
+async def stored(jobs, job_id):
+    return await jobs.collection.find_one({"id": job_id}, {"_id": 0})
+
+
+def test_submit_dedupes_active_jobs(jobs):
+
+    async def handler(ctx):
+        return {}
+
+    jobs.register("convert-3d", handler)
+
+    async def run():
+        first = await jobs.submit("convert-3d", floorplan_id="fp-1")
+        assert (await jobs.submit("convert-3d", floorplan_id="fp-1"))["id"] == first["id"]
+        assert (await jobs.submit("convert-3d", floorplan_id="fp-1", dedupe=False))["id"] != first["id"]
+        assert (await jobs.submit("convert-3d", floorplan_id="fp-2"))["id"] != first["id"]
+        with pytest.raises(ValueError):
+            await jobs.submit("render")
+
+    asyncio.run(run())
+
+
+def test_expired_leases_are_reclaimed_until_attempts_run_out(jobs):
+    failures = []
+
+    async def handler(ctx):
+        return {}
+
+    async def on_failure(ctx, error):
+        failures.append((ctx.floorplan_id, str(error)))
+
+    jobs.register("convert-3d", handler, on_failure)
+
+    async def run():
+        job = await jobs.submit("convert-3d", floorplan_id="fp-1")
+        assert (await jobs._claim())["id"] == job["id"]
+        # Lease still held: nobody else may take it
+        assert await jobs._claim() is None
+        doc = await stored(jobs, job["id"])
+        assert (doc["status"], doc["attempts"]) == ("running", 1) and doc["lease_expires_at"] is not None
+
+        await expire_leases(jobs)
+        assert (await jobs._claim())["id"] == job["id"]
+        assert (await stored(jobs, job["id"]))["attempts"] == 2
+
+        # The worker died on the last attempt too: failed, not claimed a third time
+        await expire_leases(jobs)
+        assert await jobs._claim() is None
+        await jobs._fail_exhausted()
+        await jobs._fail_exhausted()
+        doc = await stored(jobs, job["id"])
+        assert (doc["status"], doc["attempts"], doc["lease_expires_at"]) == ("failed", 2, None)
+        assert doc["error"] == "Worker stopped during each of 2 attempts"
+
+    asyncio.run(run())
+    assert failures == [("fp-1", "Worker stopped during each of 2 attempts")]
+
+
+def test_run_records_result_or_error(jobs):
+    failures = []
+
+    async def convert(ctx):
+        await ctx.progress(50, "halfway")
+        if ctx.params.get("broken"):
+            raise ValueError("unreadable plan")
+        return {"rooms": 3}
+
+    async def on_failure(ctx, error):
+        failures.append(str(error))
+
+    jobs.register("convert-3d", convert, on_failure)
+
+    async def run():
+        good = await jobs.submit("convert-3d", floorplan_id="fp-1")
+        bad = await jobs.submit("convert-3d", {"broken": True}, floorplan_id="fp-2")
+        for _ in range(2):
+            await jobs._run(await jobs._claim())
+        return await jobs.get(good["id"]), await jobs.get(bad["id"])
+
+    good, bad = asyncio.run(run())
+    assert (good["status"], good["progress"], good["result"], good["message"]) == ("completed", 100, {"rooms": 3}, "halfway")
+    assert (bad["status"], bad["error"], bad["result"]) == ("failed", "unreadable plan", None)
+    assert "lease_expires_at" not in good
+    assert failures == ["unreadable plan"]
+
+
+def test_claims_only_registered_kinds_oldest_first(jobs):
+
+    async def handler(ctx):
+        return {}
+
+    jobs.register("convert-3d", handler)
+
+    async def run():
+        now = _now()
+        await jobs.collection.insert_many([
+            {"id": "render", "kind": "render", "status": "queued", "created_at": now - timedelta(minutes=3)},
+            {"id": "newer", "kind": "convert-3d", "status": "queued", "created_at": now - timedelta(minutes=1)},
+            # Queued before attempts were tracked
+            {"id": "legacy", "kind": "convert-3d", "status": "queued", "created_at": now - timedelta(minutes=2)},
+        ])
+        return [(await jobs._claim())["id"], (await jobs._claim())["id"], await jobs._claim()]
+
+    assert asyncio.run(run()) == ["legacy", "newer", None]
@@ -0,0 +1,100 @@
+"""RFC 6902 JSON Patch, checked against the examples in the RFC's appendix, and
+round trips of patches generated by the editor's jsonPatch.js (run under node,
+skipped when node is not installed).
+"""
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from services.json_patch import JsonPatchError, apply_patch, parse_pointer
+
+JSON_PATCH_JS = Path(__file__).resolve().parent.parent / "frontend" / "src" / "utils" / "jsonPatch.js"
+
+RFC_EXAMPLES = [
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz", "value": "qux"}], {"baz": "qux", "foo": "bar"}),
+    ({"foo": ["bar", "baz"]}, [{"op": "add", "path": "/foo/1", "value": "qux"}], {"foo": ["bar", "qux", "baz"]}),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "remove", "path": "/baz"}], {"foo": "bar"}),
+    ({"foo": ["bar", "qux", "baz"]}, [{"op": "remove", "path": "/foo/1"}], {"foo": ["bar", "baz"]}),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "replace", "path": "/baz", "value": "boo"}], {"baz": "boo", "foo": "bar"}),
+    (
+        {"foo": {"bar": "baz", "waldo": "fred"}, "qux": {"corge": "grault"}},
+        [{"op": "move", "from": "/foo/waldo", "path": "/qux/thud"}],
+        {"foo": {"bar": "baz"}, "qux": {"corge": "grault", "thud": "fred"}},
+    ),
+    (
+        {"foo": ["all", "grass", "cows", "eat"]},
+        [{"op": "move", "from": "/foo/1", "path": "/foo/3"}],
+        {"foo": ["all", "cows", "eat", "grass"]},
+    ),
+    ({"foo": "bar"}, [{"op": "add", "path": "/child", "value": {"grandchild": {}}}], {"foo": "bar", "child": {"grandchild": {}}}),
+    ({"foo": ["bar"]}, [{"op": "add", "path": "/foo/-", "value": ["abc", "def"]}], {"foo": ["bar", ["abc", "def"]]}),
+    ({"/": 9, "~1": 10}, [{"op": "test", "path": "/~01", "value": 10}], {"/": 9, "~1": 10}),
+    ({"foo": 1}, [{"op": "copy", "from": "/foo", "path": "/bar"}], {"foo": 1, "bar": 1}),
+]
+
+RFC_ERRORS = [
+    ({"baz": "qux"}, [{"op": "test", "path": "/baz", "value": "bar"}]),
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz/bat", "value": "qux"}]),
+    ({"/": 9, "~1": 10}, [{"op": "test", "path": "/~01", "value": "10"}]),
+    ({"foo": ["bar"]}, [{"op": "add", "path": "/foo/2", "value": 1}]),
+    ({"foo": ["bar"]}, [{"op": "remove", "path": "/foo/01"}]),
+    ({"foo": 1}, [{"op": "replace", "path": "/bar", "value": 2}]),
+    ({"foo": {"bar": 1}}, [{"op": "move", "from": "/foo", "path": "/foo/bar/baz"}]),
+    ({"foo": 1}, [{"op": "test", "path": "/foo", "value": True}]),
+    ({"foo": 1}, [{"op": "add", "path": "/bar"}]),
+    ({"foo": 1}, [{"op": "frobnicate", "path": "/foo"}]),
+    ({"foo": 1}, {"op": "remove", "path": "/foo"}),
+]
+
+
+@pytest.mark.parametrize("document,patch,expected", RFC_EXAMPLES)
+def test_rfc_examples(document, patch, expected):
+    assert apply_patch(document, patch) == expected
+
+
+@pytest.mark.parametrize("document,patch", RFC_ERRORS)
+def test_rfc_errors(document, patch):
+    with pytest.raises(JsonPatchError):
+        apply_patch(document, patch)
+
+
+def test_patch_is_all_or_nothing():
+    document = {"walls": [{"end": [4, 0]}]}
+    patch = [{"op": "replace", "path": "/walls/0/end", "value": [5, 0]}, {"op": "remove", "path": "/doors/0"}]
+    with pytest.raises(JsonPatchError, match="Operation 1"):
+        apply_patch(document, patch)
+    assert document == {"walls": [{"end": [4, 0]}]}
+
+
+def test_root_operations():
+    assert apply_patch({"a": 1}, [{"op": "replace", "path": "", "value": [1]}]) == [1]
+    assert apply_patch(None, [{"op": "add", "path": "", "value": {"walls": []}}]) == {"walls": []}
+    assert apply_patch({"a": 1}, [{"op": "test", "path": "", "value": {"a": 1.0}}]) == {"a": 1}
+
+
+def test_parse_pointer():
+    assert parse_pointer("/a~1b/m~0n/0") == ["a/b", "m~n", "0"]
+    assert parse_pointer("") == []
+    with pytest.raises(JsonPatchError):
+        parse_pointer("a/b")
+
+
+EDITS = [
+    (None, {"walls": []}),
+    ({"walls": [{"start": [0, 0], "end": [4, 0]}]}, {"walls": [{"start": [0, 0], "end": [5, 0]}, {"start": [5, 0], "end": [5, 4]}]}),
+    ({"walls": [1, 2, 3], "rooms": [{"id": "a"}]}, {"walls": [1], "rooms": [{"id": "a", "color": "#fff"}]}),
+    ({"a/b": {"m~n": 1}, "gone": True}, {"a/b": {"m~n": [1]}}),
+    ({"doors": [{"width": 0.9}]}, {"doors": "none"}),
+]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node not installed")
+def test_editor_patches_round_trip():
+    source = JSON_PATCH_JS.read_text().replace("export const", "const")
+    script = source + f"\nprocess.stdout.write(JSON.stringify({json.dumps(EDITS)}.map(([a, b]) => createPatch(a, b))));\n"
+    result = subprocess.run(["node", "-"], input=script, capture_output=True, text=True, check=True, timeout=60)
+    for (before, after), patch in zip(EDITS, json.loads(result.stdout)):
+        assert apply_patch(before, patch) == after
@@ -0,0 +1,194 @@
+"""LLM gateway: token bucket, retries and their classification, unconfigured
+providers, and stream delta parsing, against fake provider clients.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("openai")
+
+from services import llm_gateway
+from services.llm_gateway import LLMGateway, ProviderLimits, ProviderStats, TokenBucket, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class RateLimitError(Exception):
+    pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records asyncio.sleep calls made by the gateway instead of sleeping."""
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(llm_gateway.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(llm_gateway.random, "uniform", lambda low, high: high)
+    return recorded
+
+
+def gateway(**limits):
+    return LLMGateway({"openai": ProviderLimits(**{"max_concurrency": 2, "timeout": 5.0, **limits})})
+
+
+def test_token_bucket_reserves_and_sleeps_outside_the_lock(monkeypatch):
+    bucket = TokenBucket(tokens_per_minute=60)  # one token per second
+    monkeypatch.setattr(llm_gateway.time, "monotonic", lambda: bucket.updated)
+    waits = []
+
+    async def fake_sleep(delay):
+        assert not bucket._lock.locked()
+        waits.append(delay)
+
+    monkeypatch.setattr(llm_gateway.asyncio, "sleep", fake_sleep)
+
+    async def run():
+        await bucket.acquire(60)
+        await asyncio.gather(bucket.acquire(30), bucket.acquire(30))
+        # Larger than the whole bucket: capped, so it waits one full refill
+        await bucket.acquire(1000)
+
+    asyncio.run(run())
+    assert waits == [pytest.approx(30), pytest.approx(60), pytest.approx(120)]
+
+
+@pytest.mark.parametrize("error,retryable", [
+    (asyncio.TimeoutError(), True),
+    (httpx.ConnectError("refused"), True),
+    (StatusError(429), True),
+    (StatusError(529), True),
+    (StatusError(400), False),
+    (SimpleNamespace(response=SimpleNamespace(status_code=503)), True),
+    (RateLimitError(), True),
+    (ValueError("bad request"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_call_retries_without_holding_a_slot(monkeypatch):
+    llm = gateway(max_retries=3)
+    semaphore = llm._semaphores["openai"]
+    outcomes = [StatusError(503), asyncio.TimeoutError(), "ok"]
+    backoffs = []
+
+    async def make_request():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=3, completion_tokens=4))
+
+    async def fake_sleep(delay):
+        backoffs.append((delay, semaphore._value))
+
+    monkeypatch.setattr(llm_gateway.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(llm_gateway.random, "uniform", lambda low, high: high)
+    asyncio.run(llm.call("openai", make_request))
+    # Both slots free during each backoff
+    assert backoffs == [(1.0, 2), (2.0, 2)]
+    stats = llm.stats()["openai"]
+    assert (stats["calls"], stats["errors"], stats["retries"], stats["timeouts"]) == (3, 2, 2, 1)
+    assert (stats["prompt_tokens"], stats["completion_tokens"]) == (3, 4)
+
+
+@pytest.mark.parametrize("errors,expected_calls", [
+    ([StatusError(400)], 1),
+    ([StatusError(503)] * 3, 3),
+])
+def test_call_gives_up(sleeps, errors, expected_calls):
+    llm = gateway(max_retries=2)
+    calls = []
+
+    async def make_request():
+        calls.append(1)
+        raise errors[min(len(calls), len(errors)) - 1]
+
+    with pytest.raises(StatusError):
+        asyncio.run(llm.call("openai", make_request))
+    assert len(calls) == expected_calls
+    assert llm._semaphores["openai"]._value == 2
+
+
+def test_unconfigured_provider_fails_fast():
+    llm = LLMGateway()
+    with pytest.raises(RuntimeError, match="not configured"):
+        llm.client("anthropic")
+    with pytest.raises(RuntimeError, match="not configured"):
+        asyncio.run(llm.complete_chat("gemini", "gemini-x", "system", [{"role": "user", "content": "hi"}]))
+    assert llm.stats()["gemini"]["calls"] == 0
+
+
+def chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None or not usage else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def test_stream_delta_openai():
+    stats = ProviderStats()
+    events = [chunk("Ci"), chunk(""), chunk("ao"), chunk(usage=SimpleNamespace(prompt_tokens=5, completion_tokens=2))]
+    assert [LLMGateway._stream_delta("openai", event, stats) for event in events] == ["Ci", "", "ao", None]
+    assert (stats.prompt_tokens, stats.completion_tokens) == (5, 2)
+
+
+def test_stream_delta_anthropic():
+    stats = ProviderStats()
+    events = [
+        SimpleNamespace(type="message_start", message=SimpleNamespace(usage=SimpleNamespace(input_tokens=7))),
+        SimpleNamespace(type="content_block_start"),
+        SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(text="Ciao")),
+        SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(partial_json="{}")),
+        SimpleNamespace(type="message_delta", usage=SimpleNamespace(output_tokens=3)),
+    ]
+    assert [LLMGateway._stream_delta("anthropic", event, stats) for event in events] == [None, None, "Ciao", None, None]
+    assert (stats.prompt_tokens, stats.completion_tokens) == (7, 3)
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self.events:
+            yield event
+
+    async def close(self):
+        self.closed = True
+
+
+def test_stream_chat_retries_opening_and_releases_the_slot(sleeps):
+    llm = gateway(max_retries=2)
+    stream = FakeStream([chunk("Ci"), chunk("ao"), chunk(usage=SimpleNamespace(prompt_tokens=1, completion_tokens=2))])
+    opened = []
+
+    async def create(**kwargs):
+        opened.append(kwargs)
+        if len(opened) == 1:
+            raise httpx.ConnectError("reset")
+        return stream
+
+    llm._clients["openai"] = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def run():
+        return [delta async for delta in llm.stream_chat("openai", "gpt-x", "system", [{"role": "user", "content": "hi"}])]
+
+    assert asyncio.run(run()) == ["Ci", "ao"]
+    assert len(opened) == 2 and opened[0]["stream"] is True
+    assert opened[0]["messages"][0] == {"role": "system", "content": "system"}
+    assert stream.closed
+    assert llm._semaphores["openai"]._value == 2
+    assert llm.stats()["openai"]["in_flight"] == 0
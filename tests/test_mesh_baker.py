@@ -0,0 +1,109 @@
+"""Mesh baking: GLB layout, outward-facing triangles and cut openings."""
+import os
+import json
+import time
+import struct
+import asyncio
+
+import numpy as np
+
+from services.mesh_baker import MeshBaker, encode_glb, mesh_hash, scene_meshes, triangulate
+
+
+def room_scene(**extra):
+    corners = [(0, 0), (5, 0), (5, 4), (0, 4)]
+    walls = [
+        {"start": list(corners[i]), "end": list(corners[(i + 1) % 4]), "height": 2.8, "thickness": 0.2}
+        for i in range(4)
+    ]
+    return dict({"walls": walls, "doors": [], "windows": [], "rooms": []}, **extra)
+
+
+def read_glb(data: bytes):
+    magic, version, length = struct.unpack("<III", data[:12])
+    assert (magic, version, length) == (0x46546C67, 2, len(data))
+    json_length, json_type = struct.unpack("<II", data[12:20])
+    assert json_type == 0x4E4F534A
+    gltf = json.loads(data[20:20 + json_length])
+    bin_length, bin_type = struct.unpack("<II", data[20 + json_length:28 + json_length])
+    assert bin_type == 0x004E4942 and bin_length == gltf["buffers"][0]["byteLength"]
+    return gltf
+
+
+def test_triangles_face_outwards():
+    scene = room_scene(windows=[{"position": [5, 2], "width": 1.2, "height": 1.5}])
+    for (kind, _), (positions, normals, indices) in scene_meshes(scene).items():
+        triangles = positions[indices.reshape(-1, 3)]
+        face_normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        assert (np.einsum('ij,ij->i', face_normals, normals[indices.reshape(-1, 3)[:, 0]]) > 0).all(), kind
+
+
+def test_materials_are_merged_and_floor_is_found():
+    meshes = scene_meshes(room_scene())
+    assert set(meshes) == {("wall", "#cbd5e1"), ("floor", "#e5e7eb")}
+    positions, _, indices = meshes[("floor", "#e5e7eb")]
+    assert len(indices) == 6 and (positions[:, 1] == 0).all()
+
+
+def test_openings_are_cut():
+    solid = scene_meshes(room_scene())
+    cut = scene_meshes(room_scene(doors=[{"position": [2.5, 0], "width": 0.9, "height": 2.1}]))
+    # The door splits one wall box into left, right and lintel
+    assert len(cut[("wall", "#cbd5e1")][2]) == len(solid[("wall", "#cbd5e1")][2]) + 2 * 36
+
+
+def test_glb_is_well_formed():
+    gltf = read_glb(encode_glb(scene_meshes(room_scene())))
+    assert len(gltf["meshes"][0]["primitives"]) == 2
+    for primitive in gltf["meshes"][0]["primitives"]:
+        position = gltf["accessors"][primitive["attributes"]["POSITION"]]
+        assert position["count"] > 0 and len(position["min"]) == 3
+    views = gltf["bufferViews"]
+    assert all(view["byteOffset"] % 4 == 0 for view in views)
+
+
+def test_empty_scene_still_encodes():
+    data = encode_glb(scene_meshes({}))
+    magic, _, length = struct.unpack("<III", data[:12])
+    assert magic == 0x46546C67 and length == len(data)
+
+
+def test_hash_follows_geometry_and_style():
+    scene = room_scene()
+    recolored = room_scene()
+    recolored["walls"][0]["color"] = "#ff0000"
+    moved = room_scene()
+    moved["walls"][0]["end"] = [6, 0]
+    assert mesh_hash(scene) == mesh_hash(room_scene())
+    assert len({mesh_hash(scene), mesh_hash(recolored), mesh_hash(moved)}) == 3
+
+
+def test_triangulate_concave_polygon():
+    l_shape = np.array([(0, 0), (4, 0), (4, 2), (2, 2), (2, 4), (0, 4)], dtype=float)
+    triangles = triangulate(l_shape)
+
+    def area(a, b, c):
+        (x1, y1), (x2, y2) = l_shape[b] - l_shape[a], l_shape[c] - l_shape[a]
+        return abs(x1 * y2 - y1 * x2) / 2
+
+    assert len(triangles) == 4 and sum(area(*triangle) for triangle in triangles) == 12
+
+
+def test_eviction_skips_pinned_meshes_and_open_handles_survive(tmp_path, monkeypatch):
+    monkeypatch.setenv("MESH_CACHE_DIR", str(tmp_path))
+    baker = MeshBaker(cache_bytes=0)
+    for age, key in enumerate(["new", "old"]):
+        (tmp_path / f"{key}.glb").write_bytes(b"glb-" + key.encode())
+        os.utime(tmp_path / f"{key}.glb", (time.time() - 100 * age,) * 2)
+
+    baker._pin(baker.path("old"), 1)
+    baker.evict()
+    assert sorted(os.listdir(tmp_path)) == ["old.glb"]
+    baker._pin(baker.path("old"), -1)
+
+    handle = asyncio.run(baker.open_glb("old", room_scene()))
+    assert baker._pins == {}
+    baker.evict()
+    assert os.listdir(tmp_path) == []
+    with handle:
+        assert handle.read() == b"glb-old"
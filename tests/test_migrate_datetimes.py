@@ -0,0 +1,54 @@
+"""Datetime migration: ISO strings become UTC dates, in batches, leaving bad values alone."""
+import sys
+import asyncio
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+pytest.importorskip("dotenv")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend" / "scripts"))
+from migrate_datetimes import migrate, parse_iso  # noqa: E402
+
+
+@pytest.mark.parametrize("value,expected", [
+    ("2025-01-02T03:04:05", datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ("2025-01-02T03:04:05Z", datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ("2025-01-02T03:04:05.123456+00:00", datetime(2025, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc)),
+    ("2025-01-02T05:04:05+02:00", datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+])
+def test_parse_iso(value, expected):
+    parsed = parse_iso(value)
+    assert parsed == expected and parsed.utcoffset() == timedelta(0)
+
+
+def test_parse_iso_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_iso("yesterday")
+
+
+def test_migrate_converts_strings_in_batches():
+    db = mongomock_motor.AsyncMongoMockClient()["test_migrate_datetimes"]
+    native = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+    async def run():
+        await db.messages.insert_many(
+            [{"id": f"m{n}", "timestamp": f"2025-01-0{n + 1}T10:00:00"} for n in range(5)]
+            + [{"id": "bad", "timestamp": "not a date"}, {"id": "native", "timestamp": native}]
+        )
+        dry = await migrate(db, batch_size=2, dry_run=True)
+        assert await db.messages.count_documents({"timestamp": {"$type": "string"}}) == 6
+        report = await migrate(db, batch_size=2)
+        again = await migrate(db, batch_size=2)
+        docs = {doc["id"]: doc["timestamp"] async for doc in db.messages.find({}, {"_id": 0})}
+        return dry, report, again, docs
+
+    dry, report, again, docs = asyncio.run(run())
+    assert dry["messages.timestamp"] == report["messages.timestamp"] == {"converted": 5, "invalid": 1}
+    assert again["messages.timestamp"] == {"converted": 0, "invalid": 1}
+    assert report["floorplans.created_at"] == {"converted": 0, "invalid": 0}
+    assert docs["bad"] == "not a date"
+    assert docs["m0"].replace(tzinfo=timezone.utc) == datetime(2025, 1, 1, 10, tzinfo=timezone.utc)
+    assert docs["native"].replace(tzinfo=timezone.utc) == native
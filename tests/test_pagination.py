@@ -0,0 +1,59 @@
+"""Keyset pagination: cursor encoding and paging through ties."""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from services.pagination import InvalidCursor, decode_cursor, encode_cursor, fetch_page, keyset_query, wants_ndjson
+
+
+def test_cursor_round_trip():
+    created = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = encode_cursor({"id": "fp-1", "created_at": created, "name": "ignored"}, "created_at")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created, "fp-1")
+    assert decode_cursor(encode_cursor({"id": "m-2", "timestamp": None}, "timestamp")) == (None, "m-2")
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bm90IGpzb24", "eyJ2IjoxfQ"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_keyset_query():
+    query = {"user_id": "u1"}
+    assert keyset_query(query, "created_at", -1) is query
+    after = encode_cursor({"id": "fp-5", "created_at": 10}, "created_at")
+    assert keyset_query(query, "created_at", -1, after) == {"$and": [query, {"$or": [
+        {"created_at": {"$lt": 10}},
+        {"created_at": 10, "id": {"$lt": "fp-5"}},
+    ]}]}
+    assert keyset_query(query, "created_at", 1, after)["$and"][1]["$or"][0] == {"created_at": {"$gt": 10}}
+
+
+def test_fetch_page_walks_ties_without_gaps():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    collection = mongomock_motor.AsyncMongoMockClient()["test_pagination"]["floorplans"]
+    # Several documents share each sort value, so the id tiebreak decides page boundaries
+    docs = [{"id": f"fp-{n:02d}", "user_id": "u1", "created_at": n // 3} for n in range(10)]
+
+    async def walk(direction):
+        await collection.delete_many({})
+        await collection.insert_many([dict(doc) for doc in docs])
+        seen, after = [], None
+        while True:
+            page, after = await fetch_page(collection, {"user_id": "u1"}, "created_at", direction, after, limit=4)
+            seen.append([doc["id"] for doc in page])
+            if after is None:
+                return seen
+
+    ids = [doc["id"] for doc in docs]
+    assert asyncio.run(walk(1)) == [ids[0:4], ids[4:8], ids[8:10]]
+    assert asyncio.run(walk(-1)) == [ids[::-1][0:4], ids[::-1][4:8], ids[::-1][8:10]]
+
+
+def test_wants_ndjson():
+    assert wants_ndjson(format="ndjson")
+    assert wants_ndjson(accept="application/x-ndjson, application/json")
+    assert not wants_ndjson(accept="application/json")
@@ -0,0 +1,104 @@
+"""PDF rasterizing: merged page scenes, the raster cache and its eviction pins."""
+import os
+import time
+import shutil
+import asyncio
+
+import pytest
+from PIL import Image
+
+from services import pdf_raster
+from services.pdf_raster import PdfRasterizer, merge_page_results
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "rasters"
+    monkeypatch.setenv("PDF_RASTER_CACHE_DIR", str(path))
+    return path
+
+
+def test_merge_page_results_lays_pages_out_side_by_side():
+    page1 = {
+        "rooms": [{"id": "r1", "name": "Cucina", "width": 4}],
+        "walls": [{"start": [0, 0], "end": [5, 0]}],
+        "doors": [{"position": [2, 0]}],
+    }
+    page2 = {
+        "rooms": [{"id": "r1", "name": "Bagno", "width": 2}],
+        "walls": [{"start": [0, 0], "end": [3, 0], "height": 2.7}, {"start": None, "end": "bad"}],
+        "windows": [{"position": [1, 0]}],
+    }
+    merged = merge_page_results([(1, page1), (2, page2)], gap=1.0)
+    assert merged["pages"] == 2
+    assert [(room["id"], room["page"]) for room in merged["rooms"]] == [("p1_r1", 1), ("p2_r1", 2)]
+    # Page 2 starts one meter past the furthest point of page 1
+    assert merged["walls"][1] == {"start": [6.0, 0], "end": [9.0, 0], "height": 2.7, "page": 2}
+    assert merged["walls"][2]["start"] is None and merged["walls"][2]["end"] == "bad"
+    assert merged["doors"] == [{"position": [2, 0], "page": 1}]
+    assert merged["windows"] == [{"position": [7.0, 0], "page": 2}]
+    assert page1["rooms"][0]["id"] == "r1"
+
+
+def fill_cache(cache_dir, ages):
+    cache_dir.mkdir(exist_ok=True)
+    for name, age in ages.items():
+        entry = cache_dir / f"{name}_150"
+        entry.mkdir()
+        (entry / "pages.json").write_text("[]" + "x" * 20)
+        os.utime(entry, (time.time() - age,) * 2)
+
+
+def test_evict_keeps_pinned_and_leased_entries(cache_dir, monkeypatch):
+    fill_cache(cache_dir, {"old": 300, "older": 400, "pinned": 500, "recent": 10})
+    rasterizer = PdfRasterizer(cache_bytes=30, lease_seconds=60)
+
+    async def fake_pages(file_url, content_hash):
+        return []
+
+    monkeypatch.setattr(rasterizer, "pages", fake_pages)
+
+    async def run():
+        async with rasterizer.open_pages("https://files.test/plan.pdf", "pinned"):
+            rasterizer.evict()
+            assert sorted(os.listdir(cache_dir)) == ["pinned_150", "recent_150"]
+        assert rasterizer._pins == {}
+        rasterizer.evict()
+
+    asyncio.run(run())
+    assert os.listdir(cache_dir) == ["recent_150"]
+
+
+def test_pages_rasterizes_once_and_caches(tmp_path, cache_dir, monkeypatch):
+    if not PdfRasterizer().available:
+        pytest.skip("pypdfium2 is not installed")
+    source = tmp_path / "plan.pdf"
+    Image.new("L", (400, 300), 255).save(source, "PDF", resolution=72, save_all=True,
+                                         append_images=[Image.new("L", (300, 400), 0)])
+    downloads = []
+
+    async def fake_download(url):
+        downloads.append(url)
+        path = str(tmp_path / f"download-{len(downloads)}.pdf")
+        shutil.copyfile(source, path)
+        return path
+
+    async def inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_raster, "spool_download", fake_download)
+    monkeypatch.setattr(pdf_raster, "run_in_process", inline)
+    rasterizer = PdfRasterizer(dpi=144)
+
+    async def run():
+        first = await asyncio.gather(*[rasterizer.pages("https://files.test/plan.pdf", "abc") for _ in range(3)])
+        again = await rasterizer.pages("https://files.test/plan.pdf", "abc")
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert len(downloads) == 1
+    assert first[0] == first[1] == first[2] == again
+    assert [(page["page"], page["width"], page["height"]) for page in again] == [(1, 800, 600), (2, 600, 800)]
+    assert all(os.path.exists(page["path"]) for page in again)
+    assert os.listdir(cache_dir) == ["abc_144"]
+    assert not os.path.exists(tmp_path / "download-1.pdf")
@@ -0,0 +1,75 @@
+"""User preferences: created with defaults in one upsert, patched in place, and
+recovering from a lost insert race.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("mongomock_motor")
+httpx = pytest.importorskip("httpx")
+
+from pymongo.errors import DuplicateKeyError
+
+
+def request(server, method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+
+def stored(server, user_id):
+    async def find():
+        return await server.db.user_preferences.find({"user_id": user_id}, {"_id": 0}).to_list(None)
+    return asyncio.run(find())
+
+
+def test_get_creates_defaults_once(server):
+    first = request(server, "GET", "/api/preferences/u1")
+    assert first.status_code == 200
+    assert (first.json()["preferred_model"], first.json()["default_wall_height"]) == ("gpt-5", 2.8)
+    again = request(server, "GET", "/api/preferences/u1", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert len(stored(server, "u1")) == 1
+
+
+def test_patch_upserts_and_keeps_other_fields(server):
+    created = request(server, "PATCH", "/api/preferences/u2", json={"render_quality": "draft"})
+    assert created.status_code == 200
+    assert (created.json()["render_quality"], created.json()["preferred_model"]) == ("draft", "gpt-5")
+    updated = request(server, "PATCH", "/api/preferences/u2", json={"preferred_model": "claude-x"})
+    assert (updated.json()["render_quality"], updated.json()["preferred_model"]) == ("draft", "claude-x")
+    assert updated.json()["id"] == created.json()["id"]
+    assert len(stored(server, "u2")) == 1
+
+
+def test_lost_insert_race_is_retried_as_an_update(server, monkeypatch):
+    # Motor hands out a new collection object per attribute access, so patch the class
+    collection_class = type(server.db.user_preferences)
+    real_upsert = collection_class.find_one_and_update
+    calls = []
+
+    async def racing_upsert(collection, *args, **kwargs):
+        calls.append(kwargs.get("upsert"))
+        if len(calls) == 1:
+            # Another request inserted the document between our match and our insert
+            await collection.insert_one(server.UserPreference(user_id="u3", render_quality="low").model_dump())
+            raise DuplicateKeyError("E11000 duplicate key error collection: user_preferences index: user_id_1")
+        return await real_upsert(collection, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "find_one_and_update", racing_upsert)
+    response = request(server, "PATCH", "/api/preferences/u3", json={"preferred_model": "claude-x"})
+    assert response.status_code == 200
+    assert (response.json()["render_quality"], response.json()["preferred_model"]) == ("low", "claude-x")
+    assert calls == [True, True]
+    assert len(stored(server, "u3")) == 1
+
+
+def test_second_duplicate_key_error_propagates(server, monkeypatch):
+    async def always_duplicate(collection, *args, **kwargs):
+        raise DuplicateKeyError("E11000 duplicate key error")
+
+    monkeypatch.setattr(type(server.db.user_preferences), "find_one_and_update", always_duplicate)
+    with pytest.raises(DuplicateKeyError):
+        asyncio.run(server.upsert_user_preferences("u4", {}))
@@ -0,0 +1,68 @@
+"""Software renderer: output images, tiers and cache keys."""
+import numpy as np
+import pytest
+from PIL import Image
+
+from services.renderer import RENDER_STYLES, rasterize, render_key, render_view
+
+
+def scene():
+    corners = [(0, 0), (6, 0), (6, 4), (0, 4)]
+    walls = [
+        {"start": list(corners[i]), "end": list(corners[(i + 1) % 4]), "height": 2.8, "thickness": 0.2}
+        for i in range(4)
+    ]
+    return {
+        "walls": walls,
+        "doors": [{"position": [3, 0], "width": 0.9, "height": 2.1}],
+        "windows": [{"position": [6, 2], "width": 1.2, "height": 1.2}],
+        "rooms": [{"id": "a", "width": 6, "depth": 4, "color": "#d2b48c"}],
+    }
+
+
+@pytest.mark.parametrize("style", RENDER_STYLES)
+@pytest.mark.parametrize("view", ["top", "isometric"])
+def test_render_view_writes_png(tmp_path, view, style):
+    path = tmp_path / f"{view}.png"
+    info = render_view(scene(), view, "low", style, str(path))
+    with Image.open(path) as image:
+        assert image.size == (info["width"], info["height"])
+        assert max(image.size) == 640
+        assert len(np.unique(np.asarray(image.convert('RGB')).reshape(-1, 3), axis=0)) > 2
+    assert info["triangles"] > 0
+
+
+def test_top_view_shows_door_gap(tmp_path):
+    path = tmp_path / "top.png"
+    info = render_view(scene(), "top", "low", "stylized", str(path))
+    pixels = np.asarray(Image.open(path).convert('RGB')).astype(int)
+    # Walls span -0.1..6.1 m; the door is at x=3 in the wall along y=0, which is cut at
+    # plan height, so the floor shows through the door and not beside it
+    pad = round(640 * 0.05)
+    scale = (info["width"] - 2 * pad) / 6.2
+    row = int(pad + (0.1 + 0.05) * scale)
+    door, wall = int(pad + 3.1 * scale), int(pad + 1.1 * scale)
+    assert pixels[row, door].tolist() == [0xd2, 0xb4, 0x8c]
+    assert pixels[row, wall].tolist() != [0xd2, 0xb4, 0x8c]
+
+
+def test_empty_scene(tmp_path):
+    info = render_view({}, "isometric", "low", "realistic", str(tmp_path / "empty.png"))
+    assert info["triangles"] == 0
+
+
+def test_rasterize_depth_test():
+    depth = np.full((10, 10), -np.inf, dtype=np.float32)
+    ids = np.full((10, 10), -1, dtype=np.int32)
+    far = [[0, 0, 1.0], [10, 0, 1.0], [0, 10, 1.0]]
+    near = [[0, 0, 2.0], [10, 0, 2.0], [0, 10, 2.0]]
+    rasterize(np.array([near, far]), depth, ids)
+    assert ids[1, 1] == 0 and ids[9, 9] == -1
+
+
+def test_render_key():
+    assert render_key(scene(), "realistic", "low") == render_key(scene(), "realistic", "low")
+    assert render_key(scene(), "realistic", "low") != render_key(scene(), "realistic", "high")
+    recolored = scene()
+    recolored["walls"][0]["color"] = "#000000"
+    assert render_key(scene(), "realistic", "low") != render_key(recolored, "realistic", "low")
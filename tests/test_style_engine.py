@@ -0,0 +1,31 @@
+"""Style engine: palettes are applied locally and restyles keep the geometry hash."""
+import copy
+
+from services.style_engine import STYLE_PALETTES, apply_palette, geometry_hash
+
+
+def scene():
+    return {
+        "walls": [{"start": [0, 0], "end": [5, 0], "height": 2.8, "color": "#ffffff"}],
+        "rooms": [{"type": "kitchen", "points": [[0, 0], [5, 0], [5, 4]], "color": "#eeeeee"}],
+        "furniture": [{"type": "sofa", "position": [1, 1], "color": "#333333"}],
+    }
+
+
+def test_restyled_scene_keeps_geometry_hash():
+    original = scene()
+    styled = apply_palette(original, STYLE_PALETTES["industrial"])
+    assert styled["walls"][0]["color"] == "#7d7d7d"
+    assert styled["rooms"][0]["color"] == "#5a5a5a"
+    assert original["walls"][0]["color"] == "#ffffff"
+    assert geometry_hash(styled) == geometry_hash(original)
+
+
+def test_geometry_hash_keeps_colors_the_palette_does_not_set():
+    recolored = scene()
+    recolored["furniture"][0]["color"] = "#ff0000"
+    assert geometry_hash(recolored) != geometry_hash(scene())
+
+    moved = copy.deepcopy(scene())
+    moved["walls"][0]["end"] = [6, 0]
+    assert geometry_hash(moved) != geometry_hash(scene())
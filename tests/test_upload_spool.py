@@ -0,0 +1,95 @@
+"""Upload spooling: type sniffing, size limits, hashes and downloads."""
+import os
+import asyncio
+import hashlib
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from services.upload_spool import UploadTooLarge, sniff_type, spool_download, spool_upload
+
+
+@pytest.fixture(autouse=True)
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(tmp_path / "spool"))
+    return tmp_path / "spool"
+
+
+class FakeUpload:
+    """The part of FastAPI's UploadFile that spool_upload reads."""
+
+    def __init__(self, data: bytes, filename="plan.bin", content_type=None):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+        self.reads = []
+
+    async def read(self, size):
+        self.reads.append(size)
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+@pytest.mark.parametrize("head,fallback,expected", [
+    (b"%PDF-1.7\n", None, ("pdf", "application/pdf")),
+    (b"\x89PNG\r\n\x1a\n\x00", "application/pdf", ("image", "image/png")),
+    (b"\xff\xd8\xff\xe0", None, ("image", "image/jpeg")),
+    (b"GIF89a", None, ("image", "image/gif")),
+    (b"II*\x00", None, ("image", "image/tiff")),
+    (b"RIFF\x10\x00\x00\x00WEBPVP8 ", None, ("image", "image/webp")),
+    (b"PK\x03\x04", None, ("zip", "application/zip")),
+    (b"<svg", "image/svg+xml", ("image", "image/svg+xml")),
+    (b"hello", "text/plain", ("unknown", "text/plain")),
+    (b"", None, ("unknown", "application/octet-stream")),
+])
+def test_sniff_type(head, fallback, expected):
+    assert sniff_type(head, fallback=fallback) == expected
+
+
+def test_spool_upload_streams_in_chunks(spool):
+    data = b"%PDF-1.4\n" + os.urandom(10_000)
+    upload = FakeUpload(data, filename="plan.pdf", content_type="application/octet-stream")
+    spooled = asyncio.run(spool_upload(upload, chunk_size=4096))
+    assert set(upload.reads) == {4096}
+    assert (spooled.size, spooled.sha256) == (len(data), hashlib.sha256(data).hexdigest())
+    assert (spooled.file_type, spooled.content_type) == ("pdf", "application/pdf")
+    assert spooled.path.endswith(".pdf") and open(spooled.path, "rb").read() == data
+
+    copy = spooled.link_copy()
+    spooled.discard()
+    spooled.discard()
+    assert open(copy, "rb").read() == data
+    assert os.listdir(spool) == [os.path.basename(copy)]
+
+
+def test_spool_upload_over_limit_leaves_nothing(spool):
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(spool_upload(FakeUpload(b"x" * 10_000), chunk_size=4096, max_bytes=8192))
+    assert os.listdir(spool) == []
+
+
+def test_spool_download_uses_the_given_client(spool):
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        if request.url.path == "/big.png":
+            return httpx.Response(200, content=b"x" * 10_000)
+        if request.url.path == "/missing.png":
+            return httpx.Response(404)
+        return httpx.Response(200, content=b"%PDF-1.4 plan")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            path = await spool_download("https://files.test/plan.pdf?sig=abc", client=client)
+            with pytest.raises(UploadTooLarge):
+                await spool_download("https://files.test/big.png", chunk_size=1024, max_bytes=4096, client=client)
+            with pytest.raises(httpx.HTTPStatusError):
+                await spool_download("https://files.test/missing.png", client=client)
+            return path
+
+    path = asyncio.run(run())
+    assert path.endswith(".pdf") and open(path, "rb").read() == b"%PDF-1.4 plan"
+    assert os.listdir(spool) == [os.path.basename(path)]
+    assert len(requested) == 3